@@ -0,0 +1,141 @@
+"""Static asset manifest and serving
+
+`python build_assets.py` (see backend/) turns frontend/pages into frontend/dist:
+
+- one minified, content-hashed CSS bundle per page
+- every JS file content-hashed; ES modules are resolved through an import map,
+  so modules keep their relative imports and no bundler toolchain is needed
+- .gz (and .br when the brotli package is installed) next to every file
+- manifest.json mapping source paths to hashed URLs
+
+Templates ask this module for URLs (asset_url / page_css / import_map). When no
+build exists they get the plain /pages files, so development needs no build step.
+Built files are served by PrecompressedStaticFiles under /assets. Content-hashed
+files get immutable cache headers - a changed file gets a new name, so it never
+needs revalidating. Anything else there (manifest.json) is revalidated.
+"""
+import json
+import os
+import re
+from typing import Optional
+
+from markupsafe import Markup
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(BASE_DIR))
+PAGES_DIR = os.path.join(PROJECT_ROOT, "frontend", "pages")
+DIST_DIR = os.path.join(PROJECT_ROOT, "frontend", "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+# Stylesheets of each page, in cascade order
+PAGE_CSS = {
+    "home": ["main.css", "sidebar.css", "chat.css", "buttons.css", "modal.css", "servers.css", "voice.css"],
+    "login": ["login.css"],
+    "register": ["register.css"],
+}
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+# Files without a content hash in their name can change under the same URL
+REVALIDATE_CACHE = "no-cache"
+
+# Names written by build_assets.write_asset(): stem.<12 hex digits>.ext
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.[^./]+$")
+
+# Preferred first
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+_manifest: Optional[dict] = None
+
+
+def load_manifest() -> dict:
+    """Read the build manifest (empty when the assets were never built)"""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH, encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+    return _manifest
+
+
+def _dev_url(path: str) -> str:
+    """Source file URL with its mtime appended so edits are picked up"""
+    source = os.path.join(PAGES_DIR, path[len("/pages/"):])
+    try:
+        return f"{path}?v={int(os.path.getmtime(source))}"
+    except OSError:
+        return path
+
+
+def asset_url(path: str) -> str:
+    """URL for a source asset like /pages/login/js/login.js"""
+    return load_manifest().get("files", {}).get(path) or _dev_url(path)
+
+
+def page_css(page: str) -> list:
+    """Stylesheet URLs of a page - the bundle when built, else the source files"""
+    bundle = load_manifest().get("css", {}).get(page)
+    if bundle:
+        return [bundle]
+    return [_dev_url(f"/pages/{page}/css/{name}") for name in PAGE_CSS[page]]
+
+
+def import_map(page: str) -> Markup:
+    """<script type="importmap"> resolving a page's ES modules to their hashed files"""
+    imports = load_manifest().get("importmaps", {}).get(page)
+    if not imports:
+        return Markup("")
+    return Markup('<script type="importmap">{}</script>').format(Markup(json.dumps({"imports": imports})))
+
+
+def accepted_encodings(header: str) -> set:
+    """Encodings an Accept-Encoding header allows - q=0 refuses one, * covers the unlisted"""
+    qualities = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    wildcard = qualities.pop("*", 0.0)
+    return {
+        encoding for encoding, _ in ENCODINGS
+        if qualities.get(encoding, wildcard) > 0
+    }
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Serves foo.js.br / foo.js.gz when the client accepts them - hashed files are cached as immutable"""
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+
+        accepted = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accepted = value.decode("latin-1")
+        accepted = accepted_encodings(accepted)
+
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = self.lookup_path(path + suffix)
+            if stat_result is not None:
+                response = FileResponse(full_path, stat_result=stat_result, media_type=response.media_type)
+                response.headers["Content-Encoding"] = encoding
+                break
+
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE if HASHED_NAME.search(path) else REVALIDATE_CACHE
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
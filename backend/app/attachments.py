@@ -0,0 +1,233 @@
+"""Content-addressed attachment storage with streaming uploads
+
+POST /api/attachments takes a multipart body with up to MAX_UPLOAD_FILES files.
+The body is parsed as it arrives: each file's bytes are hashed and written to a
+temporary file in WRITE_BUFFER_SIZE pieces (on a worker thread, so hashing and
+disk writes for concurrent uploads run in parallel), and never held in memory
+as a whole. A finished file is renamed to its SHA-256:
+
+    attachments/ab/cd/abcd1234...
+
+so a file that is posted again is not stored again - the new copy is dropped and
+both messages point at the same file. Whether an upload was already stored is
+not reported: it would tell the uploader that someone else has sent that file. The hash is the attachment id the client
+sends with save_message() / save_channel_message(). Files never change once
+stored, which makes downloads cacheable forever; FileResponse serves Range
+requests for resumable downloads and media seeking.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import secrets
+from typing import List, Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from .database import register_attachments, clean_filename
+
+# Where files are stored (backend/attachments)
+ATTACHMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "attachments")
+
+# Largest file accepted (bytes)
+MAX_ATTACHMENT_SIZE = 25 * 1024 * 1024
+
+# Files accepted per upload request
+MAX_UPLOAD_FILES = 10
+
+# Bytes gathered before they are hashed and written on a worker thread
+WRITE_BUFFER_SIZE = 256 * 1024
+
+# Attachment ids are SHA-256 hex digests
+ATTACHMENT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+# Content types accepted from the client - anything else is stored as application/octet-stream
+CONTENT_TYPE = re.compile(r"^[\w.+-]+/[\w.+-]+$")
+
+
+class UploadError(Exception):
+    """Upload rejected - message and HTTP status for the client"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class _FilePart:
+    """A file being received"""
+    __slots__ = ("filename", "content_type", "temp_path", "file", "hasher", "size", "buffer")
+
+    def __init__(self, filename: str, content_type: str, temp_path: str):
+        self.filename = filename
+        self.content_type = content_type
+        self.temp_path = temp_path
+        self.file = None
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.buffer = bytearray()
+
+
+class AttachmentStore:
+    def __init__(self, root: str = ATTACHMENTS_DIR, max_size: int = MAX_ATTACHMENT_SIZE,
+                 max_files: int = MAX_UPLOAD_FILES):
+        self.root = root
+        self.temp_dir = os.path.join(root, "tmp")
+        self.max_size = max_size
+        self.max_files = max_files
+
+    def path(self, attachment_id: str) -> Optional[str]:
+        """Where a file is stored - None for anything that is not an attachment id"""
+        if not ATTACHMENT_ID.match(attachment_id):
+            return None
+        return os.path.join(self.root, attachment_id[:2], attachment_id[2:4], attachment_id)
+
+    # ---------- Disk (worker threads) ----------
+
+    def _open(self, part: _FilePart):
+        os.makedirs(self.temp_dir, exist_ok=True)
+        part.file = open(part.temp_path, "wb")
+
+    @staticmethod
+    def _write(part: _FilePart, data: bytearray):
+        # hashlib releases the GIL for large buffers
+        part.hasher.update(data)
+        part.file.write(data)
+
+    def _store(self, part: _FilePart, attachment_id: str):
+        """Move a finished upload to its content address - dropped if the file is already stored"""
+        part.file.close()
+        final_path = self.path(attachment_id)
+        if os.path.exists(final_path):
+            os.remove(part.temp_path)
+            return
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(part.temp_path, final_path)
+
+    def remove(self, attachment_ids: List[str]):
+        """Delete stored files (worker thread)"""
+        for attachment_id in attachment_ids:
+            path = self.path(attachment_id)
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _discard(parts: List[_FilePart]):
+        for part in parts:
+            if part.file is not None:
+                part.file.close()
+            if os.path.exists(part.temp_path):
+                os.remove(part.temp_path)
+
+    # ---------- Upload ----------
+
+    async def _flush(self, part: _FilePart):
+        if part.buffer:
+            await asyncio.to_thread(self._write, part, part.buffer)
+            part.buffer = bytearray()
+
+    async def receive(self, request: Request) -> List[dict]:
+        """Stream the files of a multipart request to disk - returns their attachment metadata"""
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise UploadError("Expected a multipart/form-data upload")
+
+        # Parser callbacks only queue events; they are handled (and awaited) after each chunk
+        events = []
+        header = {"field": b"", "value": b"", "disposition": b"", "type": b""}
+
+        def on_header_field(data, start, end):
+            header["field"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            header["value"] += data[start:end]
+
+        def on_header_end():
+            field = header["field"].lower()
+            if field == b"content-disposition":
+                header["disposition"] = header["value"]
+            elif field == b"content-type":
+                header["type"] = header["value"]
+            header["field"] = header["value"] = b""
+
+        def on_headers_finished():
+            events.append(("begin", header["disposition"], header["type"]))
+            header["disposition"] = header["type"] = b""
+
+        parser = MultipartParser(boundary, {
+            "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+            "on_part_end": lambda: events.append(("end",)),
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+        })
+
+        parts: List[_FilePart] = []
+        unfinished: List[_FilePart] = []
+        results = []
+        part = None
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                for event in events:
+                    if event[0] == "begin":
+                        _, options = parse_options_header(event[1])
+                        if b"filename" not in options:
+                            part = None  # plain form field - ignored
+                            continue
+                        if len(parts) == self.max_files:
+                            raise UploadError(f"At most {self.max_files} files per upload")
+                        media_type = event[2].decode("latin-1").strip().lower()
+                        part = _FilePart(
+                            clean_filename(options[b"filename"].decode("utf-8", "replace")),
+                            media_type if CONTENT_TYPE.match(media_type) else "application/octet-stream",
+                            os.path.join(self.temp_dir, secrets.token_hex(16))
+                        )
+                        parts.append(part)
+                        unfinished.append(part)
+                        await asyncio.to_thread(self._open, part)
+                    elif part is None:
+                        continue
+                    elif event[0] == "data":
+                        part.size += len(event[1])
+                        if part.size > self.max_size:
+                            raise UploadError(f"Files can be at most {self.max_size // (1024 * 1024)} MB", 413)
+                        part.buffer += event[1]
+                        if len(part.buffer) >= WRITE_BUFFER_SIZE:
+                            await self._flush(part)
+                    else:
+                        await self._flush(part)
+                        attachment_id = part.hasher.hexdigest()
+                        await asyncio.to_thread(self._store, part, attachment_id)
+                        unfinished.remove(part)
+                        results.append({
+                            "id": attachment_id,
+                            "filename": part.filename,
+                            "size": part.size,
+                            "content_type": part.content_type
+                        })
+                        part = None
+                events.clear()
+            parser.finalize()
+        except UploadError:
+            raise
+        except Exception as e:
+            raise UploadError(f"Malformed upload: {e}")
+        finally:
+            if unfinished:
+                await asyncio.to_thread(self._discard, unfinished)
+
+        if not results:
+            raise UploadError("No files in upload")
+        result = await asyncio.to_thread(
+            register_attachments, [(item["id"], item["size"], item["content_type"]) for item in results]
+        )
+        if not result["success"]:
+            raise UploadError(result["message"], 500)
+        return results
+
+
+attachment_store = AttachmentStore()
@@ -0,0 +1,235 @@
+"""WebSocket connection registry
+
+Every WebSocket is a session with its own id, so one user can be connected from
+several tabs and devices at once. Reverse indexes (user -> sessions and
+session -> voice channels) keep connect and disconnect proportional to what the
+session itself joined, independent of how many channels exist.
+
+Which channels a user is in, and whether they are in voice, is tracked per user
+by the voice state registry. This module only routes: which device of the user
+carries the voice connection.
+
+Each session also has a wire codec (JSON or MessagePack, see ws_protocol). A
+broadcast encodes the message once per codec, not once per recipient.
+
+A connection costs one Session record (__slots__, only what the handlers use,
+interned username) plus its index entries - see benchmarks/bench_session_memory.py.
+A user can hold at most MAX_SESSIONS_PER_USER connections. The endpoint reserves
+a slot before it accepts the socket and replays missed events, so connections
+opened at the same time cannot overshoot the limit while they wait to register.
+"""
+import asyncio
+import secrets
+import sys
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+from .event_log import event_log
+from .server_presence import server_presence
+from .ws_protocol import JSON_CODEC
+from .tracing import tracer
+
+
+# Connections one user may have open at once (tabs and devices)
+MAX_SESSIONS_PER_USER = 10
+
+
+class Session:
+    """One WebSocket connection"""
+    __slots__ = ("session_id", "user_id", "username", "websocket", "codec", "voice_channel", "last_seen")
+
+    def __init__(self, session_id: str, user_id: int, username: str, websocket: Optional[WebSocket], codec):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.username = sys.intern(username)
+        self.websocket = websocket  # None once sending to it failed or it is being closed
+        self.codec = codec
+        self.voice_channel: Optional[int] = None  # channel whose voice this device carries
+        self.last_seen: Optional[float] = None  # last inbound frame, while the heartbeat tracks it
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.sessions: Dict[str, Session] = {}  # session_id -> session
+        self.user_sessions: Dict[int, tuple] = {}  # user_id -> session ids (tuples: most users have one)
+        self.channel_sessions: Dict[int, set] = {}  # channel_id -> session ids in voice
+        self.reserved: Dict[int, int] = {}  # user_id -> slots held by connections not registered yet
+
+    def reserve(self, user_id: int) -> bool:
+        """Hold one of the user's connection slots - False at the limit. Pair with release()"""
+        reserved = self.reserved.get(user_id, 0)
+        if len(self.user_sessions.get(user_id, ())) + reserved >= MAX_SESSIONS_PER_USER:
+            return False
+        self.reserved[user_id] = reserved + 1
+        return True
+
+    def release(self, user_id: int):
+        """Give back a reserved slot - once connect() has registered the session, or it never will"""
+        reserved = self.reserved.pop(user_id, 0) - 1
+        if reserved > 0:
+            self.reserved[user_id] = reserved
+
+    async def connect(self, user_id: int, username: str, websocket: WebSocket, codec=JSON_CODEC) -> Session:
+        """Register a connection and return its new session"""
+        session = Session(secrets.token_urlsafe(8), user_id, username, websocket, codec)
+        self.sessions[session.session_id] = session
+        if user_id not in self.user_sessions:
+            self.user_sessions[user_id] = ()
+            server_presence.track(user_id)
+            event_log.connected(user_id)
+        self.user_sessions[user_id] += (session.session_id,)
+        return session
+
+    def disconnect(self, session_id: str) -> List[int]:
+        """Remove a connection - returns the voice channels it was connected to"""
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return []
+        user_sessions = tuple(other for other in self.user_sessions.get(session.user_id, ()) if other != session_id)
+        if user_sessions:
+            self.user_sessions[session.user_id] = user_sessions
+        else:
+            self.user_sessions.pop(session.user_id, None)
+            server_presence.untrack(session.user_id)
+            event_log.disconnected(session.user_id)
+
+        if session.voice_channel is None:
+            return []
+        self._discard(session.voice_channel, session_id)
+        return [session.voice_channel]
+
+    async def close_session(self, session_id: str, code: int, reason: str, timeout: float):
+        """
+        Stop sending to a session and close its socket
+        The endpoint's receive loop then ends and cleans up the indexes as for any disconnect
+        """
+        session = self.sessions.get(session_id)
+        if session is None or session.websocket is None:
+            return
+        websocket, session.websocket = session.websocket, None
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), timeout)
+        except:
+            pass
+
+    def is_online(self, user_id: int) -> bool:
+        """Check if a user has at least one open connection"""
+        return user_id in self.user_sessions
+
+    def user_of(self, session_id: str) -> Optional[int]:
+        """Get the user a session belongs to"""
+        session = self.sessions.get(session_id)
+        return session.user_id if session is not None else None
+
+    # ---------- Voice routing ----------
+
+    def _discard(self, channel_id: int, session_id: str):
+        sessions = self.channel_sessions.get(channel_id)
+        if sessions is not None:
+            sessions.discard(session_id)
+            if not sessions:
+                del self.channel_sessions[channel_id]
+
+    def join_voice_channel(self, session_id: str, channel_id: int):
+        """Route a channel's voice to this session (a user has one voice connection, on one device)"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        for other in self.user_sessions.get(session.user_id, ()):
+            other_session = self.sessions[other]
+            if other_session.voice_channel is not None:
+                self._discard(other_session.voice_channel, other)
+                other_session.voice_channel = None
+        session.voice_channel = channel_id
+        self.channel_sessions.setdefault(channel_id, set()).add(session_id)
+
+    def leave_voice_channel(self, user_id: int, channel_id: int):
+        """Stop routing a channel's voice to any of the user's sessions"""
+        for session_id in self.user_sessions.get(user_id, ()):
+            session = self.sessions[session_id]
+            if session.voice_channel == channel_id:
+                session.voice_channel = None
+                self._discard(channel_id, session_id)
+
+    # ---------- Sending ----------
+
+    async def send_to_session(self, session_id: str, message: dict, frames: Optional[dict] = None):
+        """
+        Send a message to one connection
+        frames caches the encoded message per codec when the same message goes to many sessions
+        """
+        session = self.sessions.get(session_id)
+        if session is None or session.websocket is None:
+            return
+        codec = session.codec
+        if frames is None:
+            frame = codec.encode(message)
+        else:
+            frame = frames.get(codec.name)
+            if frame is None:
+                frame = frames[codec.name] = codec.encode(message)
+        try:
+            with tracer.span("ws.send", "ws", user_id=session.user_id, bytes=len(frame)):
+                await codec.send_frame(session.websocket, frame)
+        except:
+            # Stop sending to it; the endpoint cleans up the indexes when the socket closes
+            session.websocket = None
+
+    async def send_to_user(self, user_id: int, message: dict):
+        """Send a message to every device of a user"""
+        frames = {}
+        for session_id in self.user_sessions.get(user_id, ()):
+            await self.send_to_session(session_id, message, frames)
+
+    async def send_to_users(self, user_ids, message: dict, exclude_user_id: Optional[int] = None):
+        """Send the same message to every device of several users"""
+        frames = {}
+        for user_id in user_ids:
+            if exclude_user_id and user_id == exclude_user_id:
+                continue
+            for session_id in self.user_sessions.get(user_id, ()):
+                await self.send_to_session(session_id, message, frames)
+
+    async def send_to_server(self, server_id: int, message: dict, exclude_user_id: Optional[int] = None):
+        """Broadcast message to the online members of a server"""
+        await self.send_to_users(server_presence.online_members(server_id), message, exclude_user_id)
+
+    async def send_event(self, user_id: int, message: dict):
+        """
+        Send a reliable event to a user
+        The event gets the user's next sequence number and is logged, so a user who is
+        offline (or mid-reconnect) receives it when they resume their session
+        """
+        event = event_log.append(user_id, message)
+        await self.send_to_user(user_id, event)
+
+    async def send_events(self, events: list):
+        """send_event() for a list of (user_id, message) - one pass, sequence numbers loaded in one query"""
+        event_log.preload(user_id for user_id, _ in events)
+        for user_id, message in events:
+            await self.send_to_user(user_id, event_log.append(user_id, message))
+
+    async def send_to_channel(self, channel_id: int, message: dict, exclude_user_id: Optional[int] = None):
+        """Broadcast message to the devices connected to voice in a channel"""
+        frames = {}
+        for session_id in list(self.channel_sessions.get(channel_id, ())):
+            if exclude_user_id and self.user_of(session_id) == exclude_user_id:
+                continue
+            await self.send_to_session(session_id, message, frames)
+
+    async def send_to_channel_member(self, user_id: int, channel_id: int, message: dict):
+        """Send voice signaling to the device a user is connected to voice with"""
+        for session_id in self.user_sessions.get(user_id, ()):
+            if self.sessions[session_id].voice_channel == channel_id:
+                await self.send_to_session(session_id, message)
+
+    async def send_to_target(self, user_id: int, session_id: Optional[str], message: dict):
+        """Send to one device of a user when the client named it, otherwise to all of them"""
+        if session_id and self.user_of(session_id) == user_id:
+            await self.send_to_session(session_id, message)
+        else:
+            await self.send_to_user(user_id, message)
+
+
+manager = ConnectionManager()
@@ -9,7 +9,9 @@ from .user_operations import (
     verify_user,
     get_user_by_id,
     get_user_by_username,
-    update_user_status
+    get_users_by_ids,
+    update_user_status,
+    iter_usernames
 )
 
 # Import friend operations
@@ -19,7 +21,8 @@ from .friend_operations import (
     accept_friend_request,
     decline_friend_request,
     get_friends,
-    get_friends_with_status
+    get_friends_with_status,
+    iter_friendships
 )
 
 # Import message operations
@@ -28,28 +31,82 @@ from .message_operations import (
     get_chat_history
 )
 
+# Import conversation operations
+from .conversation_operations import (
+    get_conversations,
+    mark_conversation_read
+)
+
+# Import event log operations
+from .event_operations import (
+    save_user_events,
+    get_last_event_seq,
+    get_last_event_seqs,
+    get_user_events_after
+)
+
+# Import notification outbox operations
+from .outbox_operations import (
+    enqueue_notifications,
+    get_outbox_batch,
+    delete_outbox_rows,
+    get_outbox_backlog
+)
+
 # Import server operations
 from .server_operations import (
     create_server,
     get_user_servers,
+    get_user_server_ids,
+    get_server_members,
     get_server_by_id,
+    is_server_member,
     send_server_invite,
+    send_server_invites,
     get_pending_server_invites,
     accept_server_invite,
-    decline_server_invite
+    decline_server_invite,
+    iter_server_memberships
 )
 
 # Import channel operations
 from .channel_operations import (
     create_channel,
     get_server_channels,
-    join_channel,
-    leave_channel,
-    get_channel_members,
+    get_channel_by_id,
+    check_channel_access,
+    get_channel_presence,
+    save_channel_presence,
     save_channel_message,
     get_channel_messages
 )
 
+# Import export operations
+from .export_operations import (
+    iter_direct_messages,
+    iter_channel_messages,
+    iter_server_messages
+)
+
+# Import attachment operations
+from .attachment_operations import (
+    register_attachments,
+    get_attachment,
+    can_access_attachment,
+    purge_orphan_attachments,
+    clean_filename
+)
+
+# Import retention operations
+from .retention_operations import (
+    get_retention_policies,
+    set_retention_policy,
+    get_retention_channels,
+    purge_expired_rows,
+    reclaim_free_pages,
+    get_storage_stats
+)
+
 # Export all functions
 __all__ = [
     # Database initialization
@@ -60,7 +117,9 @@ __all__ = [
     'verify_user',
     'get_user_by_id',
     'get_user_by_username',
+    'get_users_by_ids',
     'update_user_status',
+    'iter_usernames',
     
     # Friend operations
     'send_friend_request',
@@ -69,26 +128,69 @@ __all__ = [
     'decline_friend_request',
     'get_friends',
     'get_friends_with_status',
+    'iter_friendships',
     
     # Message operations
     'save_message',
     'get_chat_history',
     
+    # Conversation operations
+    'get_conversations',
+    'mark_conversation_read',
+    
+    # Event log operations
+    'save_user_events',
+    'get_last_event_seq',
+    'get_last_event_seqs',
+    'get_user_events_after',
+    
+    # Notification outbox operations
+    'enqueue_notifications',
+    'get_outbox_batch',
+    'delete_outbox_rows',
+    'get_outbox_backlog',
+    
     # Server operations
     'create_server',
     'get_user_servers',
+    'get_user_server_ids',
+    'get_server_members',
     'get_server_by_id',
+    'is_server_member',
     'send_server_invite',
+    'send_server_invites',
     'get_pending_server_invites',
     'accept_server_invite',
     'decline_server_invite',
+    'iter_server_memberships',
     
     # Channel operations
     'create_channel',
     'get_server_channels',
-    'join_channel',
-    'leave_channel',
-    'get_channel_members',
+    'get_channel_by_id',
+    'check_channel_access',
+    'get_channel_presence',
+    'save_channel_presence',
     'save_channel_message',
-    'get_channel_messages'
+    'get_channel_messages',
+    
+    # Export operations
+    'iter_direct_messages',
+    'iter_channel_messages',
+    'iter_server_messages',
+    
+    # Attachment operations
+    'register_attachments',
+    'get_attachment',
+    'can_access_attachment',
+    'purge_orphan_attachments',
+    'clean_filename',
+    
+    # Retention operations
+    'get_retention_policies',
+    'set_retention_policy',
+    'get_retention_channels',
+    'purge_expired_rows',
+    'reclaim_free_pages',
+    'get_storage_stats'
 ]
@@ -0,0 +1,199 @@
+"""File attachment operations
+
+File contents live on disk, addressed by their SHA-256 (see app/attachments.py).
+The attachments table has one row per distinct file; message_attachments links
+messages to files, with the name the file was sent under. The same file posted
+twice is stored once and linked twice.
+
+A file can be downloaded by the users who can read a message it is linked to.
+Files nobody links to (uploaded but never sent, or left behind by purged
+messages) are deleted by the retention job once they are ORPHAN_GRACE_HOURS old;
+uploading a file again restarts that clock.
+"""
+import json
+import time
+from typing import Dict, List, Optional
+
+from .connection import get_db_connection, run_write, PRIORITY_BULK
+
+# Files one message can carry
+MAX_ATTACHMENTS_PER_MESSAGE = 10
+
+# Characters kept of a file name
+MAX_FILENAME_LENGTH = 255
+
+# Hours an unlinked file is kept - time to send the message it was uploaded for
+ORPHAN_GRACE_HOURS = 24
+
+
+def clean_filename(filename: Optional[str]) -> str:
+    """Strip directories and control characters from a client-supplied file name"""
+    name = (filename or "").replace("\\", "/").rsplit("/", 1)[-1]
+    name = "".join(ch for ch in name if ch.isprintable()).strip()
+    return name[:MAX_FILENAME_LENGTH] or "file"
+
+
+def register_attachments(attachments: list) -> dict:
+    """Record uploaded files as (attachment_id, size, content_type) - files already known only get a fresh created_at"""
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO attachments (id, size, content_type) VALUES (?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET created_at = CURRENT_TIMESTAMP
+        """, attachments)
+
+        return {
+            "success": True,
+            "message": f"Registered {len(attachments)} attachments"
+        }
+
+    try:
+        return run_write(write)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error registering attachments: {str(e)}"
+        }
+
+
+def get_attachment(attachment_id: str) -> Optional[dict]:
+    """Get a stored file's size and content type"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, size, content_type FROM attachments WHERE id = ?",
+                (attachment_id,)
+            )
+            attachment = cursor.fetchone()
+            return dict(attachment) if attachment else None
+    except Exception as e:
+        print(f"Error getting attachment: {e}")
+        return None
+
+
+def can_access_attachment(attachment_id: str, user_id: int) -> bool:
+    """Whether a user can read a message the file is linked to (a DM they are in, or a channel of their server)"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT 1 FROM message_attachments ma
+                JOIN messages m ON ma.message_type = 'dm' AND m.id = ma.message_id
+                WHERE ma.attachment_id = ? AND (m.sender_id = ? OR m.receiver_id = ?)
+                UNION ALL
+                SELECT 1 FROM message_attachments ma
+                JOIN channel_messages cm ON ma.message_type = 'channel' AND cm.id = ma.message_id
+                JOIN channels ch ON ch.id = cm.channel_id
+                JOIN server_members sm ON sm.server_id = ch.server_id AND sm.user_id = ?
+                WHERE ma.attachment_id = ?
+                LIMIT 1
+            """, (attachment_id, user_id, user_id, user_id, attachment_id))
+            return cursor.fetchone() is not None
+    except Exception as e:
+        print(f"Error checking attachment access: {e}")
+        return False
+
+
+def purge_orphan_attachments(batch_size: int, grace_hours: int = ORPHAN_GRACE_HOURS) -> dict:
+    """
+    Delete one batch of attachment rows no message links to, older than grace_hours
+    Returns the deleted ids - the caller removes their files
+    """
+    def write(conn):
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id FROM attachments a
+            WHERE created_at < datetime('now', ?)
+            AND NOT EXISTS (SELECT 1 FROM message_attachments ma WHERE ma.attachment_id = a.id)
+            LIMIT ?
+        """, (f"-{int(grace_hours)} hours", batch_size))
+        ids = [row['id'] for row in cursor.fetchall()]
+        cursor.execute(
+            "DELETE FROM attachments WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(ids),)
+        )
+
+        return {
+            "success": True,
+            "message": f"Deleted {len(ids)} unlinked attachments",
+            "ids": ids,
+            "done": len(ids) < batch_size,
+            "hold_seconds": time.perf_counter() - start
+        }
+
+    try:
+        return run_write(write, PRIORITY_BULK)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error purging attachments: {str(e)}",
+            "ids": [],
+            "done": True
+        }
+
+
+def resolve_attachments(cursor, attachments: list) -> Optional[List[dict]]:
+    """
+    Check attachments sent with a message ([{'id', 'filename'}]) against the stored files
+    Returns their metadata, or None when one is unknown or there are too many
+    """
+    if len(attachments) > MAX_ATTACHMENTS_PER_MESSAGE:
+        return None
+    ids = []
+    for attachment in attachments:
+        if not isinstance(attachment, dict) or not isinstance(attachment.get('id'), str):
+            return None
+        ids.append(attachment['id'])
+
+    placeholders = ",".join("?" * len(ids))
+    cursor.execute(f"SELECT id, size, content_type FROM attachments WHERE id IN ({placeholders})", ids)
+    stored = {row['id']: row for row in cursor.fetchall()}
+    if len(stored) != len(set(ids)):
+        return None
+    return [
+        {
+            'id': attachment['id'],
+            'filename': clean_filename(attachment.get('filename')),
+            'size': stored[attachment['id']]['size'],
+            'content_type': stored[attachment['id']]['content_type']
+        }
+        for attachment in attachments
+    ]
+
+
+def link_attachments(cursor, message_type: str, message_id: int, attachments: List[dict]):
+    """Attach resolved files to a new message (called inside the message write transaction)"""
+    cursor.executemany("""
+        INSERT INTO message_attachments (message_type, message_id, position, attachment_id, filename)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (message_type, message_id, position, attachment['id'], attachment['filename'])
+        for position, attachment in enumerate(attachments)
+    ])
+
+
+def load_message_attachments(cursor, message_type: str, messages: List[dict]):
+    """Add an 'attachments' list to each message dict, with one query for all of them"""
+    by_message: Dict[int, list] = {}
+    for message in messages:
+        message['attachments'] = by_message.setdefault(message['id'], [])
+    if not messages:
+        return
+
+    placeholders = ",".join("?" * len(by_message))
+    cursor.execute(f"""
+        SELECT ma.message_id, ma.attachment_id, ma.filename, a.size, a.content_type
+        FROM message_attachments ma
+        JOIN attachments a ON a.id = ma.attachment_id
+        WHERE ma.message_type = ? AND ma.message_id IN ({placeholders})
+        ORDER BY ma.message_id, ma.position
+    """, (message_type, *by_message))
+    for row in cursor.fetchall():
+        by_message[row['message_id']].append({
+            'id': row['attachment_id'],
+            'filename': row['filename'],
+            'size': row['size'],
+            'content_type': row['content_type']
+        })
@@ -0,0 +1,506 @@
+"""Bulk import of users, servers, friendships and message history
+
+Used by import_history.py to migrate communities from other chat systems.
+Dumps are folders with one NDJSON (.ndjson / .jsonl) or CSV file per entity:
+
+    users            id, email, username, [avatar], [created_at]
+    servers          id, name, owner_id, [created_at]
+    server_members   server_id, user_id
+    channels         id, server_id, name, [channel_type]
+    friendships      user1_id, user2_id
+    messages         sender_id, receiver_id, message, [created_at]
+    channel_messages channel_id, sender_id, message, [created_at]
+
+Ids in the dump are source ids. They are mapped to local ids through the
+import_id_map table, so references between files resolve and a second run
+does not duplicate rows. Rows are written with executemany() in large
+transactions; each transaction also records how far into the file it got,
+so an interrupted import resumes from the last committed batch.
+
+The conversation list is refreshed at the end for the DM pairs and channels
+the import wrote messages to; every other conversation, and the unread counts
+and read markers of existing members, are left as they are. Imported history
+counts as read for members who get a new conversation row.
+
+Imported messages get ids after every local message, even when they are older
+(users are merged into existing accounts by email), so DM history is ordered
+by created_at, which the importer normalizes to SQLite's own format.
+
+The importer writes directly to the database file - stop the server first.
+"""
+import csv
+import json
+import os
+import secrets
+import sqlite3
+import time
+from typing import Dict, Iterator, Optional
+
+from . import connection
+from .schemas import init_database
+from .conversation_operations import PREVIEW_LENGTH, dm_conversation_key
+
+# Rows written per transaction
+DEFAULT_BATCH_SIZE = 50_000
+
+# Import order - every file only references entities imported before it
+ENTITY_ORDER = [
+    "users", "servers", "server_members", "channels",
+    "friendships", "messages", "channel_messages"
+]
+
+# Entities whose source ids are referenced by other files
+MAPPED_ENTITIES = {"users", "servers", "channels"}
+
+# Tables whose secondary indexes are dropped during the import and rebuilt at the end
+BULK_TABLES = ("users", "friendships", "messages", "server_members", "channels", "channel_messages")
+
+
+def find_dump_files(folder: str) -> Dict[str, str]:
+    """Find the file for each entity in a dump folder"""
+    files = {}
+    for name in os.listdir(folder):
+        entity, ext = os.path.splitext(name)
+        if entity in ENTITY_ORDER and ext.lower() in (".ndjson", ".jsonl", ".csv"):
+            files[entity] = os.path.join(folder, name)
+    return files
+
+
+def read_records(path: str, skip: int = 0) -> Iterator[dict]:
+    """Yield records from an NDJSON or CSV file, skipping the first `skip` records"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for index, record in enumerate(csv.DictReader(f)):
+                if index >= skip:
+                    yield record
+        else:
+            index = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                if index >= skip:
+                    yield json.loads(line)
+                index += 1
+
+
+class BulkImporter:
+    def __init__(self, source: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.source = source
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(connection.DB_PATH, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.execute("PRAGMA cache_size = -200000")  # ~200 MB page cache
+        self.ids: Dict[str, Dict[str, int]] = {}  # entity -> source id -> local id
+        self.next_ids: Dict[str, int] = {}
+        self.stats: Dict[str, dict] = {}
+        self._create_import_tables()
+
+    def _create_import_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS import_id_map (
+                source TEXT NOT NULL,
+                entity TEXT NOT NULL,
+                source_id TEXT NOT NULL,
+                local_id INTEGER NOT NULL,
+                PRIMARY KEY (source, entity, source_id)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS import_progress (
+                source TEXT NOT NULL,
+                entity TEXT NOT NULL,
+                rows_done INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source, entity)
+            )
+        """)
+        # DM pairs (conversation_key) and channels (channel_id) the import wrote messages to
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS import_conversations (
+                source TEXT NOT NULL,
+                conversation_type TEXT NOT NULL,
+                ref INTEGER NOT NULL,
+                PRIMARY KEY (source, conversation_type, ref)
+            ) WITHOUT ROWID
+        """)
+
+    # ---------- Bookkeeping ----------
+
+    def _rows_done(self, entity: str) -> int:
+        row = self.conn.execute(
+            "SELECT rows_done FROM import_progress WHERE source = ? AND entity = ?",
+            (self.source, entity)
+        ).fetchone()
+        return row['rows_done'] if row else 0
+
+    def _id_map(self, entity: str) -> Dict[str, int]:
+        """Source id -> local id for an entity (loaded once, then kept in memory)"""
+        if entity not in self.ids:
+            rows = self.conn.execute(
+                "SELECT source_id, local_id FROM import_id_map WHERE source = ? AND entity = ?",
+                (self.source, entity)
+            )
+            self.ids[entity] = {row['source_id']: row['local_id'] for row in rows}
+        return self.ids[entity]
+
+    def _allocate_id(self, table: str) -> int:
+        """Next free primary key - safe because the importer is the only writer"""
+        if table not in self.next_ids:
+            row = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) as max_id FROM {table}").fetchone()
+            self.next_ids[table] = row['max_id']
+        self.next_ids[table] += 1
+        return self.next_ids[table]
+
+    def _lookup(self, entity: str, source_id) -> Optional[int]:
+        if source_id is None or source_id == "":
+            return None
+        return self._id_map(entity).get(str(source_id))
+
+    def _touch(self, conversation_type: str, refs: set):
+        """Remember conversations that need a refresh once the import is done"""
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO import_conversations (source, conversation_type, ref) VALUES (?, ?, ?)",
+            ((self.source, conversation_type, ref) for ref in refs)
+        )
+
+    def _existing(self, sql: str, values) -> set:
+        """Run a set-based lookup with the values passed as one JSON array"""
+        return {tuple(row) if len(row) > 1 else row[0]
+                for row in self.conn.execute(sql, (json.dumps(list(values)),))}
+
+    # ---------- Index management ----------
+
+    def drop_secondary_indexes(self):
+        """Drop named indexes on the bulk tables - init_database() recreates them"""
+        placeholders = ", ".join("?" for _ in BULK_TABLES)
+        indexes = self.conn.execute(f"""
+            SELECT name FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+        """, BULK_TABLES).fetchall()
+        for index in indexes:
+            self.conn.execute(f"DROP INDEX IF EXISTS {index['name']}")
+        return len(indexes)
+
+    # ---------- Entity writers (run inside the batch transaction) ----------
+
+    def _write_users(self, batch: list) -> tuple:
+        ids = self._id_map("users")
+        existing_emails = dict(self._existing(
+            "SELECT email, id FROM users WHERE email IN (SELECT value FROM json_each(?))",
+            (r['email'] for r in batch)
+        ))
+        taken_usernames = self._existing(
+            "SELECT username FROM users WHERE username IN (SELECT value FROM json_each(?))",
+            (r['username'] for r in batch)
+        )
+
+        rows, mappings, skipped = [], [], 0
+        for record in batch:
+            source_id = str(record['id'])
+            if source_id in ids:
+                skipped += 1
+                continue
+            local_id = existing_emails.get(record['email'])
+            if local_id is None:
+                local_id = self._allocate_id("users")
+                username = record['username']
+                if username in taken_usernames:
+                    username = f"{username}_{source_id}"
+                taken_usernames.add(username)
+                existing_emails[record['email']] = local_id
+                # Imported accounts get an unguessable password until they reset it
+                rows.append((local_id, record['email'], username, secrets.token_urlsafe(16),
+                             record.get('avatar') or "avatar1", record.get('created_at') or None))
+            ids[source_id] = local_id
+            mappings.append((self.source, "users", source_id, local_id))
+
+        self.conn.executemany("""
+            INSERT INTO users (id, email, username, password, avatar, created_at)
+            VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        """, rows)
+        return len(rows), skipped, mappings
+
+    def _write_servers(self, batch: list) -> tuple:
+        ids = self._id_map("servers")
+        taken_names = self._existing(
+            "SELECT name FROM servers WHERE name IN (SELECT value FROM json_each(?))",
+            (r['name'] for r in batch)
+        )
+
+        rows, owners, mappings, skipped = [], [], [], 0
+        for record in batch:
+            source_id = str(record['id'])
+            owner_id = self._lookup("users", record.get('owner_id'))
+            if source_id in ids or owner_id is None:
+                skipped += 1
+                continue
+            local_id = self._allocate_id("servers")
+            name = record['name']
+            if name in taken_names:
+                name = f"{name} ({self.source})"
+            taken_names.add(name)
+            rows.append((local_id, name, owner_id, record.get('created_at') or None))
+            owners.append((local_id, owner_id))
+            ids[source_id] = local_id
+            mappings.append((self.source, "servers", source_id, local_id))
+
+        self.conn.executemany("""
+            INSERT INTO servers (id, name, owner_id, created_at)
+            VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        """, rows)
+        # Owners are always members, like create_server() does
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO server_members (server_id, user_id) VALUES (?, ?)",
+            owners
+        )
+        return len(rows), skipped, mappings
+
+    def _write_server_members(self, batch: list) -> tuple:
+        rows = []
+        for record in batch:
+            server_id = self._lookup("servers", record.get('server_id'))
+            user_id = self._lookup("users", record.get('user_id'))
+            if server_id and user_id:
+                rows.append((server_id, user_id))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO server_members (server_id, user_id) VALUES (?, ?)",
+            rows
+        )
+        return len(rows), len(batch) - len(rows), []
+
+    def _write_channels(self, batch: list) -> tuple:
+        ids = self._id_map("channels")
+        server_ids = {self._lookup("servers", r.get('server_id')) for r in batch}
+        taken_names = self._existing(
+            "SELECT server_id, name FROM channels WHERE server_id IN (SELECT value FROM json_each(?))",
+            (server_id for server_id in server_ids if server_id)
+        )
+
+        rows, mappings, skipped = [], [], 0
+        for record in batch:
+            source_id = str(record['id'])
+            server_id = self._lookup("servers", record.get('server_id'))
+            if source_id in ids or server_id is None:
+                skipped += 1
+                continue
+            local_id = self._allocate_id("channels")
+            name = record['name']
+            if (server_id, name) in taken_names:
+                name = f"{name}-{source_id}"
+            taken_names.add((server_id, name))
+            channel_type = record.get('channel_type') if record.get('channel_type') in ("voice", "text") else "text"
+            rows.append((local_id, server_id, name, channel_type))
+            ids[source_id] = local_id
+            mappings.append((self.source, "channels", source_id, local_id))
+
+        self.conn.executemany(
+            "INSERT INTO channels (id, server_id, name, channel_type) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        return len(rows), skipped, mappings
+
+    def _write_friendships(self, batch: list) -> tuple:
+        rows = []
+        for record in batch:
+            user1_id = self._lookup("users", record.get('user1_id'))
+            user2_id = self._lookup("users", record.get('user2_id'))
+            if user1_id and user2_id and user1_id != user2_id:
+                rows.append((user1_id, user2_id, user2_id, user1_id))
+        # Friendships are stored in one direction only - skip pairs that exist reversed
+        self.conn.executemany("""
+            INSERT OR IGNORE INTO friendships (user1_id, user2_id)
+            SELECT ?, ? WHERE NOT EXISTS (
+                SELECT 1 FROM friendships WHERE user1_id = ? AND user2_id = ?
+            )
+        """, rows)
+        return len(rows), len(batch) - len(rows), []
+
+    def _write_messages(self, batch: list) -> tuple:
+        rows = []
+        for record in batch:
+            sender_id = self._lookup("users", record.get('sender_id'))
+            receiver_id = self._lookup("users", record.get('receiver_id'))
+            if sender_id and receiver_id and record.get('message'):
+                rows.append((
+                    sender_id, receiver_id, dm_conversation_key(sender_id, receiver_id),
+                    record['message'], record.get('created_at') or None
+                ))
+        self.conn.executemany("""
+            INSERT INTO messages (sender_id, receiver_id, conversation_key, message, created_at)
+            VALUES (?, ?, ?, ?, COALESCE(datetime(?), CURRENT_TIMESTAMP))
+        """, rows)
+        self._touch("dm", {row[2] for row in rows})
+        return len(rows), len(batch) - len(rows), []
+
+    def _write_channel_messages(self, batch: list) -> tuple:
+        rows = []
+        for record in batch:
+            channel_id = self._lookup("channels", record.get('channel_id'))
+            sender_id = self._lookup("users", record.get('sender_id'))
+            if channel_id and sender_id and record.get('message'):
+                rows.append((channel_id, sender_id, record['message'], record.get('created_at') or None))
+        self.conn.executemany("""
+            INSERT INTO channel_messages (channel_id, sender_id, message, created_at)
+            VALUES (?, ?, ?, COALESCE(datetime(?), CURRENT_TIMESTAMP))
+        """, rows)
+        self._touch("channel", {row[0] for row in rows})
+        return len(rows), len(batch) - len(rows), []
+
+    # ---------- Conversation list ----------
+
+    def refresh_conversations(self, conn: sqlite3.Connection):
+        """Bring the conversations the import touched up to date (inside the caller's transaction)"""
+        touched = "SELECT ref FROM import_conversations WHERE source = ? AND conversation_type = ?"
+
+        # DM pairs - the key holds both user ids
+        conn.execute(f"""
+            INSERT OR IGNORE INTO conversations (conversation_type, user1_id, user2_id)
+            SELECT 'dm', ref >> 32, ref & 4294967295 FROM ({touched})
+        """, (self.source, "dm"))
+        conn.execute(f"""
+            UPDATE conversations
+            SET last_message_id = (
+                SELECT id FROM messages WHERE conversation_key = (conversations.user1_id << 32) | conversations.user2_id
+                ORDER BY created_at DESC, id DESC LIMIT 1
+            )
+            WHERE (user1_id << 32) | user2_id IN ({touched})
+        """, (self.source, "dm"))
+        conn.execute(f"""
+            UPDATE conversations
+            SET (last_sender_id, last_message_preview, last_activity_at) = (
+                SELECT sender_id, substr(message, 1, ?), created_at FROM messages WHERE id = last_message_id
+            )
+            WHERE (user1_id << 32) | user2_id IN ({touched})
+        """, (PREVIEW_LENGTH, self.source, "dm"))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO conversation_members (conversation_id, user_id, last_read_message_id, last_activity_at)
+            SELECT id, user1_id, last_message_id, last_activity_at FROM conversations
+            WHERE (user1_id << 32) | user2_id IN ({touched})
+            UNION
+            SELECT id, user2_id, last_message_id, last_activity_at FROM conversations
+            WHERE (user1_id << 32) | user2_id IN ({touched})
+        """, (self.source, "dm", self.source, "dm"))
+
+        # Channels - every member of the channel's server is a participant
+        conn.execute(f"""
+            INSERT OR IGNORE INTO conversations (conversation_type, channel_id)
+            SELECT 'channel', ref FROM ({touched})
+        """, (self.source, "channel"))
+        conn.execute(f"""
+            UPDATE conversations
+            SET last_message_id = (SELECT MAX(id) FROM channel_messages WHERE channel_id = conversations.channel_id)
+            WHERE channel_id IN ({touched})
+        """, (self.source, "channel"))
+        conn.execute(f"""
+            UPDATE conversations
+            SET (last_sender_id, last_message_preview, last_activity_at) = (
+                SELECT sender_id, substr(message, 1, ?), created_at FROM channel_messages WHERE id = last_message_id
+            )
+            WHERE channel_id IN ({touched})
+        """, (PREVIEW_LENGTH, self.source, "channel"))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO conversation_members (conversation_id, user_id, last_read_message_id, last_activity_at)
+            SELECT c.id, sm.user_id, c.last_message_id, c.last_activity_at
+            FROM conversations c
+            JOIN channels ch ON ch.id = c.channel_id
+            JOIN server_members sm ON sm.server_id = ch.server_id
+            WHERE c.channel_id IN ({touched})
+        """, (self.source, "channel"))
+
+        # Existing members keep their counters and read markers - only the sort order moves
+        conn.execute("""
+            UPDATE conversation_members
+            SET last_activity_at = (SELECT last_activity_at FROM conversations WHERE id = conversation_id)
+            WHERE conversation_id IN (
+                SELECT c.id FROM conversations c
+                JOIN import_conversations i ON i.source = ? AND (
+                    (i.conversation_type = 'dm' AND i.ref = (c.user1_id << 32) | c.user2_id)
+                    OR (i.conversation_type = 'channel' AND i.ref = c.channel_id)
+                )
+            )
+            AND COALESCE(last_activity_at, '') < (SELECT last_activity_at FROM conversations WHERE id = conversation_id)
+        """, (self.source,))
+
+        conn.execute("DELETE FROM import_conversations WHERE source = ?", (self.source,))
+
+    # ---------- Driver ----------
+
+    def _commit_batch(self, entity: str, batch: list, rows_done: int) -> tuple:
+        """Write one batch, its id mappings and the resume point in one transaction"""
+        writer = getattr(self, f"_write_{entity}")
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            inserted, skipped, mappings = writer(batch)
+            if mappings:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO import_id_map (source, entity, source_id, local_id) VALUES (?, ?, ?, ?)",
+                    mappings
+                )
+            self.conn.execute("""
+                INSERT INTO import_progress (source, entity, rows_done) VALUES (?, ?, ?)
+                ON CONFLICT(source, entity) DO UPDATE SET rows_done = excluded.rows_done
+            """, (self.source, entity, rows_done))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            # Forget in-memory ids handed out by the failed batch
+            self.ids.pop(entity, None)
+            self.next_ids.clear()
+            raise
+        return inserted, skipped
+
+    def import_file(self, entity: str, path: str):
+        """Import one entity file, resuming after the last committed batch"""
+        rows_done = self._rows_done(entity)
+        if rows_done:
+            print(f"{entity}: resuming after {rows_done:,} rows")
+
+        stats = self.stats.setdefault(entity, {"read": 0, "inserted": 0, "skipped": 0, "seconds": 0.0})
+        start = time.perf_counter()
+        batch = []
+
+        def flush():
+            nonlocal rows_done
+            inserted, skipped = self._commit_batch(entity, batch, rows_done + len(batch))
+            rows_done += len(batch)
+            stats["read"] += len(batch)
+            stats["inserted"] += inserted
+            stats["skipped"] += skipped
+            elapsed = time.perf_counter() - start
+            print(f"{entity}: {rows_done:,} rows ({stats['read'] / elapsed:,.0f} rows/s)")
+            batch.clear()
+
+        for record in read_records(path, skip=rows_done):
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+        stats["seconds"] = time.perf_counter() - start
+
+    def run(self, folder: str):
+        """Import every entity file found in a dump folder"""
+        files = find_dump_files(folder)
+        if not files:
+            raise ValueError(f"No dump files found in {folder}")
+
+        dropped = self.drop_secondary_indexes()
+        print(f"Dropped {dropped} secondary indexes for the import")
+
+        for entity in ENTITY_ORDER:
+            if entity in files:
+                self.import_file(entity, files[entity])
+
+        print("Rebuilding indexes and conversation list...")
+        start = time.perf_counter()
+        self.conn.close()
+        init_database()
+        rebuild_conn = sqlite3.connect(connection.DB_PATH)
+        self.refresh_conversations(rebuild_conn)
+        rebuild_conn.execute("ANALYZE")
+        rebuild_conn.commit()
+        rebuild_conn.close()
+        print(f"Rebuilt in {time.perf_counter() - start:.1f}s")
+        return self.stats
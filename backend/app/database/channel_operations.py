@@ -1,59 +1,64 @@
 """Channel-related database operations"""
-from .connection import get_db_connection
+from typing import Optional
+
+from .connection import get_db_connection, run_write, PRIORITY_CHAT
+from .conversation_operations import record_channel_message
+from .attachment_operations import resolve_attachments, link_attachments, load_message_attachments
 
 
 def create_channel(server_id: int, name: str, owner_id: int, channel_type: str = "voice") -> dict:
     """Create a new channel in a server (owner only)"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if user is the server owner
-            cursor.execute(
-                "SELECT owner_id FROM servers WHERE id = ?",
-                (server_id,)
-            )
-            server = cursor.fetchone()
-            
-            if not server:
-                return {
-                    "success": False,
-                    "message": "Server not found!"
-                }
-            
-            if server['owner_id'] != owner_id:
-                return {
-                    "success": False,
-                    "message": "Only server owner can create channels!"
-                }
-            
-            # Check if channel name already exists in this server
-            cursor.execute(
-                "SELECT id FROM channels WHERE server_id = ? AND name = ?",
-                (server_id, name)
-            )
-            if cursor.fetchone():
-                return {
-                    "success": False,
-                    "message": "Channel name already exists in this server!"
-                }
-            
-            # Validate channel type
-            if channel_type not in ["voice", "text"]:
-                channel_type = "voice"
-            
-            # Create channel
-            cursor.execute(
-                "INSERT INTO channels (server_id, name, channel_type) VALUES (?, ?, ?)",
-                (server_id, name, channel_type)
-            )
-            conn.commit()
-            
+    # Validate channel type
+    if channel_type not in ["voice", "text"]:
+        channel_type = "voice"
+    
+    def write(conn):
+        cursor = conn.cursor()
+        
+        # Check if user is the server owner
+        cursor.execute(
+            "SELECT owner_id FROM servers WHERE id = ?",
+            (server_id,)
+        )
+        server = cursor.fetchone()
+        
+        if not server:
             return {
-                "success": True,
-                "message": f"Channel '{name}' created!",
-                "channel_id": cursor.lastrowid
+                "success": False,
+                "message": "Server not found!"
+            }
+        
+        if server['owner_id'] != owner_id:
+            return {
+                "success": False,
+                "message": "Only server owner can create channels!"
+            }
+        
+        # Check if channel name already exists in this server
+        cursor.execute(
+            "SELECT id FROM channels WHERE server_id = ? AND name = ?",
+            (server_id, name)
+        )
+        if cursor.fetchone():
+            return {
+                "success": False,
+                "message": "Channel name already exists in this server!"
             }
+        
+        # Create channel
+        cursor.execute(
+            "INSERT INTO channels (server_id, name, channel_type) VALUES (?, ?, ?)",
+            (server_id, name, channel_type)
+        )
+        
+        return {
+            "success": True,
+            "message": f"Channel '{name}' created!",
+            "channel_id": cursor.lastrowid
+        }
+    
+    try:
+        return run_write(write)
     except Exception as e:
         return {
             "success": False,
@@ -78,15 +83,33 @@ def get_server_channels(server_id: int) -> list:
         return []
 
 
-def join_channel(channel_id: int, user_id: int) -> dict:
-    """Join a channel (leaves current channel if in one)"""
+def get_channel_by_id(channel_id: int) -> dict:
+    """Get channel details by ID"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT * FROM channels WHERE id = ?",
+                (channel_id,)
+            )
+            channel = cursor.fetchone()
+            if channel:
+                return dict(channel)
+            return None
+    except Exception as e:
+        print(f"Error getting channel: {e}")
+        return None
+
+
+def check_channel_access(channel_id: int, user_id: int) -> dict:
+    """Check that a channel exists and the user is a member of its server"""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
             # Get server_id for this channel
             cursor.execute(
-                "SELECT server_id FROM channels WHERE id = ?",
+                "SELECT server_id, channel_type FROM channels WHERE id = ?",
                 (channel_id,)
             )
             channel = cursor.fetchone()
@@ -108,114 +131,123 @@ def join_channel(channel_id: int, user_id: int) -> dict:
                     "message": "You are not a member of this server!"
                 }
             
-            # Leave all channels in this server first
-            cursor.execute("""
-                DELETE FROM channel_members 
-                WHERE user_id = ? AND channel_id IN (
-                    SELECT id FROM channels WHERE server_id = ?
-                )
-            """, (user_id, channel['server_id']))
-            
-            # Join the new channel
-            cursor.execute(
-                "INSERT INTO channel_members (channel_id, user_id) VALUES (?, ?)",
-                (channel_id, user_id)
-            )
-            
-            conn.commit()
-            
             return {
                 "success": True,
-                "message": "Joined channel!"
+                "server_id": channel['server_id'],
+                "channel_type": channel['channel_type']
             }
     except Exception as e:
         return {
             "success": False,
-            "message": f"Error joining channel: {str(e)}"
+            "message": f"Error checking channel: {str(e)}"
         }
 
 
-def leave_channel(channel_id: int, user_id: int) -> dict:
-    """Leave a channel"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "DELETE FROM channel_members WHERE channel_id = ? AND user_id = ?",
-                (channel_id, user_id)
-            )
-            
-            conn.commit()
-            
-            return {
-                "success": True,
-                "message": "Left channel!"
-            }
-    except Exception as e:
-        return {
-            "success": False,
-            "message": f"Error leaving channel: {str(e)}"
-        }
-
-
-def get_channel_members(channel_id: int) -> list:
-    """Get all users currently in a channel"""
+def get_channel_presence() -> list:
+    """Get every persisted (user_id, channel_id, server_id) presence row"""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT u.id, u.username, u.avatar, u.status, cm.joined_at
-                FROM users u
-                JOIN channel_members cm ON u.id = cm.user_id
-                WHERE cm.channel_id = ?
+                SELECT cm.user_id, cm.channel_id, c.server_id
+                FROM channel_members cm
+                JOIN channels c ON c.id = cm.channel_id
                 ORDER BY cm.joined_at ASC
-            """, (channel_id,))
+            """)
             
-            members = cursor.fetchall()
-            return [dict(member) for member in members]
+            rows = cursor.fetchall()
+            return [dict(row) for row in rows]
     except Exception as e:
-        print(f"Error getting channel members: {e}")
+        print(f"Error getting channel presence: {e}")
         return []
 
 
-def save_channel_message(channel_id: int, sender_id: int, message: str) -> dict:
-    """Save a message to a channel"""
+def save_channel_presence(changes: list) -> dict:
+    """
+    Apply batched presence changes from the voice state registry
+    Each change is (user_id, old_channel_id, new_channel_id); either side may be None
+    """
+    def write(conn):
+        cursor = conn.cursor()
+        
+        cursor.executemany(
+            "DELETE FROM channel_members WHERE channel_id = ? AND user_id = ?",
+            [(old, user_id) for user_id, old, _ in changes if old is not None]
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO channel_members (channel_id, user_id) VALUES (?, ?)",
+            [(new, user_id) for user_id, _, new in changes if new is not None]
+        )
+        
+        return {
+            "success": True,
+            "message": f"Saved {len(changes)} presence changes"
+        }
+    
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Verify user is in the channel
-            cursor.execute(
-                "SELECT id FROM channel_members WHERE channel_id = ? AND user_id = ?",
-                (channel_id, sender_id)
-            )
-            if not cursor.fetchone():
+        return run_write(write)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error saving channel presence: {str(e)}"
+        }
+
+
+def save_channel_message(channel_id: int, sender_id: int, message: str, attachments: Optional[list] = None) -> dict:
+    """Save a message to a channel, optionally with uploaded files ([{'id', 'filename'}])"""
+    def write(conn):
+        cursor = conn.cursor()
+        
+        # Verify user is a member of the channel's server
+        # (being in the channel right now is checked by the caller against the voice state registry)
+        cursor.execute("""
+            SELECT sm.id FROM server_members sm
+            JOIN channels c ON c.server_id = sm.server_id
+            WHERE c.id = ? AND sm.user_id = ?
+        """, (channel_id, sender_id))
+        if not cursor.fetchone():
+            return {
+                "success": False,
+                "message": "You are not a member of this server!"
+            }
+        
+        resolved = []
+        if attachments:
+            resolved = resolve_attachments(cursor, attachments)
+            if resolved is None:
                 return {
                     "success": False,
-                    "message": "You must be in the channel to send messages!"
+                    "message": "Invalid attachments!"
                 }
-            
-            cursor.execute(
-                "INSERT INTO channel_messages (channel_id, sender_id, message) VALUES (?, ?, ?)",
-                (channel_id, sender_id, message)
-            )
-            message_id = cursor.lastrowid
-            
-            # Get the timestamp
-            cursor.execute(
-                "SELECT created_at FROM channel_messages WHERE id = ?",
-                (message_id,)
-            )
-            timestamp = cursor.fetchone()['created_at']
-            
-            conn.commit()
-            
-            return {
-                "success": True,
-                "message": "Message sent!",
-                "timestamp": timestamp
-            }
+        
+        cursor.execute(
+            "INSERT INTO channel_messages (channel_id, sender_id, message) VALUES (?, ?, ?)",
+            (channel_id, sender_id, message)
+        )
+        message_id = cursor.lastrowid
+        
+        # Get the timestamp
+        cursor.execute(
+            "SELECT created_at FROM channel_messages WHERE id = ?",
+            (message_id,)
+        )
+        timestamp = cursor.fetchone()['created_at']
+        
+        if resolved:
+            link_attachments(cursor, 'channel', message_id, resolved)
+        
+        # Keep the conversation list in step with the new message
+        record_channel_message(cursor, channel_id, sender_id, message_id, message, timestamp)
+        
+        return {
+            "success": True,
+            "message": "Message sent!",
+            "timestamp": timestamp,
+            "attachments": resolved
+        }
+    
+    try:
+        return run_write(write, PRIORITY_CHAT)
     except Exception as e:
         return {
             "success": False,
@@ -239,7 +271,9 @@ def get_channel_messages(channel_id: int, limit: int = 50) -> list:
             
             messages = cursor.fetchall()
             # Reverse to get chronological order
-            return [dict(msg) for msg in reversed(messages)]
+            history = [dict(msg) for msg in reversed(messages)]
+            load_message_attachments(cursor, 'channel', history)
+            return history
     except Exception as e:
         print(f"Error getting channel messages: {e}")
         return []
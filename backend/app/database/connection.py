@@ -1,19 +1,208 @@
-"""Database connection management"""
+"""Database connection management
+
+Reads and writes use separate connections:
+- Readers get one WAL-mode connection per thread via get_db_connection()
+- All mutations are funnelled through a single writer thread via run_write(),
+  so requests never fight each other for SQLite's write lock
+
+Several operations can share one transaction: read_transaction() gives the reads
+inside it one snapshot, run_write_batch() runs write operations as savepoints
+of a single write transaction (see /api/batch).
+"""
 import sqlite3
 import os
+import queue
+import itertools
+import threading
+import time
+from concurrent.futures import Future
 from contextlib import contextmanager
 
+from ..tracing import tracer, NO_SPAN
+from ..loop_monitor import loop_monitor
+
 # Get the database path - store it in the backend folder
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(os.path.dirname(BASE_DIR), "mini_discord.db")
 
+# Write priority classes - lower values are served first by the writer thread
+PRIORITY_CHAT = 0      # Chat message inserts
+PRIORITY_DEFAULT = 1   # Regular user actions (friends, servers, channels, status)
+PRIORITY_BULK = 2      # Bulk maintenance (purges, imports)
 
-@contextmanager
-def get_db_connection():
-    """Context manager for database connections"""
+# How long a connection waits on a lock before raising "database is locked"
+BUSY_TIMEOUT_MS = 5000
+
+
+def _open_connection(read_only: bool = False) -> sqlite3.Connection:
+    """Open a connection configured for WAL mode"""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row  # Access columns by name
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+# One reader connection per thread (the event loop thread plus threadpool workers)
+_readers = threading.local()
+
+
+@contextmanager
+def get_db_connection():
+    """Context manager for read connections (nested uses share the outer one's transaction)"""
+    conn = getattr(_readers, "conn", None)
+    if conn is None:
+        conn = _open_connection(read_only=True)
+        _readers.conn = conn
+    depth = getattr(_readers, "depth", 0)
+    _readers.depth = depth + 1
+    if depth == 0 and loop_monitor.debug:
+        loop_monitor.flag_sync_io("db.read")
+    # Traced as one read, named after the operation that opened it
+    span = tracer.span(f"db.read {tracer.caller_name(3)}", "db") if depth == 0 and tracer.active() else NO_SPAN
     try:
         yield conn
     finally:
-        conn.close()
+        _readers.depth = depth
+        # Never leave a read snapshot open between requests
+        if depth == 0 and conn.in_transaction:
+            conn.rollback()
+        span.end()
+
+
+@contextmanager
+def read_transaction():
+    """Run several read operations against one consistent snapshot"""
+    with get_db_connection() as conn:
+        conn.execute("BEGIN")
+        yield conn
+
+
+class DatabaseWriter:
+    """Single thread owning the only write connection
+
+    Jobs are callables taking the write connection. Each job runs in its own
+    BEGIN IMMEDIATE transaction: committed if it returns, rolled back if it raises.
+    A job that calls run_write() itself runs the inner job as a savepoint of its
+    own transaction.
+    """
+
+    def __init__(self):
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()  # FIFO order within a priority class
+        self._thread = None
+        self._conn = None  # the writer thread's connection
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Start the writer thread on first use"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, job, priority: int = PRIORITY_DEFAULT) -> Future:
+        """Queue a write job and return a future for its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((priority, next(self._sequence), job, future))
+        return future
+
+    def execute(self, job, priority: int = PRIORITY_DEFAULT):
+        """Queue a write job and wait for its result"""
+        if threading.current_thread() is self._thread:
+            return self._execute_nested(job)
+        return self.submit(job, priority).result()
+
+    def _execute_nested(self, job):
+        """Run a job inside the running one - rolled back on its own if it raises"""
+        conn = self._conn
+        conn.execute("SAVEPOINT nested_write")
+        try:
+            result = job(conn)
+        except BaseException:
+            conn.execute("ROLLBACK TO nested_write")
+            conn.execute("RELEASE nested_write")
+            raise
+        conn.execute("RELEASE nested_write")
+        return result
+
+    def stop(self):
+        """Drain the queue and stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            # Stop marker sorts after every real job
+            self._queue.put((float("inf"), next(self._sequence), None, None))
+            thread.join()
+
+    def _run(self):
+        conn = self._conn = _open_connection()
+        conn.isolation_level = None  # Transactions are managed explicitly below
+        try:
+            while True:
+                _, _, job, future = self._queue.get()
+                if job is None:
+                    break
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    result = job(conn)
+                    conn.execute("COMMIT")
+                except BaseException as e:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            conn.close()
+
+
+writer = DatabaseWriter()
+
+
+def run_write(job, priority: int = PRIORITY_DEFAULT):
+    """Run job(conn) on the writer thread inside a transaction and return its result"""
+    if loop_monitor.debug:
+        loop_monitor.flag_sync_io("db.write")
+    if not tracer.active():
+        return writer.execute(job, priority)
+
+    # Traced: how long the job waited behind other writes, then ran
+    with tracer.span(f"db.write {job.__qualname__.split('.')[0]}", "db", priority=priority) as span:
+        queued_at = time.perf_counter()
+
+        def timed_job(conn):
+            span.args["queued_ms"] = round((time.perf_counter() - queued_at) * 1000, 3)
+            return job(conn)
+
+        return writer.execute(timed_job, priority)
+
+
+def run_write_batch(operations: list, priority: int = PRIORITY_DEFAULT) -> list:
+    """
+    Run several write operations in one transaction and return their results
+    operations are zero-argument callables that use run_write() themselves, e.g.
+    lambda: accept_friend_request(request_id, user_id). Each one runs in its own
+    savepoint: one that raises or returns {"success": False} is undone alone.
+    """
+    def write(conn):
+        results = []
+        for operation in operations:
+            conn.execute("SAVEPOINT batch_item")
+            try:
+                result = operation()
+            except Exception as e:
+                result = {"success": False, "message": str(e)}
+            if isinstance(result, dict) and result.get("success") is False:
+                conn.execute("ROLLBACK TO batch_item")
+            conn.execute("RELEASE batch_item")
+            results.append(result)
+        return results
+
+    return run_write(write, priority)
@@ -0,0 +1,220 @@
+"""Conversation list (read model) operations
+
+The conversations table holds one row per DM pair or channel with a preview of
+the latest message. conversation_members holds each participant's read marker.
+Both are maintained incrementally by save_message() and save_channel_message(),
+inside the same write transaction as the message insert.
+
+DMs have two members, so their unread counter is materialized on
+conversation_members. A channel can have thousands: a message only touches the
+conversation and the sender's row, and every other member's unread count is
+counted at read time from their read marker (idx_channel_messages_channel),
+capped at UNREAD_COUNT_LIMIT. Every member of a channel's server sees its
+channel conversations; a member without a row has read nothing yet, users
+joining a server get rows for its existing conversations, caught up.
+"""
+from .connection import get_db_connection, run_write
+
+# Characters of the latest message kept for the sidebar preview
+PREVIEW_LENGTH = 100
+
+# Channel unread counts stop at this many ("99+" in the sidebar)
+UNREAD_COUNT_LIMIT = 100
+
+
+def dm_conversation_key(user1_id: int, user2_id: int) -> int:
+    """
+    Canonical key of a DM pair, stored on messages.conversation_key: the lower user
+    id in the high 32 bits, the higher one in the low 32 bits. Derived from the pair
+    alone, so the bulk importer can name conversations before they have a row.
+    """
+    return (min(user1_id, user2_id) << 32) | max(user1_id, user2_id)
+
+
+def _touch_conversation(cursor, conversation_id: int, sender_id: int, message_id: int,
+                        message: str, timestamp: str):
+    """Store the latest message on a conversation and mark it read for the sender"""
+    cursor.execute("""
+        UPDATE conversations
+        SET last_message_id = ?, last_sender_id = ?, last_message_preview = ?, last_activity_at = ?
+        WHERE id = ?
+    """, (message_id, sender_id, message[:PREVIEW_LENGTH], timestamp, conversation_id))
+
+    cursor.execute("""
+        INSERT INTO conversation_members (conversation_id, user_id, unread_count, last_read_message_id, last_activity_at)
+        VALUES (?, ?, 0, ?, ?)
+        ON CONFLICT(conversation_id, user_id) DO UPDATE SET
+            unread_count = 0,
+            last_read_message_id = excluded.last_read_message_id,
+            last_activity_at = excluded.last_activity_at
+    """, (conversation_id, sender_id, message_id, timestamp))
+
+
+def record_direct_message(cursor, sender_id: int, receiver_id: int, message_id: int,
+                          message: str, timestamp: str) -> int:
+    """Update the DM conversation for a new message (called inside the write transaction)"""
+    user1_id, user2_id = min(sender_id, receiver_id), max(sender_id, receiver_id)
+    cursor.execute(
+        "INSERT OR IGNORE INTO conversations (conversation_type, user1_id, user2_id) VALUES ('dm', ?, ?)",
+        (user1_id, user2_id)
+    )
+    cursor.execute(
+        "SELECT id FROM conversations WHERE user1_id = ? AND user2_id = ?",
+        (user1_id, user2_id)
+    )
+    conversation_id = cursor.fetchone()['id']
+
+    _touch_conversation(cursor, conversation_id, sender_id, message_id, message, timestamp)
+
+    if receiver_id != sender_id:
+        cursor.execute("""
+            INSERT INTO conversation_members (conversation_id, user_id, unread_count, last_activity_at)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT(conversation_id, user_id) DO UPDATE SET
+                unread_count = unread_count + 1,
+                last_activity_at = excluded.last_activity_at
+        """, (conversation_id, receiver_id, timestamp))
+
+    return conversation_id
+
+
+def record_channel_message(cursor, channel_id: int, sender_id: int, message_id: int,
+                           message: str, timestamp: str) -> int:
+    """Update the channel conversation for a new message (called inside the write transaction)"""
+    cursor.execute(
+        "INSERT OR IGNORE INTO conversations (conversation_type, channel_id) VALUES ('channel', ?)",
+        (channel_id,)
+    )
+    cursor.execute(
+        "SELECT id FROM conversations WHERE channel_id = ?",
+        (channel_id,)
+    )
+    conversation_id = cursor.fetchone()['id']
+
+    # Other members' unread counts are derived on read - nothing per member here
+    _touch_conversation(cursor, conversation_id, sender_id, message_id, message, timestamp)
+
+    return conversation_id
+
+
+def join_server_conversations(cursor, server_id: int, user_id: int):
+    """Add a new server member to the server's channel conversations, caught up (called inside the write transaction)"""
+    cursor.execute("""
+        INSERT OR IGNORE INTO conversation_members (conversation_id, user_id, last_read_message_id, last_activity_at)
+        SELECT c.id, ?, c.last_message_id, c.last_activity_at FROM conversations c
+        JOIN channels ch ON ch.id = c.channel_id
+        WHERE ch.server_id = ?
+    """, (user_id, server_id))
+
+
+def get_conversations(user_id: int, limit: int = 50) -> list:
+    """Get a user's conversations, most recently active first"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # DMs from the user's own rows, channels from their servers; unread counts
+            # of channels are counted only for the conversations on the page
+            cursor.execute("""
+                SELECT page.*,
+                       CASE WHEN page.conversation_type = 'channel' THEN (
+                           SELECT COUNT(*) FROM (
+                               SELECT 1 FROM channel_messages m
+                               WHERE m.channel_id = page.channel_id AND m.id > page.last_read_message_id
+                               LIMIT ?
+                           )
+                       ) ELSE page.dm_unread_count END AS unread_count,
+                       u.id as other_user_id, u.username as other_username,
+                       u.avatar as other_avatar, u.status as other_status
+                FROM (
+                    SELECT c.id, c.conversation_type, c.channel_id, c.user1_id, c.user2_id,
+                           c.last_message_id, c.last_sender_id, c.last_message_preview,
+                           cm.last_activity_at AS last_activity_at, cm.unread_count AS dm_unread_count,
+                           cm.last_read_message_id AS last_read_message_id,
+                           NULL AS channel_name, NULL AS server_id
+                    FROM conversation_members cm
+                    JOIN conversations c ON c.id = cm.conversation_id
+                    WHERE cm.user_id = ? AND c.conversation_type = 'dm'
+                    UNION ALL
+                    SELECT c.id, c.conversation_type, c.channel_id, c.user1_id, c.user2_id,
+                           c.last_message_id, c.last_sender_id, c.last_message_preview,
+                           c.last_activity_at, 0, COALESCE(cm.last_read_message_id, 0),
+                           ch.name, ch.server_id
+                    FROM server_members sm
+                    JOIN channels ch ON ch.server_id = sm.server_id
+                    JOIN conversations c ON c.channel_id = ch.id
+                    LEFT JOIN conversation_members cm ON cm.conversation_id = c.id AND cm.user_id = sm.user_id
+                    WHERE sm.user_id = ?
+                    ORDER BY last_activity_at DESC
+                    LIMIT ?
+                ) page
+                LEFT JOIN users u ON page.conversation_type = 'dm'
+                    AND u.id = CASE WHEN page.user1_id = ? THEN page.user2_id ELSE page.user1_id END
+                ORDER BY page.last_activity_at DESC
+            """, (UNREAD_COUNT_LIMIT, user_id, user_id, limit, user_id))
+
+            conversations = []
+            for row in cursor.fetchall():
+                conversation = dict(row)
+                for internal in ('user1_id', 'user2_id', 'dm_unread_count'):
+                    del conversation[internal]
+                conversations.append(conversation)
+            return conversations
+    except Exception as e:
+        print(f"Error getting conversations: {e}")
+        return []
+
+
+def mark_conversation_read(conversation_id: int, user_id: int) -> dict:
+    """Reset a user's unread counter and move their read marker to the latest message"""
+    def write(conn):
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "SELECT * FROM conversations WHERE id = ?",
+            (conversation_id,)
+        )
+        conversation = cursor.fetchone()
+
+        if not conversation:
+            return {
+                "success": False,
+                "message": "Conversation not found!"
+            }
+
+        # Only DM participants and members of the channel's server can read it
+        if conversation['conversation_type'] == 'dm':
+            allowed = user_id in (conversation['user1_id'], conversation['user2_id'])
+        else:
+            cursor.execute("""
+                SELECT sm.id FROM server_members sm
+                JOIN channels ch ON ch.server_id = sm.server_id
+                WHERE ch.id = ? AND sm.user_id = ?
+            """, (conversation['channel_id'], user_id))
+            allowed = cursor.fetchone() is not None
+
+        if not allowed:
+            return {
+                "success": False,
+                "message": "You are not part of this conversation!"
+            }
+
+        cursor.execute("""
+            INSERT INTO conversation_members (conversation_id, user_id, unread_count, last_read_message_id, last_activity_at)
+            VALUES (?, ?, 0, ?, ?)
+            ON CONFLICT(conversation_id, user_id) DO UPDATE SET
+                unread_count = 0,
+                last_read_message_id = excluded.last_read_message_id
+        """, (conversation_id, user_id, conversation['last_message_id'] or 0, conversation['last_activity_at']))
+
+        return {
+            "success": True,
+            "message": "Conversation marked as read!"
+        }
+
+    try:
+        return run_write(write)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error marking conversation as read: {str(e)}"
+        }
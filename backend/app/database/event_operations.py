@@ -0,0 +1,85 @@
+"""Per-user event log operations (reliable delivery / reconnect replay)"""
+import json
+from .connection import get_db_connection, run_write
+
+# Events kept in the database per user - older ones require a full resync
+STORED_EVENTS_PER_USER = 1000
+
+
+def save_user_events(events: list) -> dict:
+    """Persist a batch of (user_id, seq, event) tuples in one transaction"""
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO user_events (user_id, seq, payload) VALUES (?, ?, ?)",
+            [(user_id, seq, json.dumps(event)) for user_id, seq, event in events]
+        )
+
+        # Keep only the newest events of each user in this batch
+        newest = {}
+        for user_id, seq, _ in events:
+            newest[user_id] = max(seq, newest.get(user_id, 0))
+        cursor.executemany(
+            "DELETE FROM user_events WHERE user_id = ? AND seq <= ?",
+            [(user_id, seq - STORED_EVENTS_PER_USER) for user_id, seq in newest.items()]
+        )
+
+        return {
+            "success": True,
+            "message": f"Saved {len(events)} events"
+        }
+
+    try:
+        return run_write(write)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error saving events: {str(e)}"
+        }
+
+
+def get_last_event_seq(user_id: int) -> int:
+    """
+    Get the highest event sequence number stored for a user
+    Errors are raised, not turned into 0: the event log would restart the user's
+    sequence at 1 and the events reusing stored seqs would be dropped on insert
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT MAX(seq) as seq FROM user_events WHERE user_id = ?",
+            (user_id,)
+        )
+        row = cursor.fetchone()
+        return row['seq'] or 0
+
+
+def get_last_event_seqs(user_ids: list) -> dict:
+    """get_last_event_seq() for many users in one query - user_id -> seq, users without events are left out (raises on errors)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT user_id, MAX(seq) as seq FROM user_events
+            WHERE user_id IN (SELECT value FROM json_each(?))
+            GROUP BY user_id
+        """, (json.dumps(list(user_ids)),))
+        return {row['user_id']: row['seq'] for row in cursor.fetchall()}
+
+
+def get_user_events_after(user_id: int, after_seq: int, limit: int = STORED_EVENTS_PER_USER) -> list:
+    """Get a user's stored events with seq > after_seq, oldest first"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT payload FROM user_events
+                WHERE user_id = ? AND seq > ?
+                ORDER BY seq ASC
+                LIMIT ?
+            """, (user_id, after_seq, limit))
+
+            events = cursor.fetchall()
+            return [json.loads(event['payload']) for event in events]
+    except Exception as e:
+        print(f"Error getting user events: {e}")
+        return []
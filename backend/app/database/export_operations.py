@@ -0,0 +1,76 @@
+"""Chat history export operations
+
+The iterators yield history in fixed-size chunks using keyset pagination on the
+message id (created_at and id for DMs, which imports can append out of id order).
+Each chunk is read with its own short query, so no read snapshot or
+cursor is held between chunks and memory stays constant regardless of history size.
+"""
+from .connection import get_db_connection
+from .conversation_operations import dm_conversation_key
+
+# Rows fetched per query while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+
+def iter_direct_messages(user1_id: int, user2_id: int, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield the full DM history between two users in chunks, oldest first"""
+    conversation_key = dm_conversation_key(user1_id, user2_id)
+    last_created_at, last_id = "", 0
+    while True:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT m.id, m.sender_id, sender.username as sender_username,
+                       m.receiver_id, m.message, m.created_at
+                FROM messages m
+                JOIN users sender ON m.sender_id = sender.id
+                WHERE m.conversation_key = ? AND (m.created_at, m.id) > (?, ?)
+                ORDER BY m.created_at ASC, m.id ASC
+                LIMIT ?
+            """, (conversation_key, last_created_at, last_id, chunk_size))
+            rows = cursor.fetchall()
+
+        if not rows:
+            return
+        yield [dict(row) for row in rows]
+        last_created_at, last_id = rows[-1]['created_at'], rows[-1]['id']
+
+
+def iter_channel_messages(channel_id: int, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield the full history of a channel in chunks, oldest first"""
+    last_id = 0
+    while True:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT cm.id, cm.channel_id, cm.sender_id, u.username as sender_username,
+                       cm.message, cm.created_at
+                FROM channel_messages cm
+                JOIN users u ON cm.sender_id = u.id
+                WHERE cm.channel_id = ? AND cm.id > ?
+                ORDER BY cm.id ASC
+                LIMIT ?
+            """, (channel_id, last_id, chunk_size))
+            rows = cursor.fetchall()
+
+        if not rows:
+            return
+        yield [dict(row) for row in rows]
+        last_id = rows[-1]['id']
+
+
+def iter_server_messages(server_id: int, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield the history of every channel in a server in chunks, channel by channel"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, name FROM channels WHERE server_id = ? ORDER BY id ASC",
+            (server_id,)
+        )
+        channels = [dict(channel) for channel in cursor.fetchall()]
+
+    for channel in channels:
+        for chunk in iter_channel_messages(channel['id'], chunk_size):
+            for row in chunk:
+                row['channel_name'] = channel['name']
+            yield chunk
@@ -1,71 +1,82 @@
 """Friend-related database operations"""
-from .connection import get_db_connection
+from .connection import get_db_connection, run_write
+from .outbox_operations import enqueue_notifications
 
 
 def send_friend_request(sender_id: int, receiver_username: str) -> dict:
     """Send a friend request to another user"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get receiver by username
-            cursor.execute(
-                "SELECT id FROM users WHERE username = ?",
-                (receiver_username,)
-            )
-            receiver = cursor.fetchone()
-            
-            if not receiver:
-                return {
-                    "success": False,
-                    "message": "User not found!"
-                }
-            
-            receiver_id = receiver['id']
-            
-            # Can't send request to yourself
-            if sender_id == receiver_id:
-                return {
-                    "success": False,
-                    "message": "You can't add yourself as a friend!"
-                }
-            
-            # Check if already friends
-            cursor.execute(
-                "SELECT id FROM friendships WHERE (user1_id = ? AND user2_id = ?) OR (user1_id = ? AND user2_id = ?)",
-                (sender_id, receiver_id, receiver_id, sender_id)
-            )
-            if cursor.fetchone():
-                return {
-                    "success": False,
-                    "message": "You are already friends!"
-                }
-            
-            # Check for pending request
-            cursor.execute(
-                "SELECT id FROM friend_requests WHERE sender_id = ? AND receiver_id = ? AND status = 'pending'",
-                (sender_id, receiver_id)
-            )
-            if cursor.fetchone():
-                return {
-                    "success": False,
-                    "message": "Friend request already sent!"
-                }
-            
-            # Send request
-            cursor.execute(
-                "INSERT INTO friend_requests (sender_id, receiver_id) VALUES (?, ?)",
-                (sender_id, receiver_id)
-            )
-            request_id = cursor.lastrowid
-            conn.commit()
-            
+    def write(conn):
+        cursor = conn.cursor()
+        
+        # Get receiver by username
+        cursor.execute(
+            "SELECT id FROM users WHERE username = ?",
+            (receiver_username,)
+        )
+        receiver = cursor.fetchone()
+        
+        if not receiver:
+            return {
+                "success": False,
+                "message": "User not found!"
+            }
+        
+        receiver_id = receiver['id']
+        
+        # Can't send request to yourself
+        if sender_id == receiver_id:
+            return {
+                "success": False,
+                "message": "You can't add yourself as a friend!"
+            }
+        
+        # Check if already friends
+        cursor.execute(
+            "SELECT id FROM friendships WHERE (user1_id = ? AND user2_id = ?) OR (user1_id = ? AND user2_id = ?)",
+            (sender_id, receiver_id, receiver_id, sender_id)
+        )
+        if cursor.fetchone():
+            return {
+                "success": False,
+                "message": "You are already friends!"
+            }
+        
+        # Check for pending request
+        cursor.execute(
+            "SELECT id FROM friend_requests WHERE sender_id = ? AND receiver_id = ? AND status = 'pending'",
+            (sender_id, receiver_id)
+        )
+        if cursor.fetchone():
             return {
-                "success": True,
-                "message": f"Friend request sent to {receiver_username}!",
-                "receiver_id": receiver_id,
-                "request_id": request_id
+                "success": False,
+                "message": "Friend request already sent!"
             }
+        
+        # Send request
+        cursor.execute(
+            "INSERT INTO friend_requests (sender_id, receiver_id) VALUES (?, ?)",
+            (sender_id, receiver_id)
+        )
+        request_id = cursor.lastrowid
+        
+        # Notify the receiver (delivered by the outbox dispatcher after the commit)
+        cursor.execute("SELECT username FROM users WHERE id = ?", (sender_id,))
+        enqueue_notifications(cursor, [(receiver_id, {
+            'type': 'new-friend-request',
+            'from_user_id': sender_id,
+            'from_username': cursor.fetchone()['username'],
+            'request_id': request_id
+        })])
+        
+        return {
+            "success": True,
+            "message": f"Friend request sent to {receiver_username}!",
+            "receiver_id": receiver_id,
+            "request_id": request_id
+        }
+    
+    try:
+        return run_write(write)
     except Exception as e:
         return {
             "success": False,
@@ -95,45 +106,54 @@ def get_pending_friend_requests(user_id: int) -> list:
 
 def accept_friend_request(request_id: int, user_id: int) -> dict:
     """Accept a friend request"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get request details
-            cursor.execute(
-                "SELECT sender_id, receiver_id FROM friend_requests WHERE id = ? AND receiver_id = ? AND status = 'pending'",
-                (request_id, user_id)
-            )
-            request = cursor.fetchone()
-            
-            if not request:
-                return {
-                    "success": False,
-                    "message": "Friend request not found or already processed!"
-                }
-            
-            sender_id = request['sender_id']
-            receiver_id = request['receiver_id']
-            
-            # Create friendship
-            cursor.execute(
-                "INSERT INTO friendships (user1_id, user2_id) VALUES (?, ?)",
-                (sender_id, receiver_id)
-            )
-            
-            # Update request status
-            cursor.execute(
-                "UPDATE friend_requests SET status = 'accepted' WHERE id = ?",
-                (request_id,)
-            )
-            
-            conn.commit()
-            
+    def write(conn):
+        cursor = conn.cursor()
+        
+        # Get request details
+        cursor.execute(
+            "SELECT sender_id, receiver_id FROM friend_requests WHERE id = ? AND receiver_id = ? AND status = 'pending'",
+            (request_id, user_id)
+        )
+        request = cursor.fetchone()
+        
+        if not request:
             return {
-                "success": True,
-                "message": "Friend request accepted!",
-                "requester_id": sender_id
+                "success": False,
+                "message": "Friend request not found or already processed!"
             }
+        
+        sender_id = request['sender_id']
+        receiver_id = request['receiver_id']
+        
+        # Create friendship
+        cursor.execute(
+            "INSERT INTO friendships (user1_id, user2_id) VALUES (?, ?)",
+            (sender_id, receiver_id)
+        )
+        
+        # Update request status
+        cursor.execute(
+            "UPDATE friend_requests SET status = 'accepted' WHERE id = ?",
+            (request_id,)
+        )
+        
+        # Notify the requester
+        cursor.execute("SELECT username FROM users WHERE id = ?", (receiver_id,))
+        enqueue_notifications(cursor, [(sender_id, {
+            'type': 'friend-request-accepted',
+            'by_user_id': receiver_id,
+            'by_username': cursor.fetchone()['username'],
+            'request_id': request_id
+        })])
+        
+        return {
+            "success": True,
+            "message": "Friend request accepted!",
+            "requester_id": sender_id
+        }
+    
+    try:
+        return run_write(write)
     except Exception as e:
         return {
             "success": False,
@@ -143,27 +163,27 @@ def accept_friend_request(request_id: int, user_id: int) -> dict:
 
 def decline_friend_request(request_id: int, user_id: int) -> dict:
     """Decline a friend request"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "UPDATE friend_requests SET status = 'declined' WHERE id = ? AND receiver_id = ? AND status = 'pending'",
-                (request_id, user_id)
-            )
-            
-            if cursor.rowcount == 0:
-                return {
-                    "success": False,
-                    "message": "Friend request not found or already processed!"
-                }
-            
-            conn.commit()
-            
+    def write(conn):
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            "UPDATE friend_requests SET status = 'declined' WHERE id = ? AND receiver_id = ? AND status = 'pending'",
+            (request_id, user_id)
+        )
+        
+        if cursor.rowcount == 0:
             return {
-                "success": True,
-                "message": "Friend request declined!"
+                "success": False,
+                "message": "Friend request not found or already processed!"
             }
+        
+        return {
+            "success": True,
+            "message": "Friend request declined!"
+        }
+    
+    try:
+        return run_write(write)
     except Exception as e:
         return {
             "success": False,
@@ -215,3 +235,22 @@ def get_friends_with_status(user_id: int) -> list:
     except Exception as e:
         print(f"Error getting friends with status: {e}")
         return []
+
+
+def iter_friendships(chunk_size: int = 50_000):
+    """Yield every friendship as (user1_id, user2_id) tuples, in chunks (keyset pagination on id)"""
+    last_id = 0
+    while True:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None  # plain tuples - these run over every row of the table
+            cursor.execute(
+                "SELECT id, user1_id, user2_id FROM friendships WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, chunk_size)
+            )
+            rows = cursor.fetchall()
+        
+        if not rows:
+            return
+        yield [row[1:] for row in rows]
+        last_id = rows[-1][0]
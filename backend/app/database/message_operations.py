@@ -1,32 +1,53 @@
 """Message-related database operations"""
-from .connection import get_db_connection
+from typing import Optional
 
+from .connection import get_db_connection, run_write, PRIORITY_CHAT
+from .conversation_operations import record_direct_message, dm_conversation_key
+from .attachment_operations import resolve_attachments, link_attachments, load_message_attachments
 
-def save_message(sender_id: int, receiver_id: int, message: str) -> dict:
-    """Save a private message"""
+
+def save_message(sender_id: int, receiver_id: int, message: str, attachments: Optional[list] = None) -> dict:
+    """Save a private message, optionally with uploaded files ([{'id', 'filename'}])"""
+    def write(conn):
+        cursor = conn.cursor()
+        
+        resolved = []
+        if attachments:
+            resolved = resolve_attachments(cursor, attachments)
+            if resolved is None:
+                return {
+                    "success": False,
+                    "message": "Invalid attachments!"
+                }
+        
+        cursor.execute(
+            "INSERT INTO messages (sender_id, receiver_id, conversation_key, message) VALUES (?, ?, ?, ?)",
+            (sender_id, receiver_id, dm_conversation_key(sender_id, receiver_id), message)
+        )
+        message_id = cursor.lastrowid
+        
+        # Get the timestamp
+        cursor.execute(
+            "SELECT created_at FROM messages WHERE id = ?",
+            (message_id,)
+        )
+        timestamp = cursor.fetchone()['created_at']
+        
+        if resolved:
+            link_attachments(cursor, 'dm', message_id, resolved)
+        
+        # Keep the conversation list in step with the new message
+        record_direct_message(cursor, sender_id, receiver_id, message_id, message, timestamp)
+        
+        return {
+            "success": True,
+            "message": "Message sent!",
+            "timestamp": timestamp,
+            "attachments": resolved
+        }
+    
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO messages (sender_id, receiver_id, message) VALUES (?, ?, ?)",
-                (sender_id, receiver_id, message)
-            )
-            message_id = cursor.lastrowid
-            
-            # Get the timestamp
-            cursor.execute(
-                "SELECT created_at FROM messages WHERE id = ?",
-                (message_id,)
-            )
-            timestamp = cursor.fetchone()['created_at']
-            
-            conn.commit()
-            
-            return {
-                "success": True,
-                "message": "Message sent!",
-                "timestamp": timestamp
-            }
+        return run_write(write, PRIORITY_CHAT)
     except Exception as e:
         return {
             "success": False,
@@ -48,15 +69,16 @@ def get_chat_history(user1_id: int, user2_id: int, limit: int = 50) -> list:
                 FROM messages m
                 JOIN users sender ON m.sender_id = sender.id
                 JOIN users receiver ON m.receiver_id = receiver.id
-                WHERE (m.sender_id = ? AND m.receiver_id = ?) 
-                   OR (m.sender_id = ? AND m.receiver_id = ?)
-                ORDER BY m.created_at DESC
+                WHERE m.conversation_key = ?
+                ORDER BY m.created_at DESC, m.id DESC
                 LIMIT ?
-            """, (user1_id, user2_id, user2_id, user1_id, limit))
+            """, (dm_conversation_key(user1_id, user2_id), limit))
             
             messages = cursor.fetchall()
             # Reverse to get chronological order (oldest first)
-            return [dict(msg) for msg in reversed(messages)]
+            history = [dict(msg) for msg in reversed(messages)]
+            load_message_attachments(cursor, 'dm', history)
+            return history
     except Exception as e:
         print(f"Error getting chat history: {e}")
         return []
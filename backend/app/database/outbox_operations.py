@@ -0,0 +1,73 @@
+"""Notification outbox operations
+
+A state change that someone has to be told about (a friend request, a server
+invite, ...) inserts its notifications into notification_outbox inside the
+same write transaction as the change itself: a committed change always has its
+notifications stored, a rolled back one never does. The dispatcher
+(app/outbox.py) reads the outbox in id order, hands every row to the user's
+event log and deletes the rows once the event log has stored them.
+"""
+import json
+
+from .connection import get_db_connection, run_write, PRIORITY_BULK
+
+
+def enqueue_notifications(cursor, notifications: list):
+    """Store (user_id, event) notifications - called inside the write transaction of the change"""
+    cursor.executemany(
+        "INSERT INTO notification_outbox (user_id, payload) VALUES (?, ?)",
+        [(user_id, json.dumps(event)) for user_id, event in notifications]
+    )
+
+
+def get_outbox_batch(after_id: int, limit: int) -> list:
+    """Get the next notifications to deliver, oldest first: [{'id', 'user_id', 'event'}]"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, user_id, payload FROM notification_outbox WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            )
+            return [
+                {"id": row['id'], "user_id": row['user_id'], "event": json.loads(row['payload'])}
+                for row in cursor.fetchall()
+            ]
+    except Exception as e:
+        print(f"Error reading notification outbox: {e}")
+        return []
+
+
+def delete_outbox_rows(up_to_id: int) -> dict:
+    """Delete delivered notifications (every id up to up_to_id)"""
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM notification_outbox WHERE id <= ?", (up_to_id,))
+
+        return {
+            "success": True,
+            "message": f"Deleted {cursor.rowcount} notifications",
+            "deleted": cursor.rowcount
+        }
+
+    try:
+        return run_write(write, PRIORITY_BULK)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error deleting notifications: {str(e)}",
+            "deleted": 0
+        }
+
+
+def get_outbox_backlog() -> dict:
+    """Get how many notifications are waiting and when the oldest was stored"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) AS pending, MIN(created_at) AS oldest FROM notification_outbox")
+            row = cursor.fetchone()
+            return {"pending": row['pending'], "oldest": row['oldest']}
+    except Exception as e:
+        print(f"Error reading notification outbox: {e}")
+        return {"pending": 0, "oldest": None}
@@ -0,0 +1,282 @@
+"""Retention policies and chunked purges
+
+Each table has a maximum age in days (None keeps rows forever). Servers can
+override the channel_messages policy for their own channels. Policies are stored
+in retention_policies; tables without a row there use DEFAULT_RETENTION_DAYS.
+
+Purges delete in small batches, one write transaction each, so the writer
+thread never holds SQLite's write lock for long and chat writes are served in
+between. The database uses auto_vacuum = INCREMENTAL: pages freed by a purge go
+to the freelist and reclaim_free_pages() returns them to the filesystem a few
+at a time.
+
+Messages are looked at in id order, a batch of rows per transaction, and the
+ones older than the cutoff are deleted - imported history can sit anywhere in
+id order. The latest message of a conversation is kept while it is still
+referenced by conversations.last_message_id (the sidebar preview), and unread DM
+messages that are purged are taken off the receiver's unread counter.
+"""
+import json
+import time
+from typing import Optional
+
+from .connection import get_db_connection, run_write, PRIORITY_BULK
+
+# Maximum age in days per table when no policy is stored (None keeps rows forever)
+DEFAULT_RETENTION_DAYS = {
+    "friend_requests": 30,     # accepted / declined requests only
+    "server_invites": 30,      # accepted / declined invites only
+    "messages": None,
+    "channel_messages": None,
+    "channel_members": 7,      # presence rows the voice state registry no longer owns
+}
+
+# Tables a server can set its own policy for
+SERVER_RETENTION_TABLES = ("channel_messages",)
+
+# message_attachments.message_type of each message table
+MESSAGE_TYPES = {"messages": "dm", "channel_messages": "channel"}
+
+# Rows deleted per write transaction
+DEFAULT_PURGE_BATCH = 500
+
+
+def get_retention_policies() -> dict:
+    """Get the effective policies: {'tables': {table: days}, 'servers': {table: {server_id: days}}}"""
+    policies = {"tables": dict(DEFAULT_RETENTION_DAYS), "servers": {table: {} for table in SERVER_RETENTION_TABLES}}
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT table_name, server_id, max_age_days FROM retention_policies")
+            for row in cursor.fetchall():
+                if row['table_name'] not in DEFAULT_RETENTION_DAYS:
+                    continue
+                if row['server_id']:
+                    policies["servers"].setdefault(row['table_name'], {})[row['server_id']] = row['max_age_days']
+                else:
+                    policies["tables"][row['table_name']] = row['max_age_days']
+    except Exception as e:
+        print(f"Error getting retention policies: {e}")
+    return policies
+
+
+def set_retention_policy(table_name: str, max_age_days: Optional[int], server_id: Optional[int] = None,
+                         user_id: Optional[int] = None) -> dict:
+    """
+    Set how many days rows of a table are kept (None keeps them forever)
+    With server_id the policy only covers that server's channels and user_id must own the server
+    """
+    if table_name not in DEFAULT_RETENTION_DAYS:
+        return {"success": False, "message": "Unknown table!"}
+    if server_id is not None and table_name not in SERVER_RETENTION_TABLES:
+        return {"success": False, "message": "This table has no per-server policy!"}
+    if max_age_days is not None and max_age_days < 1:
+        return {"success": False, "message": "Retention must be at least one day!"}
+
+    def write(conn):
+        cursor = conn.cursor()
+
+        if server_id is not None:
+            cursor.execute("SELECT owner_id FROM servers WHERE id = ?", (server_id,))
+            server = cursor.fetchone()
+            if not server:
+                return {"success": False, "message": "Server not found!"}
+            if server['owner_id'] != user_id:
+                return {"success": False, "message": "Only server owner can change retention!"}
+
+        cursor.execute("""
+            INSERT INTO retention_policies (table_name, server_id, max_age_days) VALUES (?, ?, ?)
+            ON CONFLICT (table_name, server_id) DO UPDATE SET max_age_days = excluded.max_age_days
+        """, (table_name, server_id or 0, max_age_days))
+
+        return {
+            "success": True,
+            "message": "Retention policy saved!"
+        }
+
+    try:
+        return run_write(write)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error saving retention policy: {str(e)}"
+        }
+
+
+def get_retention_channels() -> list:
+    """Get (channel_id, server_id) of every channel, for per-server channel_messages purges"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, server_id FROM channels ORDER BY id")
+            return [(row['id'], row['server_id']) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error getting channels: {e}")
+        return []
+
+
+def _expired_ids(cursor, table_name: str, cutoff: str, after_id: int, batch_size: int,
+                 channel_id: Optional[int], keep: frozenset) -> tuple:
+    """
+    Find the next batch of expired row ids after after_id
+    Returns (ids to delete, last id looked at, whether the table is done)
+    """
+    if table_name in ("friend_requests", "server_invites"):
+        cursor.execute(f"""
+            SELECT id FROM {table_name}
+            WHERE id > ? AND status != 'pending' AND created_at < datetime('now', ?)
+            ORDER BY id LIMIT ?
+        """, (after_id, cutoff, batch_size))
+        ids = [row['id'] for row in cursor.fetchall()]
+        return ids, ids[-1] if ids else after_id, len(ids) < batch_size
+
+    if table_name == "channel_members":
+        cursor.execute("""
+            SELECT id, user_id, channel_id FROM channel_members
+            WHERE id > ? AND joined_at < datetime('now', ?)
+            ORDER BY id LIMIT ?
+        """, (after_id, cutoff, batch_size))
+        rows = cursor.fetchall()
+        ids = [row['id'] for row in rows if (row['user_id'], row['channel_id']) not in keep]
+        return ids, rows[-1]['id'] if rows else after_id, len(rows) < batch_size
+
+    # Messages - skip the latest message of each conversation, the sidebar shows it
+    if table_name == "channel_messages":
+        cursor.execute("""
+            SELECT id, created_at < datetime('now', ?) AS expired FROM channel_messages
+            WHERE channel_id = ? AND id > ?
+            ORDER BY id LIMIT ?
+        """, (cutoff, channel_id, after_id, batch_size))
+        rows = cursor.fetchall()
+        cursor.execute("SELECT last_message_id FROM conversations WHERE channel_id = ?", (channel_id,))
+    else:
+        cursor.execute("""
+            SELECT id, created_at < datetime('now', ?) AS expired FROM messages
+            WHERE id > ?
+            ORDER BY id LIMIT ?
+        """, (cutoff, after_id, batch_size))
+        rows = cursor.fetchall()
+        cursor.execute("""
+            SELECT last_message_id FROM conversations
+            WHERE conversation_type = 'dm' AND last_message_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps([row['id'] for row in rows if row['expired']]),))
+    referenced = {row['last_message_id'] for row in cursor.fetchall()}
+    ids = [row['id'] for row in rows if row['expired'] and row['id'] not in referenced]
+    return ids, rows[-1]['id'] if rows else after_id, len(rows) < batch_size
+
+
+def _release_dm_unread(cursor, ids: list):
+    """Take purged DM messages the receiver has not read off their unread counter"""
+    cursor.execute("""
+        SELECT cm.conversation_id, cm.user_id, COUNT(*) AS unread
+        FROM messages m
+        JOIN conversations c ON c.user1_id = m.conversation_key >> 32 AND c.user2_id = m.conversation_key & 4294967295
+        JOIN conversation_members cm ON cm.conversation_id = c.id AND cm.user_id = m.receiver_id
+        WHERE m.id IN (SELECT value FROM json_each(?))
+        AND m.sender_id != m.receiver_id AND m.id > cm.last_read_message_id
+        GROUP BY cm.conversation_id, cm.user_id
+    """, (json.dumps(ids),))
+    cursor.executemany("""
+        UPDATE conversation_members SET unread_count = MAX(0, unread_count - ?)
+        WHERE conversation_id = ? AND user_id = ?
+    """, [(row['unread'], row['conversation_id'], row['user_id']) for row in cursor.fetchall()])
+
+
+def purge_expired_rows(table_name: str, max_age_days: int, after_id: int = 0,
+                       batch_size: int = DEFAULT_PURGE_BATCH, channel_id: Optional[int] = None,
+                       keep: frozenset = frozenset()) -> dict:
+    """
+    Delete one batch of rows older than max_age_days, in one short write transaction
+    Call again with the returned last_id until done is True. channel_messages are
+    purged one channel at a time (channel_id); keep lists (user_id, channel_id)
+    channel_members rows that are still in use.
+    """
+    if table_name not in DEFAULT_RETENTION_DAYS:
+        return {"success": False, "message": "Unknown table!", "deleted": 0, "done": True}
+    cutoff = f"-{int(max_age_days)} days"
+
+    def write(conn):
+        start = time.perf_counter()
+        cursor = conn.cursor()
+
+        ids, last_id, done = _expired_ids(cursor, table_name, cutoff, after_id, batch_size, channel_id, keep)
+        if table_name == "messages" and ids:
+            _release_dm_unread(cursor, ids)
+        cursor.executemany(f"DELETE FROM {table_name} WHERE id = ?", [(row_id,) for row_id in ids])
+        if table_name in MESSAGE_TYPES:
+            cursor.executemany(
+                "DELETE FROM message_attachments WHERE message_type = ? AND message_id = ?",
+                [(MESSAGE_TYPES[table_name], row_id) for row_id in ids]
+            )
+
+        return {
+            "success": True,
+            "message": f"Deleted {len(ids)} rows from {table_name}",
+            "deleted": len(ids),
+            "last_id": last_id,
+            "done": done,
+            "hold_seconds": time.perf_counter() - start
+        }
+
+    try:
+        return run_write(write, PRIORITY_BULK)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error purging {table_name}: {str(e)}",
+            "deleted": 0,
+            "done": True
+        }
+
+
+def reclaim_free_pages(max_pages: int) -> dict:
+    """Return up to max_pages free pages to the filesystem (PRAGMA incremental_vacuum)"""
+    def write(conn):
+        start = time.perf_counter()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # The module only steps a PRAGMA once and each step frees one page
+        for _ in range(min(max_pages, free_before)):
+            conn.execute("PRAGMA incremental_vacuum(1)")
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return {
+            "success": True,
+            "message": f"Reclaimed {free_before - free_after} pages",
+            "pages": free_before - free_after,
+            "bytes": (free_before - free_after) * page_size,
+            "free_pages": free_after,
+            "hold_seconds": time.perf_counter() - start
+        }
+
+    try:
+        return run_write(write, PRIORITY_BULK)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error reclaiming pages: {str(e)}",
+            "pages": 0,
+            "bytes": 0,
+            "free_pages": 0
+        }
+
+
+def get_storage_stats() -> dict:
+    """Get the database file's page counts and auto_vacuum mode"""
+    try:
+        with get_db_connection() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            return {
+                "page_size": page_size,
+                "page_count": page_count,
+                "free_pages": free_pages,
+                "size_bytes": page_count * page_size,
+                "free_bytes": free_pages * page_size,
+                "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(auto_vacuum, auto_vacuum)
+            }
+    except Exception as e:
+        print(f"Error getting storage stats: {e}")
+        return {}
@@ -1,6 +1,10 @@
 """Database schemas and initialization"""
 import sqlite3
 from .connection import DB_PATH
+from .conversation_operations import PREVIEW_LENGTH
+
+# Messages updated per transaction by the conversation_key backfill
+BACKFILL_BATCH = 50_000
 
 
 def init_database():
@@ -8,15 +12,31 @@ def init_database():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # Pages freed by retention purges are reclaimed gradually (see retention_operations.py)
+    cursor.execute("PRAGMA auto_vacuum")
+    if cursor.fetchone()[0] != 2:
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master")
+        if cursor.fetchone()[0]:
+            # An existing database only changes mode when it is rebuilt (one-off)
+            print("Enabling incremental auto-vacuum (rebuilding the database file)...")
+            cursor.execute("VACUUM")
+            print("Migration completed!")
+    
+    # WAL lets readers run alongside the writer thread (persisted in the database file)
+    cursor.execute("PRAGMA journal_mode = WAL")
+    
     # Migration: Add channel_type column if it doesn't exist
     try:
         cursor.execute("SELECT channel_type FROM channels LIMIT 1")
     except sqlite3.OperationalError:
-        # Column doesn't exist, add it
-        print("Adding channel_type column to channels table...")
-        cursor.execute("ALTER TABLE channels ADD COLUMN channel_type TEXT NOT NULL DEFAULT 'voice'")
-        conn.commit()
-        print("Migration completed!")
+        # Column doesn't exist, add it (a brand new database gets it from CREATE TABLE below)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'channels'")
+        if cursor.fetchone():
+            print("Adding channel_type column to channels table...")
+            cursor.execute("ALTER TABLE channels ADD COLUMN channel_type TEXT NOT NULL DEFAULT 'voice'")
+            conn.commit()
+            print("Migration completed!")
     
     # Create users table with new fields
     cursor.execute("""
@@ -64,6 +84,7 @@ def init_database():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             sender_id INTEGER NOT NULL,
             receiver_id INTEGER NOT NULL,
+            conversation_key INTEGER,
             message TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (sender_id) REFERENCES users(id),
@@ -71,6 +92,22 @@ def init_database():
         )
     """)
     
+    # Migration: Add conversation_key (see dm_conversation_key()) and fill it in for existing messages
+    cursor.execute("PRAGMA table_info(messages)")
+    if "conversation_key" not in [column[1] for column in cursor.fetchall()]:
+        print("Adding conversation_key column to messages table...")
+        cursor.execute("ALTER TABLE messages ADD COLUMN conversation_key INTEGER")
+        conn.commit()
+    backfill_conversation_keys(conn)
+    
+    # DM history is read per conversation in time order - imported history can have
+    # higher ids than newer local messages, so the id alone does not sort it
+    cursor.execute("DROP INDEX IF EXISTS idx_messages_conversation")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation_time
+        ON messages(conversation_key, created_at, id)
+    """)
+    
     # Create servers table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS servers (
@@ -150,6 +187,191 @@ def init_database():
         )
     """)
     
+    # Channel history is always read per channel in id order
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_channel_messages_channel
+        ON channel_messages(channel_id, id)
+    """)
+    
+    # Conversation list read model (see conversation_operations.py)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'conversations'")
+    backfill_conversations = cursor.fetchone() is None
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_type TEXT NOT NULL,
+            user1_id INTEGER,
+            user2_id INTEGER,
+            channel_id INTEGER,
+            last_message_id INTEGER,
+            last_sender_id INTEGER,
+            last_message_preview TEXT,
+            last_activity_at TIMESTAMP,
+            FOREIGN KEY (user1_id) REFERENCES users(id),
+            FOREIGN KEY (user2_id) REFERENCES users(id),
+            FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE CASCADE,
+            UNIQUE(user1_id, user2_id),
+            UNIQUE(channel_id)
+        )
+    """)
+    
+    # Per-user unread counter and read marker for each conversation
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_members (
+            conversation_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            last_read_message_id INTEGER NOT NULL DEFAULT 0,
+            last_activity_at TIMESTAMP,
+            PRIMARY KEY (conversation_id, user_id),
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    
+    # Serves the sidebar: one user's conversations already sorted by activity
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversation_members_activity
+        ON conversation_members(user_id, last_activity_at DESC)
+    """)
+    
+    # Per-user event log for reconnect replay (see event_operations.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_events (
+            user_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, seq)
+        ) WITHOUT ROWID
+    """)
+    
+    # Uploaded files, one row per distinct content (see attachment_operations.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            id TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    """)
+    
+    # Files sent with a message - message_type is 'dm' (messages) or 'channel' (channel_messages)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS message_attachments (
+            message_type TEXT NOT NULL,
+            message_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            attachment_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            PRIMARY KEY (message_type, message_id, position),
+            FOREIGN KEY (attachment_id) REFERENCES attachments(id)
+        ) WITHOUT ROWID
+    """)
+    
+    # Download access checks and the unlinked file sweep look files up by id
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_message_attachments_attachment
+        ON message_attachments(attachment_id)
+    """)
+    
+    # Notifications waiting for the dispatcher (see outbox_operations.py)
+    # AUTOINCREMENT: ids must never be reused, the dispatcher reads by id > last delivered
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Retention policy overrides (see retention_operations.py) - server_id 0 is the table default
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS retention_policies (
+            table_name TEXT NOT NULL,
+            server_id INTEGER NOT NULL DEFAULT 0,
+            max_age_days INTEGER,
+            PRIMARY KEY (table_name, server_id)
+        )
+    """)
+    
+    if backfill_conversations:
+        print("Building conversations from existing messages...")
+        backfill_conversation_list(cursor)
+        print("Migration completed!")
+    
     conn.commit()
     conn.close()
     print(f"Database initialized at: {DB_PATH}")
+
+
+def backfill_conversation_keys(conn):
+    """Set conversation_key on messages that have none, one committed batch at a time (resumable)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(id), MAX(id) FROM messages WHERE conversation_key IS NULL")
+    first_id, last_id = cursor.fetchone()
+    if first_id is None:
+        return
+    
+    print("Backfilling messages.conversation_key...")
+    for start in range(first_id, last_id + 1, BACKFILL_BATCH):
+        cursor.execute("""
+            UPDATE messages
+            SET conversation_key = (MIN(sender_id, receiver_id) << 32) | MAX(sender_id, receiver_id)
+            WHERE id >= ? AND id < ? AND conversation_key IS NULL
+        """, (start, start + BACKFILL_BATCH))
+        conn.commit()
+    print("Migration completed!")
+
+
+def backfill_conversation_list(cursor):
+    """Build the conversation list from existing messages (one-off migration)
+
+    Existing messages are treated as read, so every unread counter starts at 0.
+    """
+    cursor.execute("""
+        INSERT INTO conversations (conversation_type, user1_id, user2_id, last_message_id)
+        SELECT 'dm', conversation_key >> 32, conversation_key & 4294967295, (
+            SELECT id FROM messages latest WHERE latest.conversation_key = pairs.conversation_key
+            ORDER BY created_at DESC, id DESC LIMIT 1
+        )
+        FROM (SELECT DISTINCT conversation_key FROM messages) pairs
+    """)
+    cursor.execute("""
+        UPDATE conversations
+        SET (last_sender_id, last_message_preview, last_activity_at) = (
+            SELECT sender_id, substr(message, 1, ?), created_at FROM messages WHERE id = last_message_id
+        )
+        WHERE conversation_type = 'dm'
+    """, (PREVIEW_LENGTH,))
+    cursor.execute("""
+        INSERT INTO conversation_members (conversation_id, user_id, last_read_message_id, last_activity_at)
+        SELECT id, user1_id, last_message_id, last_activity_at FROM conversations WHERE conversation_type = 'dm'
+        UNION
+        SELECT id, user2_id, last_message_id, last_activity_at FROM conversations WHERE conversation_type = 'dm'
+    """)
+    
+    # Channel conversations - every member of the channel's server is a participant
+    cursor.execute("""
+        INSERT INTO conversations (conversation_type, channel_id, last_message_id)
+        SELECT 'channel', channel_id, MAX(id)
+        FROM channel_messages
+        GROUP BY channel_id
+    """)
+    cursor.execute("""
+        UPDATE conversations
+        SET (last_sender_id, last_message_preview, last_activity_at) = (
+            SELECT sender_id, substr(message, 1, ?), created_at FROM channel_messages WHERE id = last_message_id
+        )
+        WHERE conversation_type = 'channel'
+    """, (PREVIEW_LENGTH,))
+    cursor.execute("""
+        INSERT INTO conversation_members (conversation_id, user_id, last_read_message_id, last_activity_at)
+        SELECT c.id, sm.user_id, c.last_message_id, c.last_activity_at
+        FROM conversations c
+        JOIN channels ch ON ch.id = c.channel_id
+        JOIN server_members sm ON sm.server_id = ch.server_id
+        WHERE c.conversation_type = 'channel'
+    """)
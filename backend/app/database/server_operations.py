@@ -1,47 +1,60 @@
 """Server-related database operations"""
-from .connection import get_db_connection
+import json
+
+from .connection import get_db_connection, run_write
+from .outbox_operations import enqueue_notifications
+from .conversation_operations import join_server_conversations
+
+# Users one bulk invite can cover
+MAX_BULK_INVITES = 1000
+
+# server_invites keeps one row per (server, user) - inviting again reopens a declined or accepted one
+REOPEN_INVITE = """
+    ON CONFLICT(server_id, to_user_id) DO UPDATE SET
+        status = 'pending', from_user_id = excluded.from_user_id, created_at = CURRENT_TIMESTAMP
+"""
 
 
 def create_server(name: str, owner_id: int) -> dict:
     """Create a new server"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if server name already exists
-            cursor.execute("SELECT id FROM servers WHERE name = ?", (name,))
-            if cursor.fetchone():
-                return {
-                    "success": False,
-                    "message": "Server name already exists!"
-                }
-            
-            # Create server
-            cursor.execute(
-                "INSERT INTO servers (name, owner_id) VALUES (?, ?)",
-                (name, owner_id)
-            )
-            server_id = cursor.lastrowid
-            
-            # Add owner as member
-            cursor.execute(
-                "INSERT INTO server_members (server_id, user_id) VALUES (?, ?)",
-                (server_id, owner_id)
-            )
-            
-            # Create default "general" channel
-            cursor.execute(
-                "INSERT INTO channels (server_id, name) VALUES (?, ?)",
-                (server_id, "general")
-            )
-            
-            conn.commit()
-            
+    def write(conn):
+        cursor = conn.cursor()
+        
+        # Check if server name already exists
+        cursor.execute("SELECT id FROM servers WHERE name = ?", (name,))
+        if cursor.fetchone():
             return {
-                "success": True,
-                "message": f"Server '{name}' created successfully!",
-                "server_id": server_id
+                "success": False,
+                "message": "Server name already exists!"
             }
+        
+        # Create server
+        cursor.execute(
+            "INSERT INTO servers (name, owner_id) VALUES (?, ?)",
+            (name, owner_id)
+        )
+        server_id = cursor.lastrowid
+        
+        # Add owner as member
+        cursor.execute(
+            "INSERT INTO server_members (server_id, user_id) VALUES (?, ?)",
+            (server_id, owner_id)
+        )
+        
+        # Create default "general" channel
+        cursor.execute(
+            "INSERT INTO channels (server_id, name) VALUES (?, ?)",
+            (server_id, "general")
+        )
+        
+        return {
+            "success": True,
+            "message": f"Server '{name}' created successfully!",
+            "server_id": server_id
+        }
+    
+    try:
+        return run_write(write)
     except Exception as e:
         return {
             "success": False,
@@ -70,6 +83,40 @@ def get_user_servers(user_id: int) -> list:
         return []
 
 
+def get_user_server_ids(user_id: int) -> list:
+    """Get the IDs of all servers a user is a member of"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT server_id FROM server_members WHERE user_id = ?",
+                (user_id,)
+            )
+            return [row['server_id'] for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error getting user server ids: {e}")
+        return []
+
+
+def get_server_members(server_id: int) -> list:
+    """Get all members of a server with their profile and status"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT u.id, u.username, u.avatar, u.status
+                FROM server_members sm
+                JOIN users u ON u.id = sm.user_id
+                WHERE sm.server_id = ?
+            """, (server_id,))
+            
+            members = cursor.fetchall()
+            return [dict(member) for member in members]
+    except Exception as e:
+        print(f"Error getting server members: {e}")
+        return []
+
+
 def get_server_by_id(server_id: int) -> dict:
     """Get server details by ID"""
     try:
@@ -88,65 +135,96 @@ def get_server_by_id(server_id: int) -> dict:
         return None
 
 
-def send_server_invite(server_id: int, from_user_id: int, to_user_id: int) -> dict:
-    """Send a server invitation"""
+def is_server_member(server_id: int, user_id: int) -> bool:
+    """Check if a user is a member of a server"""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
-            # Check if server exists and sender is the owner
-            cursor.execute(
-                "SELECT owner_id FROM servers WHERE id = ?",
-                (server_id,)
-            )
-            server = cursor.fetchone()
-            if not server:
-                return {
-                    "success": False,
-                    "message": "Server not found!"
-                }
-            
-            if server['owner_id'] != from_user_id:
-                return {
-                    "success": False,
-                    "message": "Only server owner can invite users!"
-                }
-            
-            # Check if user is already a member
             cursor.execute(
                 "SELECT id FROM server_members WHERE server_id = ? AND user_id = ?",
-                (server_id, to_user_id)
-            )
-            if cursor.fetchone():
-                return {
-                    "success": False,
-                    "message": "User is already a member of this server!"
-                }
-            
-            # Check for pending invite
-            cursor.execute(
-                "SELECT id FROM server_invites WHERE server_id = ? AND to_user_id = ? AND status = 'pending'",
-                (server_id, to_user_id)
-            )
-            if cursor.fetchone():
-                return {
-                    "success": False,
-                    "message": "Invite already sent!"
-                }
-            
-            # Send invite
-            cursor.execute(
-                "INSERT INTO server_invites (server_id, from_user_id, to_user_id) VALUES (?, ?, ?)",
-                (server_id, from_user_id, to_user_id)
+                (server_id, user_id)
             )
-            invite_id = cursor.lastrowid
-            conn.commit()
-            
+            return cursor.fetchone() is not None
+    except Exception as e:
+        print(f"Error checking server membership: {e}")
+        return False
+
+
+def send_server_invite(server_id: int, from_user_id: int, to_user_id: int) -> dict:
+    """Send a server invitation"""
+    def write(conn):
+        cursor = conn.cursor()
+        
+        # Check if server exists and sender is the owner
+        cursor.execute(
+            "SELECT name, owner_id FROM servers WHERE id = ?",
+            (server_id,)
+        )
+        server = cursor.fetchone()
+        if not server:
             return {
-                "success": True,
-                "message": "Server invite sent!",
-                "invite_id": invite_id
+                "success": False,
+                "message": "Server not found!"
             }
+        
+        if server['owner_id'] != from_user_id:
+            return {
+                "success": False,
+                "message": "Only server owner can invite users!"
+            }
+        
+        # Check if user is already a member
+        cursor.execute(
+            "SELECT id FROM server_members WHERE server_id = ? AND user_id = ?",
+            (server_id, to_user_id)
+        )
+        if cursor.fetchone():
+            return {
+                "success": False,
+                "message": "User is already a member of this server!"
+            }
+        
+        # Check for pending invite
+        cursor.execute(
+            "SELECT id FROM server_invites WHERE server_id = ? AND to_user_id = ? AND status = 'pending'",
+            (server_id, to_user_id)
+        )
+        if cursor.fetchone():
+            return {
+                "success": False,
+                "message": "Invite already sent!"
+            }
+        
+        # Send invite (an old declined or accepted invite is reopened)
+        cursor.execute(f"""
+            INSERT INTO server_invites (server_id, from_user_id, to_user_id) VALUES (?, ?, ?)
+            {REOPEN_INVITE}
+        """, (server_id, from_user_id, to_user_id))
+        cursor.execute(
+            "SELECT id FROM server_invites WHERE server_id = ? AND to_user_id = ?",
+            (server_id, to_user_id)
+        )
+        invite_id = cursor.fetchone()['id']
+        
+        # Notify the invited user
+        cursor.execute("SELECT username FROM users WHERE id = ?", (from_user_id,))
+        enqueue_notifications(cursor, [(to_user_id, {
+            'type': 'new-server-invite',
+            'from_user_id': from_user_id,
+            'from_username': cursor.fetchone()['username'],
+            'server_id': server_id,
+            'server_name': server['name'],
+            'invite_id': invite_id
+        })])
+        
+        return {
+            "success": True,
+            "message": "Server invite sent!",
+            "invite_id": invite_id
+        }
+    
+    try:
+        return run_write(write)
     except Exception as e:
         return {
             "success": False,
@@ -154,6 +232,107 @@ def send_server_invite(server_id: int, from_user_id: int, to_user_id: int) -> di
         }
 
 
+def send_server_invites(server_id: int, from_user_id: int, to_user_ids: list) -> dict:
+    """
+    Invite many users to a server in one transaction
+    Users who don't exist, are already members or already have a pending invite are
+    skipped (with the reason) - the checks are set-based queries over the whole list
+    """
+    user_ids = list(dict.fromkeys(to_user_ids))
+    if len(user_ids) > MAX_BULK_INVITES:
+        return {
+            "success": False,
+            "message": f"At most {MAX_BULK_INVITES} users per invite!"
+        }
+    
+    def write(conn):
+        cursor = conn.cursor()
+        
+        # Check if server exists and sender is the owner
+        cursor.execute(
+            "SELECT name, owner_id FROM servers WHERE id = ?",
+            (server_id,)
+        )
+        server = cursor.fetchone()
+        if not server:
+            return {
+                "success": False,
+                "message": "Server not found!"
+            }
+        
+        if server['owner_id'] != from_user_id:
+            return {
+                "success": False,
+                "message": "Only server owner can invite users!"
+            }
+        
+        # Why each user can't be invited, in one pass over the list
+        cursor.execute("""
+            SELECT t.value AS user_id,
+                   CASE
+                       WHEN u.id IS NULL THEN 'User not found'
+                       WHEN EXISTS (
+                           SELECT 1 FROM server_members sm WHERE sm.server_id = ? AND sm.user_id = t.value
+                       ) THEN 'Already a member'
+                       WHEN EXISTS (
+                           SELECT 1 FROM server_invites si
+                           WHERE si.server_id = ? AND si.to_user_id = t.value AND si.status = 'pending'
+                       ) THEN 'Invite already sent'
+                   END AS reason
+            FROM json_each(?) t
+            LEFT JOIN users u ON u.id = t.value
+        """, (server_id, server_id, json.dumps(user_ids)))
+        skipped = [
+            {"user_id": row['user_id'], "reason": row['reason']}
+            for row in cursor.fetchall() if row['reason'] is not None
+        ]
+        skipped_ids = {row['user_id'] for row in skipped}
+        invite_ids = json.dumps([user_id for user_id in user_ids if user_id not in skipped_ids])
+        
+        # Send the invites (old declined or accepted invites are reopened)
+        cursor.execute(f"""
+            INSERT INTO server_invites (server_id, from_user_id, to_user_id)
+            SELECT ?, ?, value FROM json_each(?) WHERE true
+            {REOPEN_INVITE}
+        """, (server_id, from_user_id, invite_ids))
+        cursor.execute("""
+            SELECT id, to_user_id FROM server_invites
+            WHERE server_id = ? AND status = 'pending' AND to_user_id IN (SELECT value FROM json_each(?))
+        """, (server_id, invite_ids))
+        invited = [{"user_id": row['to_user_id'], "invite_id": row['id']} for row in cursor.fetchall()]
+        
+        # Notify every invited user
+        cursor.execute("SELECT username FROM users WHERE id = ?", (from_user_id,))
+        from_username = cursor.fetchone()['username']
+        enqueue_notifications(cursor, [
+            (invite['user_id'], {
+                'type': 'new-server-invite',
+                'from_user_id': from_user_id,
+                'from_username': from_username,
+                'server_id': server_id,
+                'server_name': server['name'],
+                'invite_id': invite['invite_id']
+            })
+            for invite in invited
+        ])
+        
+        return {
+            "success": True,
+            "message": f"Sent {len(invited)} server invites!",
+            "server_name": server['name'],
+            "invited": invited,
+            "skipped": skipped
+        }
+    
+    try:
+        return run_write(write)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error sending invites: {str(e)}"
+        }
+
+
 def get_pending_server_invites(user_id: int) -> list:
     """Get all pending server invites for a user"""
     try:
@@ -177,41 +356,43 @@ def get_pending_server_invites(user_id: int) -> list:
 
 def accept_server_invite(invite_id: int, user_id: int) -> dict:
     """Accept a server invitation"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get invite details
-            cursor.execute(
-                "SELECT * FROM server_invites WHERE id = ? AND to_user_id = ? AND status = 'pending'",
-                (invite_id, user_id)
-            )
-            invite = cursor.fetchone()
-            
-            if not invite:
-                return {
-                    "success": False,
-                    "message": "Invite not found or already processed!"
-                }
-            
-            # Add user to server
-            cursor.execute(
-                "INSERT INTO server_members (server_id, user_id) VALUES (?, ?)",
-                (invite['server_id'], user_id)
-            )
-            
-            # Update invite status
-            cursor.execute(
-                "UPDATE server_invites SET status = 'accepted' WHERE id = ?",
-                (invite_id,)
-            )
-            
-            conn.commit()
-            
+    def write(conn):
+        cursor = conn.cursor()
+        
+        # Get invite details
+        cursor.execute(
+            "SELECT * FROM server_invites WHERE id = ? AND to_user_id = ? AND status = 'pending'",
+            (invite_id, user_id)
+        )
+        invite = cursor.fetchone()
+        
+        if not invite:
             return {
-                "success": True,
-                "message": "Server invite accepted!"
+                "success": False,
+                "message": "Invite not found or already processed!"
             }
+        
+        # Add user to server
+        cursor.execute(
+            "INSERT INTO server_members (server_id, user_id) VALUES (?, ?)",
+            (invite['server_id'], user_id)
+        )
+        join_server_conversations(cursor, invite['server_id'], user_id)
+        
+        # Update invite status
+        cursor.execute(
+            "UPDATE server_invites SET status = 'accepted' WHERE id = ?",
+            (invite_id,)
+        )
+        
+        return {
+            "success": True,
+            "message": "Server invite accepted!",
+            "server_id": invite['server_id']
+        }
+    
+    try:
+        return run_write(write)
     except Exception as e:
         return {
             "success": False,
@@ -221,29 +402,48 @@ def accept_server_invite(invite_id: int, user_id: int) -> dict:
 
 def decline_server_invite(invite_id: int, user_id: int) -> dict:
     """Decline a server invitation"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "UPDATE server_invites SET status = 'declined' WHERE id = ? AND to_user_id = ? AND status = 'pending'",
-                (invite_id, user_id)
-            )
-            
-            if cursor.rowcount == 0:
-                return {
-                    "success": False,
-                    "message": "Invite not found or already processed!"
-                }
-            
-            conn.commit()
-            
+    def write(conn):
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            "UPDATE server_invites SET status = 'declined' WHERE id = ? AND to_user_id = ? AND status = 'pending'",
+            (invite_id, user_id)
+        )
+        
+        if cursor.rowcount == 0:
             return {
-                "success": True,
-                "message": "Server invite declined!"
+                "success": False,
+                "message": "Invite not found or already processed!"
             }
+        
+        return {
+            "success": True,
+            "message": "Server invite declined!"
+        }
+    
+    try:
+        return run_write(write)
     except Exception as e:
         return {
             "success": False,
             "message": f"Error declining invite: {str(e)}"
         }
+
+
+def iter_server_memberships(chunk_size: int = 50_000):
+    """Yield every server membership as (server_id, user_id) tuples, in chunks (keyset pagination on id)"""
+    last_id = 0
+    while True:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None  # plain tuples - these run over every row of the table
+            cursor.execute(
+                "SELECT id, server_id, user_id FROM server_members WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, chunk_size)
+            )
+            rows = cursor.fetchall()
+        
+        if not rows:
+            return
+        yield [row[1:] for row in rows]
+        last_id = rows[-1][0]
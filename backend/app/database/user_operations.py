@@ -1,22 +1,24 @@
 """User-related database operations"""
-from .connection import get_db_connection
+from .connection import get_db_connection, run_write
 
 
 def create_user(email: str, username: str, password: str, avatar: str) -> dict:
     """Create a new user"""
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO users (email, username, password, avatar) VALUES (?, ?, ?, ?)",
+            (email, username, password, avatar)
+        )
+        
+        return {
+            "success": True,
+            "message": f"Account created successfully! Welcome, {username}!",
+            "user_id": cursor.lastrowid
+        }
+    
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO users (email, username, password, avatar) VALUES (?, ?, ?, ?)",
-                (email, username, password, avatar)
-            )
-            conn.commit()
-            
-            return {
-                "success": True,
-                "message": f"Account created successfully! Welcome, {username}!"
-            }
+        return run_write(write)
     except Exception as e:
         error_msg = str(e).lower()
         if "unique" in error_msg:
@@ -107,6 +109,25 @@ def get_user_by_username(username: str) -> dict:
         return None
 
 
+def get_users_by_ids(user_ids: list) -> list:
+    """Get public profiles for a list of user IDs, keeping the given order"""
+    if not user_ids:
+        return []
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(user_ids))
+            cursor.execute(
+                f"SELECT id, username, avatar, status FROM users WHERE id IN ({placeholders})",
+                list(user_ids)
+            )
+            users = {user['id']: dict(user) for user in cursor.fetchall()}
+            return [users[user_id] for user_id in user_ids if user_id in users]
+    except Exception as e:
+        print(f"Error getting users: {e}")
+        return []
+
+
 def update_user_status(user_id: int, status: str) -> dict:
     """Update user status (online/offline/invisible)"""
     try:
@@ -117,20 +138,39 @@ def update_user_status(user_id: int, status: str) -> dict:
                 "message": "Invalid status!"
             }
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        def write(conn):
+            conn.execute(
                 "UPDATE users SET status = ? WHERE id = ?",
                 (status, user_id)
             )
-            conn.commit()
-            
-            return {
-                "success": True,
-                "message": f"Status updated to {status}"
-            }
+        
+        run_write(write)
+        
+        return {
+            "success": True,
+            "message": f"Status updated to {status}"
+        }
     except Exception as e:
         return {
             "success": False,
             "message": f"Error updating status: {str(e)}"
         }
+
+
+def iter_usernames(chunk_size: int = 50_000):
+    """Yield every user as (id, username) tuples, in chunks (keyset pagination on id)"""
+    last_id = 0
+    while True:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None  # plain tuples - this runs over every user
+            cursor.execute(
+                "SELECT id, username FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, chunk_size)
+            )
+            rows = cursor.fetchall()
+        
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
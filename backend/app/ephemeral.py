@@ -0,0 +1,96 @@
+"""Ephemeral event lane (typing indicators and other short-lived UX signals)
+
+Ephemeral events are never stored - not in SQLite and not in the event log.
+Each (kind, target, user) key holds only its latest payload:
+
+- Throttling: at most one outbound update per key per THROTTLE_INTERVAL, no
+  matter how often the client sends.
+- Coalescing: updates arriving inside the interval replace each other; the
+  newest one is sent when the interval ends (so a "stopped typing" right after
+  "typing" is not lost).
+- TTL: a key nobody refreshes for EPHEMERAL_TTL seconds is dropped. Receivers
+  get the same TTL and hide the signal on their own when it runs out.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+# Minimum seconds between two outbound updates for the same key
+THROTTLE_INTERVAL = 1.0
+
+# Seconds an ephemeral state lives without being refreshed
+EPHEMERAL_TTL = 6.0
+
+# How often trailing updates and expiry are checked (seconds)
+TICK_INTERVAL = 0.25
+
+
+class EphemeralEntry:
+    __slots__ = ("payload", "deliver", "last_sent", "pending", "expires_at")
+
+    def __init__(self):
+        self.payload: Optional[dict] = None
+        self.deliver: Optional[Callable[[dict], Awaitable[None]]] = None
+        self.last_sent = float("-inf")
+        self.pending = False
+        self.expires_at = 0.0
+
+
+class EphemeralLane:
+    def __init__(self, interval: float = THROTTLE_INTERVAL, ttl: float = EPHEMERAL_TTL):
+        self.interval = interval
+        self.ttl = ttl
+        self.entries: Dict[tuple, EphemeralEntry] = {}  # (kind, target, user_id) -> latest state
+        self._tick_task: Optional[asyncio.Task] = None
+
+    async def publish(self, key: tuple, payload: dict, deliver: Callable[[dict], Awaitable[None]]):
+        """
+        Publish the latest state for a key
+        deliver(payload) does the fan-out; it runs now or when the throttle interval ends
+        """
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = EphemeralEntry()
+        entry.payload = {**payload, 'ttl': self.ttl}
+        entry.deliver = deliver
+        entry.expires_at = now + self.ttl
+
+        if now - entry.last_sent >= self.interval:
+            await self._send(entry, now)
+        else:
+            entry.pending = True
+
+    async def _send(self, entry: EphemeralEntry, now: float):
+        entry.last_sent = now
+        entry.pending = False
+        await entry.deliver(entry.payload)
+
+    async def tick(self, now: Optional[float] = None):
+        """Send coalesced updates whose interval has passed and drop expired keys"""
+        now = time.monotonic() if now is None else now
+        for key, entry in list(self.entries.items()):
+            if entry.pending and now - entry.last_sent >= self.interval:
+                await self._send(entry, now)
+            if not entry.pending and entry.expires_at <= now:
+                del self.entries[key]
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(TICK_INTERVAL)
+            await self.tick()
+
+    def start(self):
+        """Start the background tick task"""
+        if self._tick_task is None:
+            self._tick_task = asyncio.create_task(self._tick_loop())
+
+    async def stop(self):
+        """Stop the tick task - pending ephemeral updates are dropped"""
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+            self._tick_task = None
+        self.entries.clear()
+
+
+ephemeral = EphemeralLane()
@@ -0,0 +1,156 @@
+"""Per-user event log for reliable WebSocket delivery
+
+Every reliable event sent to a user gets the next sequence number for that user.
+The newest events are kept in a bounded in-memory ring per user and written to the
+user_events table in batches. A reconnecting client passes the last sequence number
+it processed and only the events after it are replayed - from the ring when it
+still covers the gap, otherwise from SQLite.
+
+Only users with an open session stay in memory: once a user is offline and
+all their events are stored, their ring and last sequence number are dropped
+and reloaded from SQLite when they are needed again.
+"""
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional
+
+from .database import save_user_events, get_last_event_seq, get_last_event_seqs, get_user_events_after
+
+# Events kept in memory per user
+RING_SIZE = 256
+
+# How often pending events are flushed to the database (seconds)
+FLUSH_INTERVAL = 0.05
+
+
+class EventLog:
+    def __init__(self, ring_size: int = RING_SIZE):
+        self.ring_size = ring_size
+        self.rings: Dict[int, deque] = {}  # user_id -> newest events
+        self.last_seq: Dict[int, int] = {}  # user_id -> last assigned seq
+        self.online: set = set()  # Users with an open session - kept in memory
+        self.pending: List[tuple] = []  # (user_id, seq, event) not yet in the database
+        self.flushing: List[tuple] = []  # Batch currently being written
+        self._flush_lock = asyncio.Lock()  # flush() is also awaited by the outbox dispatcher
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def current_seq(self, user_id: int) -> int:
+        """Get the last sequence number assigned to a user"""
+        if user_id not in self.last_seq:
+            self.last_seq[user_id] = get_last_event_seq(user_id)
+        return self.last_seq[user_id]
+
+    def preload(self, user_ids):
+        """Load the last sequence numbers of many users with one query (before appending to all of them)"""
+        missing = [user_id for user_id in user_ids if user_id not in self.last_seq]
+        if missing:
+            seqs = get_last_event_seqs(missing)
+            for user_id in missing:
+                self.last_seq[user_id] = seqs.get(user_id, 0)
+
+    def append(self, user_id: int, message: dict) -> dict:
+        """Assign the next sequence number to an event and record it"""
+        seq = self.current_seq(user_id) + 1
+        self.last_seq[user_id] = seq
+        event = {**message, 'seq': seq}
+
+        if user_id not in self.rings:
+            self.rings[user_id] = deque(maxlen=self.ring_size)
+        self.rings[user_id].append(event)
+        self.pending.append((user_id, seq, event))
+        return event
+
+    def connected(self, user_id: int):
+        """User's first session opened"""
+        self.online.add(user_id)
+
+    def disconnected(self, user_id: int):
+        """User's last session closed - forget them once their events are stored"""
+        self.online.discard(user_id)
+        self._evict((user_id,))
+
+    def _evict(self, user_ids):
+        """Drop offline users without unstored events (reloaded from the database when needed)"""
+        unstored = {uid for uid, _, _ in self.flushing}
+        unstored.update(uid for uid, _, _ in self.pending)
+        for user_id in user_ids:
+            if user_id not in self.online and user_id not in unstored:
+                self.rings.pop(user_id, None)
+                self.last_seq.pop(user_id, None)
+
+    def ack(self, user_id: int, seq: int):
+        """Drop acknowledged events from memory (they stay in the database)"""
+        ring = self.rings.get(user_id)
+        if not ring:
+            return
+        while ring and ring[0]['seq'] <= seq:
+            ring.popleft()
+        if not ring:
+            del self.rings[user_id]
+
+    def events_after(self, user_id: int, after_seq: int) -> Optional[list]:
+        """
+        Get the events a client missed since after_seq
+        Returns None when they can no longer be replayed and the client must resync
+        """
+        current = self.current_seq(user_id)
+        if after_seq > current:
+            # Client is ahead of us (events lost before a flush) - cannot trust its state
+            return None
+        if after_seq == current:
+            return []
+
+        ring = self.rings.get(user_id)
+        if ring and ring[0]['seq'] <= after_seq + 1:
+            return [event for event in ring if event['seq'] > after_seq]
+
+        # Ring no longer covers the gap - fall back to the database plus unflushed events
+        events = get_user_events_after(user_id, after_seq)
+        stored_seq = events[-1]['seq'] if events else after_seq
+        for uid, seq, event in self.flushing + self.pending:
+            if uid == user_id and seq > stored_seq:
+                events.append(event)
+
+        # Seqs are unique and ascending: the right first seq and count means no gap anywhere
+        if not events or events[0]['seq'] != after_seq + 1 or len(events) != current - after_seq:
+            return None
+        return events
+
+    async def flush(self) -> bool:
+        """
+        Write pending events to the database
+        Returns False if the write failed - the events stay pending for the next flush
+        """
+        async with self._flush_lock:
+            if not self.pending:
+                return True
+            self.flushing, self.pending = self.pending, []
+            result = await asyncio.to_thread(save_user_events, self.flushing)
+            if not result['success']:
+                self.pending = self.flushing + self.pending
+                self.flushing = []
+                print(f"Event log flush failed: {result['message']}")
+                return False
+            flushed, self.flushing = self.flushing, []
+            self._evict({user_id for user_id, _, _ in flushed})
+            return True
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        """Start the background flush task"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the flush task and write whatever is still pending"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+
+event_log = EventLog()
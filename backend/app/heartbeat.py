@@ -0,0 +1,218 @@
+"""WebSocket heartbeat and dead-connection reaping
+
+A half-open connection (sleeping laptop, dropped mobile network) never raises
+WebSocketDisconnect - the receive loop just waits forever. So every session
+records when it last sent anything (Session.last_seen):
+
+- Clients send `ping` every HEARTBEAT_INTERVAL seconds and get `pong` back;
+  any inbound frame counts as a sign of life.
+- A session silent for HEARTBEAT_INTERVAL + PROBE_GRACE gets one `ping` from
+  the server, so clients without their own timer (or with throttled background
+  timers) stay connected as long as they answer with `pong`.
+- A session silent for IDLE_TIMEOUT is reaped: it stops receiving broadcasts
+  at once and its socket is closed, which ends its receive loop.
+
+Deadlines live in a timer wheel, so a tick only looks at the sessions due in
+that slot instead of scanning every connection. Sessions are never moved in the
+wheel on activity; when a slot fires the real deadline is recomputed from the
+last-seen time and the session is put back further ahead if it is still alive.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, Hashable, List, Optional
+
+from .connection_manager import Session, manager
+
+# Seconds between client pings
+HEARTBEAT_INTERVAL = 25.0
+
+# Seconds a client may be late with its ping before the server pings it instead
+PROBE_GRACE = 10.0
+
+# Seconds of silence after which a session is reaped
+IDLE_TIMEOUT = 60.0
+
+# Timer wheel slot width in seconds (reaping is at most this late)
+WHEEL_RESOLUTION = 1.0
+
+# Close code sent to reaped sessions (4000-4999 is for applications)
+REAPED_CLOSE_CODE = 4000
+
+# Seconds to wait for a reaped socket to close before giving up on it
+CLOSE_TIMEOUT = 5.0
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel - O(1) scheduling, a tick only touches its own slot
+
+    Keys cannot be cancelled; the owner skips keys it no longer tracks when they fire.
+    """
+
+    def __init__(self, span: float, resolution: float = WHEEL_RESOLUTION):
+        self.resolution = resolution
+        self.slots: List[list] = [[] for _ in range(math.ceil(span / resolution) + 1)]
+        self.current: Optional[int] = None  # last tick processed
+
+    def schedule(self, key: Hashable, deadline: float, now: float):
+        """
+        Fire key at the first tick at or after deadline
+        Deadlines beyond the wheel's span fire early; the owner reschedules them
+        """
+        if self.current is None:
+            self.current = math.floor(now / self.resolution)
+        ahead = math.ceil(deadline / self.resolution) - self.current
+        if ahead < 1:
+            ahead = 1
+        elif ahead >= len(self.slots):
+            ahead = len(self.slots) - 1
+        self.slots[(self.current + ahead) % len(self.slots)].append(key)
+
+    def schedule_many(self, entries: list):
+        """schedule() for a list of (key, deadline) - the tick's hot path, after advance()"""
+        slots, size, current, resolution = self.slots, len(self.slots), self.current, self.resolution
+        ceil = math.ceil
+        for key, deadline in entries:
+            ahead = ceil(deadline / resolution) - current
+            if ahead < 1:
+                ahead = 1
+            elif ahead >= size:
+                ahead = size - 1
+            slots[(current + ahead) % size].append(key)
+
+    def advance(self, now: float) -> list:
+        """Move to now - returns the keys of every slot passed"""
+        target = math.floor(now / self.resolution)
+        if self.current is None:
+            self.current = target
+        due = []
+        # Never spin more than one revolution, even after a long stall
+        for _ in range(min(target - self.current, len(self.slots))):
+            self.current += 1
+            index = self.current % len(self.slots)
+            due.extend(self.slots[index])
+            self.slots[index] = []
+        self.current = max(self.current, target)
+        return due
+
+
+class HeartbeatMonitor:
+    def __init__(self, sessions: Dict[str, Session], interval: float = HEARTBEAT_INTERVAL,
+                 timeout: float = IDLE_TIMEOUT, resolution: float = WHEEL_RESOLUTION):
+        self.sessions = sessions  # session_id -> session, as registered by the connection manager
+        self.interval = interval
+        self.timeout = timeout
+        self.probe_after = min(interval + PROBE_GRACE, timeout)
+        self.wheel = TimerWheel(timeout, resolution)
+        self.tracked = 0
+        self.probed_at: Dict[str, float] = {}  # session_id -> when the server last sent a ping
+        self._tick_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.reaped_total = 0
+        self.probes_sent = 0
+        self.reaped_idle_seconds = 0.0
+        self.recent_reaps: deque = deque(maxlen=100)  # (unix time, user_id, idle seconds)
+
+    def config(self) -> dict:
+        """Heartbeat settings for the client (sent in session-sync)"""
+        return {'interval': self.interval, 'timeout': self.timeout}
+
+    # ---------- Sessions ----------
+
+    def track(self, session: Session, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        if session.last_seen is None:
+            self.tracked += 1
+        session.last_seen = now
+        self.wheel.schedule(session.session_id, now + self.probe_after, now)
+
+    def seen(self, session: Session, now: Optional[float] = None):
+        """Inbound frame from a session - just a timestamp, the wheel is not touched"""
+        if session.last_seen is not None:
+            session.last_seen = time.monotonic() if now is None else now
+
+    def untrack(self, session: Session):
+        if session.last_seen is not None:
+            session.last_seen = None
+            self.tracked -= 1
+        self.probed_at.pop(session.session_id, None)
+
+    # ---------- Reaping ----------
+
+    async def tick(self, now: Optional[float] = None):
+        """Probe sessions that went quiet and reap the ones that stayed quiet"""
+        now = time.monotonic() if now is None else now
+        session_of = self.sessions.get
+        probe_after = self.probe_after
+        later = []
+        reaped = []
+        probes = []
+        for session_id in self.wheel.advance(now):
+            session = session_of(session_id)
+            if session is None or session.last_seen is None:
+                continue  # gone or untracked since it was scheduled
+            last_seen = session.last_seen
+            idle = now - last_seen
+            if idle < probe_after:
+                later.append((session_id, last_seen + probe_after))
+            elif idle >= self.timeout:
+                reaped.append((session, idle))
+            else:
+                if self.probed_at.get(session_id, -math.inf) <= last_seen:
+                    self.probed_at[session_id] = now
+                    probes.append(session_id)
+                later.append((session_id, last_seen + self.timeout))
+        self.wheel.schedule_many(later)
+
+        frames = {}
+        for session_id in probes:
+            await manager.send_to_session(session_id, {'type': 'ping'}, frames)
+        self.probes_sent += len(probes)
+
+        if reaped:
+            await asyncio.gather(*(self._reap(session, idle) for session, idle in reaped))
+
+    async def _reap(self, session: Session, idle: float):
+        self.untrack(session)
+        self.reaped_total += 1
+        self.reaped_idle_seconds += idle
+        self.recent_reaps.append((time.time(), session.user_id, round(idle, 1)))
+        print(f"Reaping WebSocket session {session.session_id} of user {session.user_id} (idle {idle:.0f}s)")
+        await manager.close_session(session.session_id, REAPED_CLOSE_CODE, "Heartbeat timeout", CLOSE_TIMEOUT)
+
+    def metrics(self) -> dict:
+        return {
+            'tracked_sessions': self.tracked,
+            'interval': self.interval,
+            'timeout': self.timeout,
+            'probes_sent': self.probes_sent,
+            'reaped_total': self.reaped_total,
+            'reaped_average_idle_seconds': (
+                round(self.reaped_idle_seconds / self.reaped_total, 1) if self.reaped_total else None
+            ),
+            'recent_reaps': [
+                {'at': at, 'user_id': user_id, 'idle_seconds': idle}
+                for at, user_id, idle in self.recent_reaps
+            ]
+        }
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(self.wheel.resolution)
+            await self.tick()
+
+    def start(self):
+        """Start the background reaper"""
+        if self._tick_task is None:
+            self._tick_task = asyncio.create_task(self._tick_loop())
+
+    async def stop(self):
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+            self._tick_task = None
+
+
+heartbeat = HeartbeatMonitor(manager.sessions)
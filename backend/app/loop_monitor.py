@@ -0,0 +1,239 @@
+"""Event loop lag monitor and blocking-call detector
+
+Routes and WebSocket handlers call synchronous SQLite (and json, and template
+rendering) straight on the event loop thread; while one of them runs, nothing
+else does. Two pieces measure that:
+
+- A task on the loop sleeps CHECK_INTERVAL and measures how late it wakes up.
+  That lateness is the loop lag - how long any ready callback had to wait.
+  Recent lags give the percentiles in metrics(); a lag of STALL_THRESHOLD or
+  more is a stall and is logged.
+- A watchdog thread checks that the task keeps waking up. Once the loop has
+  been stuck for STALL_THRESHOLD it grabs the loop thread's current stack
+  (sys._current_frames()), so the stall is logged with the code that caused it,
+  e.g. the get_db_connection() query or the route encoding a huge history.
+  Code that holds the GIL for a whole C call (json.dumps of one huge payload)
+  only lets the watchdog in when it returns, so the stack then points at the
+  line right after it.
+
+Debug mode (MINI_DISCORD_LOOP_DEBUG=1) also flags synchronous I/O executed on
+the loop thread: database reads and writes (reported by database/connection.py),
+and file opens, socket connects and subprocesses (through an audit hook). Each
+call site is logged the first time and counted. It also turns on asyncio's
+debug mode, which logs callbacks slower than STALL_THRESHOLD by name.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Optional
+
+# Seconds between lag measurements
+CHECK_INTERVAL = 0.05
+
+# Lag in seconds from which the loop counts as stalled (logged with the blocking stack)
+STALL_THRESHOLD = float(os.environ.get("MINI_DISCORD_STALL_THRESHOLD", "0.1"))
+
+# Lag samples kept for the percentiles (one minute at CHECK_INTERVAL)
+LAG_WINDOW = 1200
+
+# Stalls kept for /api/stats/loop
+RECENT_STALLS = 20
+
+# Stack frames kept per stall, innermost last
+STACK_DEPTH = 12
+
+# Flag synchronous I/O on the loop thread
+DEBUG = os.environ.get("MINI_DISCORD_LOOP_DEBUG", "") not in ("", "0")
+
+# Audit events that mean blocking I/O (see the sys.addaudithook docs for the list)
+SYNC_IO_EVENTS = {
+    "open": "file",
+    "socket.connect": "socket",
+    "socket.getaddrinfo": "dns",
+    "subprocess.Popen": "subprocess",
+    "sqlite3.connect": "db.connect",
+}
+
+# Opened files that are not I/O worth flagging
+SOURCE_FILES = (".py", ".pyc")
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DATABASE_DIR = os.path.join(APP_DIR, "database")
+
+# Frames skipped when naming the call site of flagged I/O
+_PLUMBING = (os.path.join(DATABASE_DIR, "connection.py"), os.path.abspath(__file__))
+
+
+def _short_path(filename: str) -> str:
+    """Application files relative to backend/, library files as they are"""
+    if filename.startswith(APP_DIR):
+        return os.path.relpath(filename, os.path.dirname(APP_DIR))
+    return filename
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = CHECK_INTERVAL, threshold: float = STALL_THRESHOLD, debug: bool = DEBUG):
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.recent_stalls = deque(maxlen=RECENT_STALLS)
+        self.sync_io = Counter()  # "kind call site" -> times flagged
+        self._beat = 0.0  # when the monitor task last went to sleep
+        self._captured: Optional[dict] = None  # stack the watchdog took for the current stall
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._audit_hook = False
+
+        # Metrics
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+
+    # ---------- Lag ----------
+
+    async def _measure(self):
+        while True:
+            self._beat = beat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - beat - self.interval)
+            self.lags.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            captured, self._captured = self._captured, None
+            if captured is not None and captured["beat"] != beat:
+                captured = None  # Taken too late, for an earlier stall
+            if lag >= self.threshold:
+                self._record_stall(lag, captured)
+
+    def _record_stall(self, lag: float, captured: Optional[dict]):
+        self.stalls += 1
+        self.stalled_seconds += lag
+        stack = captured["stack"] if captured else []
+        self.recent_stalls.append({
+            "at": time.time() - lag,
+            "lag_ms": round(lag * 1000, 1),
+            "stack": stack
+        })
+        where = stack[-1] if stack else "stack not captured (stall ended before the watchdog looked)"
+        print(f"Event loop blocked for {lag * 1000:.0f} ms at {where}")
+        if len(stack) > 1:
+            print("".join(f"    {frame}\n" for frame in stack).rstrip())
+
+    def _watch(self):
+        """Watchdog thread - grabs the loop thread's stack while it is stuck"""
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            if self._captured is not None and self._captured["beat"] == beat:
+                continue  # Already have this stall's stack
+            if time.perf_counter() - beat - self.interval < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None and self._beat == beat:
+                self._captured = {"beat": beat, "stack": self._format_stack(frame)}
+
+    @staticmethod
+    def _format_stack(frame) -> list:
+        return [
+            f"{_short_path(entry.filename)}:{entry.lineno} in {entry.name}"
+            for entry in traceback.extract_stack(frame, limit=STACK_DEPTH)
+        ]
+
+    # ---------- Sync I/O on the loop thread (debug mode) ----------
+
+    def on_loop_thread(self) -> bool:
+        return self._loop_thread is not None and threading.get_ident() == self._loop_thread
+
+    def flag_sync_io(self, kind: str):
+        """Count blocking I/O if it runs on the loop thread - call sites check self.debug first"""
+        if not self.on_loop_thread():
+            return
+        site = self._call_site()
+        key = f"{kind} {site}"
+        self.sync_io[key] += 1
+        if self.sync_io[key] == 1:
+            print(f"Sync I/O on the event loop: {kind} from {site}")
+
+    @staticmethod
+    def _call_site() -> str:
+        """Innermost application frame that is not plumbing - plus the caller outside the database package"""
+        sites = []
+        frame = sys._getframe(2)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(APP_DIR) and filename not in _PLUMBING:
+                if not sites or not filename.startswith(DATABASE_DIR):
+                    sites.append(f"{_short_path(filename)}:{frame.f_lineno} in {frame.f_code.co_name}")
+                if not filename.startswith(DATABASE_DIR):
+                    break
+            frame = frame.f_back
+        return " <- ".join(sites) or "outside the app"
+
+    def _audit(self, event: str, args):
+        kind = SYNC_IO_EVENTS.get(event)
+        if kind == "file" and isinstance(args[0], str) and args[0].endswith(SOURCE_FILES):
+            return  # Imports, and linecache reading sources for asyncio debug tracebacks
+        if kind is not None and self.debug:
+            self.flag_sync_io(kind)
+
+    # ---------- Lifecycle ----------
+
+    def start(self):
+        """Start measuring the running loop"""
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._task = asyncio.create_task(self._measure())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        if self.debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+            if not self._audit_hook:
+                # Audit hooks cannot be removed - _audit() checks self.debug on every event
+                sys.addaudithook(self._audit)
+                self._audit_hook = True
+
+    async def stop(self):
+        """Stop the monitor task and the watchdog"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._stop.set()
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    def metrics(self) -> dict:
+        lags = sorted(self.lags)
+
+        def percentile(fraction: float) -> float:
+            return round(lags[min(len(lags) - 1, int(len(lags) * fraction))] * 1000, 3) if lags else 0.0
+
+        return {
+            "interval_ms": self.interval * 1000,
+            "stall_threshold_ms": self.threshold * 1000,
+            "lag_ms": {
+                "p50": percentile(0.5),
+                "p99": percentile(0.99),
+                "max_recent": percentile(1.0),
+                "max": round(self.max_lag * 1000, 3)
+            },
+            "stalls": self.stalls,
+            "stalled_seconds": round(self.stalled_seconds, 3),
+            "recent_stalls": list(self.recent_stalls),
+            "debug": self.debug,
+            "sync_io": dict(self.sync_io.most_common()) if self.debug else None
+        }
+
+
+loop_monitor = LoopMonitor()
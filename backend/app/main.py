@@ -1,5 +1,5 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Form, Cookie, Response, HTTPException, status, Depends
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,76 +7,43 @@ from typing import Optional, Dict
 import os
 import re
 import json
+import zlib
+from functools import partial
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from .database import (
-    init_database, create_user, verify_user, get_user_by_id, get_user_by_username,
+    init_database, create_user, verify_user, get_user_by_id, get_user_by_username, get_users_by_ids,
     send_friend_request, get_pending_friend_requests, 
     accept_friend_request, decline_friend_request, get_friends, get_friends_with_status,
     update_user_status, save_message, get_chat_history,
-    create_server, get_user_servers, get_server_by_id, send_server_invite,
-    get_pending_server_invites, accept_server_invite, decline_server_invite,
-    create_channel, get_server_channels, join_channel, leave_channel,
-    get_channel_members, save_channel_message, get_channel_messages
+    get_conversations, mark_conversation_read,
+    create_server, get_user_servers, get_server_by_id, is_server_member, send_server_invite,
+    send_server_invites, get_pending_server_invites, accept_server_invite, decline_server_invite,
+    create_channel, get_server_channels, get_channel_by_id, check_channel_access,
+    save_channel_message, get_channel_messages,
+    iter_direct_messages, iter_channel_messages, iter_server_messages,
+    set_retention_policy, get_attachment, can_access_attachment, clean_filename
 )
+from .database.connection import writer, read_transaction, run_write_batch
+from .event_log import event_log
+from .voice_state import voice_state
+from .connection_manager import manager
+from .ws_protocol import negotiate
+from .ephemeral import ephemeral
+from .heartbeat import heartbeat
+from .retention import retention
+from .outbox import outbox
+from .tracing import tracer, TracingMiddleware, NO_SPAN
+from .loop_monitor import loop_monitor
+from .attachments import attachment_store, UploadError
+from .server_presence import server_presence
+from .member_list import member_lists
+from .social_graph import social_graph
+from .username_index import username_index
+from .assets import DIST_DIR, PrecompressedStaticFiles, asset_url, page_css, import_map
+from .render_cache import create_environment, precompile_templates, PageCache, FragmentCache, data_versions
 
 app = FastAPI()
 
-# WebSocket Connection Manager for voice signaling
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}  # user_id -> websocket
-        self.channel_connections: Dict[int, set] = {}  # channel_id -> set of user_ids
-    
-    async def connect(self, user_id: int, websocket: WebSocket):
-        """Add a user connection"""
-        self.active_connections[user_id] = websocket
-    
-    def disconnect(self, user_id: int):
-        """Remove a user connection"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        # Remove from all channels
-        for channel_id in list(self.channel_connections.keys()):
-            if user_id in self.channel_connections[channel_id]:
-                self.channel_connections[channel_id].remove(user_id)
-                if not self.channel_connections[channel_id]:
-                    del self.channel_connections[channel_id]
-    
-    async def send_to_user(self, user_id: int, message: dict):
-        """Send a message to a specific user"""
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(message)
-            except:
-                self.disconnect(user_id)
-    
-    async def send_to_channel(self, channel_id: int, message: dict, exclude_user_id: Optional[int] = None):
-        """Broadcast message to all users in a channel"""
-        if channel_id in self.channel_connections:
-            for user_id in list(self.channel_connections[channel_id]):
-                if exclude_user_id and user_id == exclude_user_id:
-                    continue
-                await self.send_to_user(user_id, message)
-    
-    def join_voice_channel(self, user_id: int, channel_id: int):
-        """Add user to voice channel"""
-        if channel_id not in self.channel_connections:
-            self.channel_connections[channel_id] = set()
-        self.channel_connections[channel_id].add(user_id)
-    
-    def leave_voice_channel(self, user_id: int, channel_id: int):
-        """Remove user from voice channel"""
-        if channel_id in self.channel_connections:
-            self.channel_connections[channel_id].discard(user_id)
-            if not self.channel_connections[channel_id]:
-                del self.channel_connections[channel_id]
-    
-    def get_channel_users(self, channel_id: int) -> list:
-        """Get all users in a voice channel"""
-        return list(self.channel_connections.get(channel_id, set()))
-
-manager = ConnectionManager()
-
 # Secret key for session management (in production, use environment variable)
 SECRET_KEY = "your-secret-key-change-this-in-production"
 serializer = URLSafeTimedSerializer(SECRET_KEY)
@@ -85,6 +52,31 @@ serializer = URLSafeTimedSerializer(SECRET_KEY)
 @app.on_event("startup")
 async def startup_event():
     init_database()
+    precompile_templates(templates.env)
+    event_log.start()
+    voice_state.start()
+    ephemeral.start()
+    heartbeat.start()
+    retention.start()
+    outbox.start()
+    tracer.start()
+    social_graph.start()
+    username_index.start()
+    # Last, so the blocking startup work above is not counted as stalls
+    loop_monitor.start()
+
+# Let the writer thread finish queued writes before exiting
+@app.on_event("shutdown")
+async def shutdown_event():
+    await loop_monitor.stop()
+    await retention.stop()
+    await outbox.stop()
+    await tracer.stop()
+    await heartbeat.stop()
+    await ephemeral.stop()
+    await event_log.stop()
+    await voice_state.stop()
+    writer.stop()
 
 app.add_middleware(
     CORSMiddleware,
@@ -94,6 +86,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so a sampled request's trace covers everything under it
+app.add_middleware(TracingMiddleware)
+
 # Get the directory of the current file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Go up two levels to reach the project root, then into frontend/templates
@@ -102,11 +97,15 @@ TEMPLATES_DIR = os.path.join(PROJECT_ROOT, "frontend", "templates")
 STATIC_DIR = os.path.join(PROJECT_ROOT, "frontend", "static")
 PAGES_DIR = os.path.join(PROJECT_ROOT, "frontend", "pages")
 
-templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates = Jinja2Templates(env=create_environment(TEMPLATES_DIR))
+templates.env.globals.update(asset_url=asset_url, page_css=page_css, import_map=import_map)
+page_cache = PageCache(templates.env)
+fragment_cache = FragmentCache(templates.env, data_versions)
 
-# Mount static files (for avatars) and pages (for CSS/JS)
+# Mount static files (for avatars), pages (CSS/JS sources) and built assets (build_assets.py)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 app.mount("/pages", StaticFiles(directory=PAGES_DIR), name="pages")
+app.mount("/assets", PrecompressedStaticFiles(directory=DIST_DIR, check_dir=False), name="assets")
 
 def validate_email(email: str) -> bool:
     """Validate email format"""
@@ -163,38 +162,41 @@ async def get_current_user_required(session: str = Cookie(None)) -> dict:
             detail="Not authenticated - no session cookie"
         )
     
-    user_id = verify_session(session)
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired session"
-        )
-    
-    user = get_user_by_id(user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
+    with tracer.span("auth", "auth"):
+        user_id = verify_session(session)
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired session"
+            )
+        
+        user = get_user_by_id(user_id)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
     
     return user
 
 @app.get("/", response_class=HTMLResponse)
 async def login(request: Request, user: Optional[dict] = Depends(get_current_user_optional)):
-    # Check if already logged in
-    return templates.TemplateResponse("login.html", {
-        "request": request,
-        "already_logged_in": user is not None,
-        "username": user["username"] if user else None
+    # Anonymous visitors all get the same page
+    if user is None:
+        return page_cache.response(request, "login.html", already_logged_in=False, username=None)
+    return templates.TemplateResponse(request, "login.html", {
+        "already_logged_in": True,
+        "username": user["username"]
     })
 
 @app.get("/register", response_class=HTMLResponse)
 async def register_page(request: Request, user: Optional[dict] = Depends(get_current_user_optional)):
-    # Check if already logged in
-    return templates.TemplateResponse("register.html", {
-        "request": request,
-        "already_logged_in": user is not None,
-        "username": user["username"] if user else None
+    # Anonymous visitors all get the same page
+    if user is None:
+        return page_cache.response(request, "register.html", already_logged_in=False, username=None)
+    return templates.TemplateResponse(request, "register.html", {
+        "already_logged_in": True,
+        "username": user["username"]
     })
 
 @app.post("/register")
@@ -232,6 +234,8 @@ async def register_post(
     
     # Create user in database
     result = create_user(email, username, password, avatar)
+    if result['success']:
+        username_index.add_user(result['user_id'], username)
     return JSONResponse(result)
 
 @app.post("/login")
@@ -248,6 +252,7 @@ async def login_post(email: str = Form(...), password: str = Form(...)):
         # Set user status to online
         user_id = result["user"]["id"]
         update_user_status(user_id, 'online')
+        data_versions.bump('profile', user_id)
         
         # Create session cookie and add to response
         session_token = create_session(user_id)
@@ -267,6 +272,8 @@ async def logout(user: dict = Depends(get_current_user_optional)):
     # Set user status to offline if they're logged in
     if user:
         update_user_status(user['id'], 'offline')
+        data_versions.bump('profile', user['id'])
+        await send_member_list_diffs(member_lists.set_status(user['id'], 'offline'))
     
     response = RedirectResponse(url="/", status_code=302)
     response.delete_cookie("session")
@@ -278,22 +285,12 @@ async def home(request: Request, user: dict = Depends(get_current_user_required)
     Protected route - Home page with friend list and servers
     Automatically handles authorization via dependency injection
     """
-    # Get user's friends with status and friend requests
-    friends = get_friends_with_status(user['id'])
-    friend_requests = get_pending_friend_requests(user['id'])
-    
-    # Get user's servers and server invites
-    servers = get_user_servers(user['id'])
-    server_invites = get_pending_server_invites(user['id'])
-    
-    return templates.TemplateResponse("home.html", {
-        "request": request,
+    # Friends and servers tabs are cached per user until their data changes
+    return templates.TemplateResponse(request, "home.html", {
         "user": user,
         "session_token": session,
-        "friends": friends,
-        "friend_requests": friend_requests,
-        "servers": servers,
-        "server_invites": server_invites
+        "friends_tab": fragment_cache.friends_tab(user['id']),
+        "servers_tab": fragment_cache.servers_tab(user['id'])
     })
 
 # Friend system API endpoints
@@ -304,18 +301,16 @@ async def send_friend_request_endpoint(
 ):
     """Send a friend request to another user"""
     result = send_friend_request(user['id'], username)
-    
-    # Send real-time notification to receiver if online
-    if result['success'] and 'receiver_id' in result:
-        await manager.send_to_user(result['receiver_id'], {
-            'type': 'new-friend-request',
-            'from_user_id': user['id'],
-            'from_username': user['username'],
-            'request_id': result.get('request_id')
-        })
-    
+    if result['success']:
+        await after_friend_request_sent(user, result)
     return JSONResponse(result)
 
+async def after_friend_request_sent(user: dict, result: dict):
+    """Invalidate the receiver's cached pages - the notification is in the outbox"""
+    if 'receiver_id' in result:
+        data_versions.bump('friends', result['receiver_id'])
+        outbox.wake()
+
 @app.post("/api/friends/accept/{request_id}")
 async def accept_friend_request_endpoint(
     request_id: int,
@@ -323,17 +318,17 @@ async def accept_friend_request_endpoint(
 ):
     """Accept a friend request"""
     result = accept_friend_request(request_id, user['id'])
-    
-    # Notify the requester that their request was accepted
-    if result['success'] and 'requester_id' in result:
-        await manager.send_to_user(result['requester_id'], {
-            'type': 'friend-request-accepted',
-            'by_user_id': user['id'],
-            'by_username': user['username']
-        })
-    
+    if result['success']:
+        await after_friend_request_accepted(user, result)
     return JSONResponse(result)
 
+async def after_friend_request_accepted(user: dict, result: dict):
+    """Update the social graph and cached pages - the requester's notification is in the outbox"""
+    if 'requester_id' in result:
+        social_graph.add_friendship(user['id'], result['requester_id'])
+        data_versions.bump('friends', user['id'], result['requester_id'])
+        outbox.wake()
+
 @app.post("/api/friends/decline/{request_id}")
 async def decline_friend_request_endpoint(
     request_id: int,
@@ -341,8 +336,14 @@ async def decline_friend_request_endpoint(
 ):
     """Decline a friend request"""
     result = decline_friend_request(request_id, user['id'])
+    if result['success']:
+        await after_friend_request_declined(user, result)
     return JSONResponse(result)
 
+async def after_friend_request_declined(user: dict, result: dict):
+    """Invalidate the decliner's cached friend pages"""
+    data_versions.bump('friends', user['id'])
+
 @app.get("/api/friends")
 async def get_friends_endpoint(user: dict = Depends(get_current_user_required)):
     """Get list of friends"""
@@ -355,6 +356,58 @@ async def get_friend_requests_endpoint(user: dict = Depends(get_current_user_req
     requests = get_pending_friend_requests(user['id'])
     return JSONResponse({"success": True, "requests": requests})
 
+@app.get("/api/friends/suggestions")
+async def get_friend_suggestions_endpoint(
+    limit: int = 10,
+    user: dict = Depends(get_current_user_required)
+):
+    """Suggest users to befriend, ranked by mutual friends, then shared servers"""
+    await social_graph.ready()
+    ranked = social_graph.suggestions(user['id'], limit)
+    profiles = {profile['id']: profile for profile in get_users_by_ids([item['user_id'] for item in ranked])}
+    suggestions = [
+        {
+            "id": item['user_id'],
+            "username": profiles[item['user_id']]['username'],
+            "avatar": profiles[item['user_id']]['avatar'],
+            "mutual_friends": item['mutual_friends'],
+            "shared_servers": item['shared_servers']
+        }
+        for item in ranked if item['user_id'] in profiles
+    ]
+    return JSONResponse({"success": True, "suggestions": suggestions})
+
+@app.get("/api/users/search")
+async def search_users_endpoint(
+    q: str = "",
+    limit: int = 10,
+    user: dict = Depends(get_current_user_required)
+):
+    """Complete a username prefix - friends first, then members of shared servers, then everyone"""
+    await username_index.ready()
+    await social_graph.ready()
+    return JSONResponse({"success": True, "users": username_index.complete(user['id'], q, limit)})
+
+# Most mutual friends listed with their profiles (the count covers all of them)
+MAX_MUTUAL_FRIENDS_LISTED = 20
+
+@app.get("/api/friends/{user_id}/mutual")
+async def get_mutual_friends_endpoint(
+    user_id: int,
+    limit: int = MAX_MUTUAL_FRIENDS_LISTED,
+    user: dict = Depends(get_current_user_required)
+):
+    """Friends the current user has in common with another user"""
+    await social_graph.ready()
+    mutual = social_graph.mutual_friends(user['id'], user_id)
+    listed = get_users_by_ids(mutual[:max(0, min(limit, MAX_MUTUAL_FRIENDS_LISTED))])
+    return JSONResponse({
+        "success": True,
+        "count": len(mutual),
+        "shared_servers": social_graph.shared_server_count(user['id'], user_id),
+        "friends": [{"id": friend['id'], "username": friend['username'], "avatar": friend['avatar']} for friend in listed]
+    })
+
 # Status management endpoints
 @app.post("/api/status")
 async def update_status_endpoint(
@@ -363,6 +416,9 @@ async def update_status_endpoint(
 ):
     """Update user status (online, offline, invisible)"""
     result = update_user_status(user['id'], status)
+    if result['success']:
+        data_versions.bump('profile', user['id'])
+        await send_member_list_diffs(member_lists.set_status(user['id'], status))
     return JSONResponse(result)
 
 @app.get("/api/friends/status")
@@ -375,11 +431,18 @@ async def get_friends_status_endpoint(user: dict = Depends(get_current_user_requ
 @app.post("/api/messages/send")
 async def send_message_endpoint(
     receiver_id: int = Form(...),
-    message: str = Form(...),
+    message: str = Form(""),
+    attachments: Optional[str] = Form(None),
     user: dict = Depends(get_current_user_required)
 ):
-    """Send a private message to a friend"""
-    result = save_message(user['id'], receiver_id, message)
+    """Send a private message to a friend (attachments: JSON list of uploaded files)"""
+    try:
+        attachments = json.loads(attachments) if attachments else None
+    except ValueError:
+        return JSONResponse({"success": False, "message": "Invalid attachments!"}, status_code=400)
+    if not message and not attachments:
+        return JSONResponse({"success": False, "message": "Missing message"}, status_code=400)
+    result = save_message(user['id'], receiver_id, message, attachments)
     return JSONResponse(result)
 
 @app.get("/api/messages/{friend_id}")
@@ -391,6 +454,25 @@ async def get_messages_endpoint(
     messages = get_chat_history(user['id'], friend_id)
     return JSONResponse({"success": True, "messages": messages})
 
+# Conversation list endpoints
+@app.get("/api/conversations")
+async def get_conversations_endpoint(
+    limit: int = 50,
+    user: dict = Depends(get_current_user_required)
+):
+    """Get recent conversations with last message preview and unread counts"""
+    conversations = get_conversations(user['id'], min(limit, 200))
+    return JSONResponse({"success": True, "conversations": conversations})
+
+@app.post("/api/conversations/{conversation_id}/read")
+async def mark_conversation_read_endpoint(
+    conversation_id: int,
+    user: dict = Depends(get_current_user_required)
+):
+    """Mark a conversation as read"""
+    result = mark_conversation_read(conversation_id, user['id'])
+    return JSONResponse(result)
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """
@@ -428,6 +510,10 @@ async def create_server_route(
 ):
     """Create a new server"""
     result = create_server(name, current_user['id'])
+    if result['success']:
+        server_presence.add_member(result['server_id'], current_user['id'])
+        social_graph.add_server_member(result['server_id'], current_user['id'])
+        data_versions.bump('servers', current_user['id'])
     return JSONResponse(content=result)
 
 
@@ -462,17 +548,37 @@ async def invite_to_server_route(
     """Invite a user to a server"""
     result = send_server_invite(server_id, current_user['id'], user_id)
     
-    # Send real-time notification to invited user if online
+    # The invited user's notification was stored with the invite - deliver it in the background
     if result['success']:
-        server = get_server_by_id(server_id)
-        await manager.send_to_user(user_id, {
-            'type': 'new-server-invite',
-            'from_user_id': current_user['id'],
-            'from_username': current_user['username'],
-            'server_id': server_id,
-            'server_name': server.get('name') if server else 'Unknown Server',
-            'invite_id': result.get('invite_id')
-        })
+        data_versions.bump('servers', user_id)
+        outbox.wake()
+    
+    return JSONResponse(content=result)
+
+
+@app.post("/bulk-invite-to-server")
+async def bulk_invite_to_server_route(
+    request: Request,
+    current_user: dict = Depends(get_current_user_required)
+):
+    """Invite many users to a server at once (JSON: server_id, user_ids)"""
+    data = await request.json()
+    server_id = data.get('server_id')
+    user_ids = data.get('user_ids')
+    
+    if (not isinstance(server_id, int) or not isinstance(user_ids, list)
+            or not all(isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in user_ids)):
+        return JSONResponse(
+            content={"success": False, "message": "Missing server_id or user_ids"},
+            status_code=400
+        )
+    
+    result = send_server_invites(server_id, current_user['id'], user_ids)
+    
+    # The notifications were stored with the invites - deliver them in the background
+    if result['success'] and result['invited']:
+        data_versions.bump('servers', *(invite['user_id'] for invite in result['invited']))
+        outbox.wake()
     
     return JSONResponse(content=result)
 
@@ -491,9 +597,26 @@ async def accept_server_invite_route(
 ):
     """Accept a server invitation"""
     result = accept_server_invite(invite_id, current_user['id'])
+    if result['success']:
+        await after_server_invite_accepted(current_user, result)
     return JSONResponse(content=result)
 
 
+async def after_server_invite_accepted(current_user: dict, result: dict):
+    """Add the new member to the presence index and member lists, and tell the server"""
+    server_presence.add_member(result['server_id'], current_user['id'])
+    social_graph.add_server_member(result['server_id'], current_user['id'])
+    data_versions.bump('servers', current_user['id'])
+    await send_member_list_diffs(member_lists.add_member(result['server_id'], current_user))
+    await manager.send_to_server(result['server_id'], {
+        'type': 'server-member-joined',
+        'server_id': result['server_id'],
+        'user_id': current_user['id'],
+        'username': current_user['username'],
+        'avatar': current_user['avatar']
+    }, exclude_user_id=current_user['id'])
+
+
 @app.post("/decline-server-invite")
 async def decline_server_invite_route(
     invite_id: int = Form(...),
@@ -501,9 +624,16 @@ async def decline_server_invite_route(
 ):
     """Decline a server invitation"""
     result = decline_server_invite(invite_id, current_user['id'])
+    if result['success']:
+        await after_server_invite_declined(current_user, result)
     return JSONResponse(content=result)
 
 
+async def after_server_invite_declined(current_user: dict, result: dict):
+    """Invalidate the decliner's cached server pages"""
+    data_versions.bump('servers', current_user['id'])
+
+
 @app.post("/create-channel")
 async def create_channel_route(
     server_id: int = Form(...),
@@ -513,6 +643,28 @@ async def create_channel_route(
 ):
     """Create a new channel in a server"""
     result = create_channel(server_id, name, current_user['id'], channel_type)
+    if result['success']:
+        await manager.send_to_server(server_id, {
+            'type': 'channel-created',
+            'server_id': server_id,
+            'channel': {
+                'id': result['channel_id'],
+                'server_id': server_id,
+                'name': name,
+                'channel_type': channel_type if channel_type in ('voice', 'text') else 'voice'
+            }
+        })
+    return JSONResponse(content=result)
+
+
+@app.post("/server/{server_id}/retention")
+async def set_server_retention_route(
+    server_id: int,
+    max_age_days: Optional[int] = Form(None),
+    current_user: dict = Depends(get_current_user_required)
+):
+    """Set how many days channel messages are kept in a server (owner only, empty keeps them forever)"""
+    result = set_retention_policy("channel_messages", max_age_days, server_id, current_user['id'])
     return JSONResponse(content=result)
 
 
@@ -526,14 +678,51 @@ async def get_server_channels_route(
     return JSONResponse(content={"channels": channels})
 
 
+async def send_member_list_diffs(diffs: list):
+    """Deliver member list range diffs to the subscribed sessions"""
+    for session_id, message in diffs:
+        await manager.send_to_session(session_id, message)
+
+
+async def broadcast_voice_state(user_id: int, username: str, channel_id: int, in_voice: bool):
+    """Tell the online members of a channel's server that someone joined or left voice"""
+    server_id = voice_state.server_of(channel_id)
+    if server_id is not None:
+        await manager.send_to_server(server_id, {
+            'type': 'voice-state-changed',
+            'server_id': server_id,
+            'channel_id': channel_id,
+            'user_id': user_id,
+            'username': username,
+            'in_voice': in_voice
+        })
+
+
+async def announce_voice_left(user_id: int, username: str, channel_id: int):
+    """Notify the voice channel and its server that a user left voice"""
+    await manager.send_to_channel(channel_id, {
+        'type': 'user-left-voice',
+        'user_id': user_id,
+        'username': username
+    })
+    await broadcast_voice_state(user_id, username, channel_id, False)
+
+
 @app.post("/join-channel")
 async def join_channel_route(
     channel_id: int = Form(...),
     current_user: dict = Depends(get_current_user_required)
 ):
     """Join a channel"""
-    result = join_channel(channel_id, current_user['id'])
-    return JSONResponse(content=result)
+    result = check_channel_access(channel_id, current_user['id'])
+    if not result['success']:
+        return JSONResponse(content=result)
+    
+    left_voice = voice_state.join(current_user['id'], result['server_id'], channel_id)
+    if left_voice:
+        manager.leave_voice_channel(current_user['id'], left_voice)
+        await announce_voice_left(current_user['id'], current_user['username'], left_voice)
+    return JSONResponse(content={"success": True, "message": "Joined channel successfully!"})
 
 
 @app.post("/leave-channel")
@@ -542,8 +731,10 @@ async def leave_channel_route(
     current_user: dict = Depends(get_current_user_required)
 ):
     """Leave a channel"""
-    result = leave_channel(channel_id, current_user['id'])
-    return JSONResponse(content=result)
+    if voice_state.leave(current_user['id'], channel_id):
+        manager.leave_voice_channel(current_user['id'], channel_id)
+        await announce_voice_left(current_user['id'], current_user['username'], channel_id)
+    return JSONResponse(content={"success": True, "message": "Left channel successfully!"})
 
 
 @app.get("/channel/{channel_id}/members")
@@ -552,10 +743,28 @@ async def get_channel_members_route(
     current_user: dict = Depends(get_current_user_required)
 ):
     """Get all members in a channel"""
-    members = get_channel_members(channel_id)
+    members = get_users_by_ids(voice_state.get_channel_users(channel_id))
     return JSONResponse(content={"members": members})
 
 
+@app.get("/server/{server_id}/voice-states")
+async def get_server_voice_states_route(
+    server_id: int,
+    current_user: dict = Depends(get_current_user_required)
+):
+    """Get who is connected to voice in each channel of a server"""
+    if not is_server_member(server_id, current_user['id']):
+        raise HTTPException(status_code=403, detail="You are not a member of this server")
+    
+    channels: Dict[int, list] = {}
+    for user_id, channel_id in voice_state.get_server_voice(server_id).items():
+        channels.setdefault(channel_id, []).append(user_id)
+    return JSONResponse(content={"voice_states": [
+        {"channel_id": channel_id, "user_ids": user_ids}
+        for channel_id, user_ids in channels.items()
+    ]})
+
+
 @app.get("/channel/{channel_id}/messages")
 async def get_channel_messages_route(
     channel_id: int,
@@ -574,18 +783,284 @@ async def send_channel_message_route(
     """Send a message to a channel"""
     data = await request.json()
     channel_id = data.get('channel_id')
-    message = data.get('message')
+    message = data.get('message') or ''
+    attachments = data.get('attachments')
     
-    if not channel_id or not message:
+    if not channel_id or not (message or attachments):
         return JSONResponse(
             content={"success": False, "message": "Missing channel_id or message"},
             status_code=400
         )
     
-    result = save_channel_message(channel_id, current_user['id'], message)
+    if not voice_state.is_present(current_user['id'], channel_id):
+        return JSONResponse(content={"success": False, "message": "You must be in the channel to send messages!"})
+    
+    result = save_channel_message(channel_id, current_user['id'], message, attachments)
     return JSONResponse(content=result)
 
 
+# ============================================
+# ATTACHMENTS
+# ============================================
+
+@app.post("/api/attachments")
+async def upload_attachments_route(
+    request: Request,
+    current_user: dict = Depends(get_current_user_required)
+):
+    """Upload files (multipart, streamed to disk) - send the returned ids with a message"""
+    try:
+        attachments = await attachment_store.receive(request)
+    except UploadError as e:
+        return JSONResponse(
+            content={"success": False, "message": e.message},
+            status_code=e.status_code
+        )
+    return JSONResponse(content={"success": True, "attachments": attachments})
+
+
+@app.get("/api/attachments/{attachment_id}")
+async def download_attachment_route(
+    attachment_id: str,
+    filename: str = "file",
+    current_user: dict = Depends(get_current_user_required)
+):
+    """Download an attachment of a message the user can read - supports Range requests, cacheable forever"""
+    path = attachment_store.path(attachment_id)
+    attachment = get_attachment(attachment_id) if path else None
+    # Files the user cannot see are reported missing, so a hash does not reveal who sent what
+    if attachment is None or not os.path.exists(path) or not can_access_attachment(attachment_id, current_user['id']):
+        return JSONResponse(
+            content={"success": False, "message": "Attachment not found"},
+            status_code=404
+        )
+    content_type = attachment['content_type']
+    inline = content_type.split('/')[0] in ('image', 'audio', 'video') and content_type != 'image/svg+xml'
+    return FileResponse(
+        path,
+        media_type=content_type,
+        filename=clean_filename(filename),
+        content_disposition_type="inline" if inline else "attachment",
+        headers={
+            "Cache-Control": "private, max-age=31536000, immutable",
+            "X-Content-Type-Options": "nosniff"
+        }
+    )
+
+
+# ============================================
+# BATCH
+# ============================================
+
+# Operations one /api/batch request may contain
+MAX_BATCH_OPERATIONS = 50
+
+# Reads: name -> (argument types, function(user, **args) returning the body the route would, None if not found)
+BATCH_READS = {
+    'friends': ({}, lambda user: {"success": True, "friends": get_friends(user['id'])}),
+    'friends_status': ({}, lambda user: {"success": True, "friends": get_friends_with_status(user['id'])}),
+    'friend_requests': ({}, lambda user: {"success": True, "requests": get_pending_friend_requests(user['id'])}),
+    'conversations': ({}, lambda user: {"success": True, "conversations": get_conversations(user['id'])}),
+    'messages': ({'friend_id': int}, lambda user, friend_id: {
+        "success": True, "messages": get_chat_history(user['id'], friend_id)
+    }),
+    'my_servers': ({}, lambda user: {"servers": get_user_servers(user['id'])}),
+    'server': ({'server_id': int}, lambda user, server_id: get_server_by_id(server_id)),
+    'server_invites': ({}, lambda user: {"invites": get_pending_server_invites(user['id'])}),
+    'server_channels': ({'server_id': int}, lambda user, server_id: {"channels": get_server_channels(server_id)}),
+    'channel_members': ({'channel_id': int}, lambda user, channel_id: {
+        "members": get_users_by_ids(voice_state.get_channel_users(channel_id))
+    }),
+    'channel_messages': ({'channel_id': int}, lambda user, channel_id: {
+        "messages": get_channel_messages(channel_id)
+    }),
+}
+
+# Writes: name -> (argument types, function(user, **args) returning the operation's result,
+# coroutine run with (user, result) after the commit when it succeeded)
+BATCH_WRITES = {
+    'send_friend_request': (
+        {'username': str},
+        lambda user, username: send_friend_request(user['id'], username),
+        after_friend_request_sent
+    ),
+    'accept_friend_request': (
+        {'request_id': int},
+        lambda user, request_id: accept_friend_request(request_id, user['id']),
+        after_friend_request_accepted
+    ),
+    'decline_friend_request': (
+        {'request_id': int},
+        lambda user, request_id: decline_friend_request(request_id, user['id']),
+        after_friend_request_declined
+    ),
+    'accept_server_invite': (
+        {'invite_id': int},
+        lambda user, invite_id: accept_server_invite(invite_id, user['id']),
+        after_server_invite_accepted
+    ),
+    'decline_server_invite': (
+        {'invite_id': int},
+        lambda user, invite_id: decline_server_invite(invite_id, user['id']),
+        after_server_invite_declined
+    ),
+}
+
+
+def batch_arguments(types: dict, args) -> Optional[dict]:
+    """Check a batch operation's arguments - None when one is missing or has the wrong type"""
+    args = args if args is not None else {}
+    if not isinstance(args, dict):
+        return None
+    checked = {}
+    for name, expected in types.items():
+        value = args.get(name)
+        if not isinstance(value, expected) or isinstance(value, bool):
+            return None
+        checked[name] = value
+    return checked
+
+
+def batch_error(name, status_code: int, message: str) -> dict:
+    return {"op": name, "status": status_code, "body": {"success": False, "message": message}}
+
+
+@app.post("/api/batch")
+async def batch_route(
+    request: Request,
+    current_user: dict = Depends(get_current_user_required)
+):
+    """
+    Run several operations in one request:
+    {"operations": [{"op": "accept_friend_request", "args": {"request_id": 1}}, {"op": "my_servers"}]}
+    The writes run first, in one write transaction (each in its own savepoint, so a
+    failed one is undone alone), then the reads run against one snapshot and see the
+    writes. Results come back in request order as {"op", "status", "body"}.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return JSONResponse(
+            content={"success": False, "message": "Missing operations"},
+            status_code=400
+        )
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return JSONResponse(
+            content={"success": False, "message": f"At most {MAX_BATCH_OPERATIONS} operations per batch"},
+            status_code=400
+        )
+    
+    results = [None] * len(operations)
+    writes, reads = [], []
+    for index, operation in enumerate(operations):
+        name = operation.get('op') if isinstance(operation, dict) else None
+        spec = BATCH_WRITES.get(name) or BATCH_READS.get(name)
+        if spec is None:
+            results[index] = batch_error(name, 400, "Unknown operation")
+            continue
+        args = batch_arguments(spec[0], operation.get('args'))
+        if args is None:
+            results[index] = batch_error(name, 400, "Invalid arguments")
+            continue
+        (writes if name in BATCH_WRITES else reads).append((index, name, args))
+    
+    if writes:
+        outcomes = run_write_batch([
+            partial(BATCH_WRITES[name][1], current_user, **args) for _, name, args in writes
+        ])
+        for (index, name, _), result in zip(writes, outcomes):
+            if result.get('success'):
+                # Committed already - a failing follow-up must not turn the whole batch into a 500
+                try:
+                    await BATCH_WRITES[name][2](current_user, result)
+                except Exception as e:
+                    print(f"Batch {name} follow-up failed: {e}")
+            results[index] = {"op": name, "status": 200, "body": result}
+    
+    if reads:
+        with read_transaction():
+            for index, name, args in reads:
+                body = BATCH_READS[name][1](current_user, **args)
+                results[index] = (
+                    {"op": name, "status": 200, "body": body} if body is not None
+                    else batch_error(name, 404, "Not found")
+                )
+    
+    return JSONResponse(content={"success": True, "results": results})
+
+
+# ============================================
+# HISTORY EXPORT
+# ============================================
+
+def ndjson_stream(chunks, compress: bool = False):
+    """Encode chunks of rows as NDJSON, optionally gzip-compressed, one chunk at a time"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = "".join(json.dumps(row) + "\n" for row in chunk).encode("utf-8")
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+def export_response(chunks, filename: str, compress: bool) -> StreamingResponse:
+    """Stream an export as a downloadable NDJSON (or .ndjson.gz) file"""
+    if compress:
+        filename += ".gz"
+    return StreamingResponse(
+        ndjson_stream(chunks, compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/api/export/messages/{friend_id}")
+async def export_messages_route(
+    friend_id: int,
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_user_required)
+):
+    """Export the full DM history with a user"""
+    chunks = iter_direct_messages(current_user['id'], friend_id)
+    return export_response(chunks, f"messages-{current_user['id']}-{friend_id}.ndjson", gzip)
+
+
+@app.get("/api/export/channel/{channel_id}")
+async def export_channel_route(
+    channel_id: int,
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_user_required)
+):
+    """Export the full history of a channel"""
+    channel = get_channel_by_id(channel_id)
+    if not channel or not is_server_member(channel['server_id'], current_user['id']):
+        return JSONResponse(
+            content={"success": False, "message": "Channel not found"},
+            status_code=404
+        )
+    return export_response(iter_channel_messages(channel_id), f"channel-{channel_id}.ndjson", gzip)
+
+
+@app.get("/api/export/server/{server_id}")
+async def export_server_route(
+    server_id: int,
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_user_required)
+):
+    """Export the history of every channel in a server"""
+    if not is_server_member(server_id, current_user['id']):
+        return JSONResponse(
+            content={"success": False, "message": "Server not found"},
+            status_code=404
+        )
+    return export_response(iter_server_messages(server_id), f"server-{server_id}.ndjson", gzip)
+
+
 # ============================================
 # WEBSOCKET
 # ============================================
@@ -612,6 +1087,39 @@ async def get_websocket_user(websocket: WebSocket) -> Optional[dict]:
     print(f"WebSocket auth successful for user: {user['username'] if user else 'None'}")
     return user
 
+async def send_to_channel_members(channel_id: int, message: dict, exclude_user_id: Optional[int] = None):
+    """Send a message to everyone currently in a channel (not only voice)"""
+    await manager.send_to_users(voice_state.get_channel_users(channel_id), message, exclude_user_id)
+
+@app.get("/api/stats/websocket")
+async def websocket_stats(user: dict = Depends(get_current_user_required)):
+    """Connection and heartbeat metrics (reaped dead connections, probes sent)"""
+    return JSONResponse({
+        "sessions": len(manager.sessions),
+        "online_users": len(manager.user_sessions),
+        "heartbeat": heartbeat.metrics()
+    })
+
+@app.get("/api/stats/outbox")
+async def outbox_stats(user: dict = Depends(get_current_user_required)):
+    """Notification outbox metrics (delivered, backlog waiting for the dispatcher)"""
+    return JSONResponse(outbox.metrics())
+
+@app.get("/api/stats/loop")
+async def loop_stats(user: dict = Depends(get_current_user_required)):
+    """Event loop lag metrics (lag percentiles, recent stalls with their stacks, sync I/O in debug mode)"""
+    return JSONResponse(loop_monitor.metrics())
+
+@app.get("/api/stats/tracing")
+async def tracing_stats(user: dict = Depends(get_current_user_required)):
+    """Tracing metrics (sample rate, traces and spans written, spans dropped)"""
+    return JSONResponse(tracer.metrics())
+
+@app.get("/api/stats/retention")
+async def retention_stats(user: dict = Depends(get_current_user_required)):
+    """Retention job metrics (rows purged, bytes reclaimed, write lock hold times)"""
+    return JSONResponse(retention.metrics())
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -626,72 +1134,153 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
         return
     
-    # Accept connection only after authentication succeeds
-    await websocket.accept()
+    # Held until the session is registered - accept() and the replay await
+    if not manager.reserve(user['id']):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Too many connections")
+        return
+    
     user_id = user['id']
-    await manager.connect(user_id, websocket)
-    print(f"User {user['username']} (ID: {user_id}) connected to WebSocket")
+    try:
+        # Accept connection only after authentication succeeds
+        codec = negotiate(websocket)
+        await websocket.accept(subprotocol=codec.subprotocol)
+        
+        # Replay events missed since the client's resume token (last processed seq).
+        # Done before registering the connection so live events cannot overtake the replay.
+        resume_token = websocket.query_params.get("resume")
+        last_seq = int(resume_token) if resume_token and resume_token.isdigit() else None
+        resumed = False
+        replayed = 0
+        if last_seq is not None:
+            while True:
+                missed = event_log.events_after(user_id, last_seq)
+                if not missed:
+                    resumed = missed is not None
+                    break
+                for event in missed:
+                    await codec.send_frame(websocket, codec.encode(event))
+                last_seq = missed[-1]['seq']
+                replayed += len(missed)
+        
+        session = await manager.connect(user_id, user['username'], websocket, codec)
+    finally:
+        manager.release(user_id)
+    session_id = session.session_id
+    # The handlers work from the compact session record - don't keep the whole user row alive
+    del user
+    heartbeat.track(session)
+    voice_state.attach(user_id)
+    if len(manager.user_sessions[user_id]) == 1:
+        await send_member_list_diffs(member_lists.set_connected(user_id, True))
+    await manager.send_to_session(session_id, {
+        'type': 'session-sync',
+        'session_id': session_id,
+        'seq': event_log.current_seq(user_id),
+        'resumed': resumed,
+        'replayed': replayed,
+        'heartbeat': heartbeat.config()
+    })
+    print(f"User {session.username} (ID: {user_id}) connected to WebSocket")
     
+    trace = NO_SPAN
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # The previous message's trace ends here - also reached through continue
+            trace.end()
+            data = await codec.receive_frame(websocket)
+            message = codec.decode(data)
             msg_type = message.get('type')
+            heartbeat.seen(session)
+            trace = tracer.start_trace(f"ws {msg_type}", "ws", user_id=user_id)
             
             # Handle different message types
-            if msg_type == 'voice-call-offer':
+            if msg_type == 'ping':
+                await manager.send_to_session(session_id, {'type': 'pong'})
+            
+            elif msg_type == 'pong':
+                # Answer to a server ping - being seen is all that matters
+                pass
+            
+            elif msg_type == 'voice-call-offer':
                 # 1-on-1 voice call offer
                 target_user_id = message.get('target_user_id')
-                await manager.send_to_user(target_user_id, {
+                await manager.send_to_target(target_user_id, message.get('target_session_id'), {
                     'type': 'voice-call-offer',
                     'from_user_id': user_id,
-                    'from_username': user['username'],
+                    'from_session_id': session_id,
+                    'from_username': session.username,
                     'offer': message.get('offer')
                 })
             
             elif msg_type == 'voice-call-answer':
                 # 1-on-1 voice call answer
                 target_user_id = message.get('target_user_id')
-                await manager.send_to_user(target_user_id, {
+                await manager.send_to_target(target_user_id, message.get('target_session_id'), {
                     'type': 'voice-call-answer',
                     'from_user_id': user_id,
+                    'from_session_id': session_id,
                     'answer': message.get('answer')
                 })
             
             elif msg_type == 'ice-candidate':
                 # ICE candidate for WebRTC connection
                 target_user_id = message.get('target_user_id')
-                await manager.send_to_user(target_user_id, {
+                await manager.send_to_target(target_user_id, message.get('target_session_id'), {
                     'type': 'ice-candidate',
                     'from_user_id': user_id,
+                    'from_session_id': session_id,
                     'candidate': message.get('candidate')
                 })
             
             elif msg_type == 'call-end':
                 # End 1-on-1 call
                 target_user_id = message.get('target_user_id')
-                await manager.send_to_user(target_user_id, {
+                await manager.send_to_target(target_user_id, message.get('target_session_id'), {
                     'type': 'call-end',
-                    'from_user_id': user_id
+                    'from_user_id': user_id,
+                    'from_session_id': session_id
                 })
             
             elif msg_type == 'join-voice-channel':
                 # User joins a voice channel
                 channel_id = message.get('channel_id')
-                manager.join_voice_channel(user_id, channel_id)
+                # Only the channel's server comes from the cache - membership is checked on every join
+                server_id = voice_state.server_of(channel_id)
+                if server_id is None:
+                    access = check_channel_access(channel_id, user_id)
+                    if not access['success']:
+                        await manager.send_to_session(session_id, {
+                            'type': 'error',
+                            'message': access['message']
+                        })
+                        continue
+                    server_id = access['server_id']
+                elif not server_presence.is_member(server_id, user_id):
+                    await manager.send_to_session(session_id, {
+                        'type': 'error',
+                        'message': 'You are not a member of this server!'
+                    })
+                    continue
+                left_voice = voice_state.join_voice(user_id, server_id, channel_id)
+                manager.join_voice_channel(session_id, channel_id)
+                
+                # Voice is one channel at a time - tell the old channel
+                if left_voice:
+                    await announce_voice_left(user_id, session.username, left_voice)
                 
                 # Get other users in channel
-                other_users = [uid for uid in manager.get_channel_users(channel_id) if uid != user_id]
+                other_users = [uid for uid in voice_state.get_voice_users(channel_id) if uid != user_id]
                 
                 # Notify existing users
                 await manager.send_to_channel(channel_id, {
                     'type': 'user-joined-voice',
                     'user_id': user_id,
-                    'username': user['username']
+                    'username': session.username
                 }, exclude_user_id=user_id)
+                await broadcast_voice_state(user_id, session.username, channel_id, True)
                 
                 # Send list of existing users to new joiner
-                await manager.send_to_user(user_id, {
+                await manager.send_to_session(session_id, {
                     'type': 'voice-channel-users',
                     'channel_id': channel_id,
                     'user_ids': other_users
@@ -700,20 +1289,18 @@ async def websocket_endpoint(websocket: WebSocket):
             elif msg_type == 'leave-voice-channel':
                 # User leaves voice channel
                 channel_id = message.get('channel_id')
+                was_in_voice = voice_state.leave_voice(user_id, channel_id)
                 manager.leave_voice_channel(user_id, channel_id)
                 
                 # Notify other users
-                await manager.send_to_channel(channel_id, {
-                    'type': 'user-left-voice',
-                    'user_id': user_id,
-                    'username': user['username']
-                })
+                if was_in_voice:
+                    await announce_voice_left(user_id, session.username, channel_id)
             
             elif msg_type == 'channel-voice-offer':
                 # WebRTC offer for channel voice
                 target_user_id = message.get('target_user_id')
                 channel_id = message.get('channel_id')
-                await manager.send_to_user(target_user_id, {
+                await manager.send_to_channel_member(target_user_id, channel_id, {
                     'type': 'channel-voice-offer',
                     'from_user_id': user_id,
                     'channel_id': channel_id,
@@ -724,7 +1311,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 # WebRTC answer for channel voice
                 target_user_id = message.get('target_user_id')
                 channel_id = message.get('channel_id')
-                await manager.send_to_user(target_user_id, {
+                await manager.send_to_channel_member(target_user_id, channel_id, {
                     'type': 'channel-voice-answer',
                     'from_user_id': user_id,
                     'channel_id': channel_id,
@@ -735,7 +1322,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 # ICE candidate for channel voice
                 target_user_id = message.get('target_user_id')
                 channel_id = message.get('channel_id')
-                await manager.send_to_user(target_user_id, {
+                await manager.send_to_channel_member(target_user_id, channel_id, {
                     'type': 'channel-ice-candidate',
                     'from_user_id': user_id,
                     'channel_id': channel_id,
@@ -745,48 +1332,122 @@ async def websocket_endpoint(websocket: WebSocket):
             elif msg_type == 'private-message':
                 # Private message between users
                 receiver_id = message.get('receiver_id')
-                msg_text = message.get('message')
+                msg_text = message.get('message') or ''
+                attachments = message.get('attachments')
                 
                 # Save message to database
-                result = save_message(user_id, receiver_id, msg_text)
+                result = save_message(user_id, receiver_id, msg_text, attachments)
                 
                 if result['success']:
                     # Send to receiver if online
-                    await manager.send_to_user(receiver_id, {
+                    await manager.send_event(receiver_id, {
                         'type': 'new-private-message',
                         'from_user_id': user_id,
-                        'from_username': user['username'],
+                        'from_username': session.username,
                         'message': msg_text,
+                        'attachments': result['attachments'],
                         'timestamp': result.get('timestamp')
                     })
                     
                     # Confirm to sender
-                    await manager.send_to_user(user_id, {
+                    await manager.send_to_session(session_id, {
                         'type': 'message-sent',
                         'success': True,
                         'receiver_id': receiver_id
                     })
+                else:
+                    await manager.send_to_session(session_id, {
+                        'type': 'error',
+                        'message': result['message']
+                    })
             
             elif msg_type == 'channel-message':
                 # Channel message
                 channel_id = message.get('channel_id')
-                msg_text = message.get('message')
+                msg_text = message.get('message') or ''
+                attachments = message.get('attachments')
+                
+                if not voice_state.is_present(user_id, channel_id):
+                    await manager.send_to_session(session_id, {
+                        'type': 'error',
+                        'message': 'You must be in the channel to send messages!'
+                    })
+                    continue
                 
                 # Save message to database
-                result = save_channel_message(channel_id, user_id, msg_text)
+                result = save_channel_message(channel_id, user_id, msg_text, attachments)
                 
                 if result['success']:
                     # Broadcast to all channel members
-                    members = get_channel_members(channel_id)
-                    for member in members:
-                        await manager.send_to_user(member['id'], {
+                    for member_id in voice_state.get_channel_users(channel_id):
+                        await manager.send_event(member_id, {
                             'type': 'new-channel-message',
                             'channel_id': channel_id,
                             'from_user_id': user_id,
-                            'from_username': user['username'],
+                            'from_username': session.username,
                             'message': msg_text,
+                            'attachments': result['attachments'],
                             'timestamp': result.get('timestamp')
                         })
+                else:
+                    await manager.send_to_session(session_id, {
+                        'type': 'error',
+                        'message': result['message']
+                    })
+            
+            elif msg_type == 'typing':
+                # Typing indicator - ephemeral: throttled, coalesced, never stored
+                is_typing = bool(message.get('typing', True))
+                channel_id = message.get('channel_id')
+                receiver_id = message.get('receiver_id')
+                payload = {
+                    'type': 'typing',
+                    'user_id': user_id,
+                    'username': session.username,
+                    'typing': is_typing
+                }
+                
+                if channel_id is not None:
+                    if not voice_state.is_present(user_id, channel_id):
+                        continue
+                    payload['channel_id'] = channel_id
+                    await ephemeral.publish(
+                        ('typing', 'channel', channel_id, user_id), payload,
+                        partial(send_to_channel_members, channel_id, exclude_user_id=user_id)
+                    )
+                elif receiver_id is not None:
+                    # Only friends see it - anyone else could use it to probe who is online
+                    await social_graph.ready()
+                    if not isinstance(receiver_id, int) or not social_graph.are_friends(user_id, receiver_id):
+                        continue
+                    await ephemeral.publish(
+                        ('typing', 'dm', receiver_id, user_id), payload,
+                        partial(manager.send_to_user, receiver_id)
+                    )
+            
+            elif msg_type == 'member-list-subscribe':
+                # Subscribe to a range of a server's member list (replaces this session's previous range)
+                server_id = message.get('server_id')
+                if not server_presence.is_member(server_id, user_id):
+                    await manager.send_to_session(session_id, {
+                        'type': 'error',
+                        'message': 'You are not a member of this server!'
+                    })
+                    continue
+                start = message.get('start', 0)
+                end = message.get('end', start + 100)
+                if not isinstance(start, int) or not isinstance(end, int):
+                    continue
+                await manager.send_to_session(session_id, member_lists.subscribe(session_id, server_id, start, end))
+            
+            elif msg_type == 'member-list-unsubscribe':
+                member_lists.unsubscribe(session_id, message.get('server_id'))
+            
+            elif msg_type == 'ack':
+                # Client processed every event up to this sequence number
+                seq = message.get('seq')
+                if isinstance(seq, int):
+                    event_log.ack(user_id, seq)
             
             elif msg_type == 'status-update':
                 # User status update
@@ -794,20 +1455,41 @@ async def websocket_endpoint(websocket: WebSocket):
                 result = update_user_status(user_id, new_status)
                 
                 if result['success']:
+                    data_versions.bump('profile', user_id)
+                    await send_member_list_diffs(member_lists.set_status(user_id, new_status))
+                    
                     # Notify all friends
                     friends = get_friends(user_id)
                     for friend in friends:
-                        await manager.send_to_user(friend['id'], {
+                        await manager.send_event(friend['id'], {
                             'type': 'friend-status-changed',
                             'user_id': user_id,
-                            'username': user['username'],
+                            'username': session.username,
                             'status': new_status
                         })
             
             else:
                 # Echo unknown messages
-                await websocket.send_text(f"Echo: {data}")
+                if codec.binary:
+                    await manager.send_to_session(session_id, {'type': 'echo', 'data': message})
+                else:
+                    await websocket.send_text(f"Echo: {data}")
                 
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
-        print(f"User {user['username']} disconnected from WebSocket")
+        pass
+    finally:
+        trace.end()
+        # Cleanup runs for any exit so a crashed handler cannot leak its session.
+        # Voice ends with the device carrying it; channel presence survives until the
+        # user's last device is gone, plus the reconnect grace period
+        left_voice = manager.disconnect(session_id)
+        heartbeat.untrack(session)
+        member_lists.unsubscribe(session_id)
+        for channel_id in left_voice:
+            voice_state.leave_voice(user_id, channel_id)
+        if not manager.is_online(user_id):
+            left_voice += voice_state.detach(user_id)
+            await send_member_list_diffs(member_lists.set_connected(user_id, False))
+        for channel_id in left_voice:
+            await announce_voice_left(user_id, session.username, channel_id)
+        print(f"User {session.username} disconnected from WebSocket")
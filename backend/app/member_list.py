@@ -0,0 +1,279 @@
+"""Range-subscribed server member lists
+
+Instead of downloading every member of a server, a client subscribes to an
+index range (e.g. rows 0-99) of the server's member list. The list is sorted
+online-first, then by username, and is kept sorted incrementally in memory
+while anyone is subscribed. When a member comes online, goes offline, changes
+status or joins, only subscribers whose range is affected get a diff with
+DELETE / INSERT / UPDATE operations relative to their own range.
+
+A member counts as online while they have an open connection and their status
+is not 'invisible' or 'offline'.
+"""
+import time
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional
+
+from .database import get_server_members
+from .connection_manager import manager
+
+# Largest range a single subscription may cover
+MAX_RANGE_SIZE = 200
+
+# Lists with at least this many members stay loaded for a while after their last subscriber leaves
+KEEP_LOADED_MEMBERS = 1000
+
+# Seconds an unsubscribed large list stays loaded (and kept up to date) before it is dropped
+UNLOAD_GRACE = 300.0
+
+
+class MemberEntry:
+    __slots__ = ("user_id", "username", "avatar", "status", "connected")
+
+    def __init__(self, user_id: int, username: str, avatar: str, status: str, connected: bool):
+        self.user_id = user_id
+        self.username = username
+        self.avatar = avatar
+        self.status = status
+        self.connected = connected
+
+    @property
+    def online(self) -> bool:
+        return self.connected and self.status not in ('invisible', 'offline')
+
+    def sort_key(self) -> tuple:
+        return (0 if self.online else 1, self.username.lower(), self.user_id)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.user_id,
+            'username': self.username,
+            'avatar': self.avatar,
+            'status': self.status if self.online else 'offline'
+        }
+
+
+class ServerMemberList:
+    """Sorted member list of one server"""
+
+    def __init__(self, server_id: int):
+        self.server_id = server_id
+        self.entries: Dict[int, MemberEntry] = {}  # user_id -> entry
+        self.keys: List[tuple] = []  # sorted sort keys
+        self.online_count = 0
+        self.subscribers: Dict[str, tuple] = {}  # session_id -> (start, end)
+
+    def load(self, entries: List[MemberEntry]):
+        """Fill an empty list - one sort instead of an insort per member"""
+        self.entries = {entry.user_id: entry for entry in entries}
+        self.keys = sorted(entry.sort_key() for entry in entries)
+        self.online_count = sum(1 for entry in entries if entry.online)
+
+    def add(self, entry: MemberEntry):
+        """Add one member to a loaded list"""
+        self.entries[entry.user_id] = entry
+        insort(self.keys, entry.sort_key())
+        if entry.online:
+            self.online_count += 1
+
+    def remove(self, entry: MemberEntry):
+        del self.keys[bisect_left(self.keys, entry.sort_key())]
+        if entry.online:
+            self.online_count -= 1
+
+    def window(self, start: int, end: int) -> List[int]:
+        """User ids in [start, end)"""
+        return [key[2] for key in self.keys[start:end]]
+
+
+class MemberListRegistry:
+    def __init__(self):
+        self.lists: Dict[int, ServerMemberList] = {}  # server_id -> list (only while subscribed)
+        self.user_lists: Dict[int, set] = {}  # user_id -> server ids of loaded lists containing them
+        self.session_lists: Dict[str, set] = {}  # session_id -> subscribed server ids
+        self.idle: Dict[int, float] = {}  # server_id -> when its last subscriber left (large lists only)
+
+    # ---------- Subscriptions ----------
+
+    def _load(self, server_id: int) -> ServerMemberList:
+        member_list = self.lists.get(server_id)
+        if member_list is None:
+            member_list = self.lists[server_id] = ServerMemberList(server_id)
+            entries = [self._entry(member) for member in get_server_members(server_id)]
+            member_list.load(entries)
+            for entry in entries:
+                self.user_lists.setdefault(entry.user_id, set()).add(server_id)
+        return member_list
+
+    @staticmethod
+    def _entry(member: dict) -> MemberEntry:
+        return MemberEntry(
+            member['id'], member['username'], member['avatar'], member['status'],
+            manager.is_online(member['id'])
+        )
+
+    def _add_entry(self, member_list: ServerMemberList, member: dict):
+        member_list.add(self._entry(member))
+        self.user_lists.setdefault(member['id'], set()).add(member_list.server_id)
+
+    def _unload(self, member_list: ServerMemberList):
+        del self.lists[member_list.server_id]
+        self.idle.pop(member_list.server_id, None)
+        for user_id in member_list.entries:
+            servers = self.user_lists.get(user_id)
+            if servers is not None:
+                servers.discard(member_list.server_id)
+                if not servers:
+                    del self.user_lists[user_id]
+
+    def subscribe(self, session_id: str, server_id: int, start: int, end: int) -> dict:
+        """Subscribe a session to a range of a server's member list - returns the initial sync"""
+        start = max(0, start)
+        end = max(start, min(end, start + MAX_RANGE_SIZE))
+        self._unload_idle()
+        self.idle.pop(server_id, None)
+        member_list = self._load(server_id)
+        member_list.subscribers[session_id] = (start, end)
+        self.session_lists.setdefault(session_id, set()).add(server_id)
+        return {
+            'type': 'member-list-sync',
+            'server_id': server_id,
+            'start': start,
+            'end': end,
+            'total': len(member_list.keys),
+            'online': member_list.online_count,
+            'members': [member_list.entries[user_id].to_dict() for user_id in member_list.window(start, end)]
+        }
+
+    def unsubscribe(self, session_id: str, server_id: Optional[int] = None):
+        """Drop one subscription of a session, or all of them when server_id is None"""
+        server_ids = self.session_lists.get(session_id, set())
+        targets = list(server_ids) if server_id is None else [server_id]
+        for target in targets:
+            server_ids.discard(target)
+            member_list = self.lists.get(target)
+            if member_list is None:
+                continue
+            member_list.subscribers.pop(session_id, None)
+            if not member_list.subscribers:
+                if len(member_list.entries) >= KEEP_LOADED_MEMBERS:
+                    # Reloading a large list is expensive - keep it around in case someone comes back
+                    self.idle[target] = time.monotonic()
+                else:
+                    self._unload(member_list)
+        if not server_ids:
+            self.session_lists.pop(session_id, None)
+        self._unload_idle()
+
+    def _unload_idle(self):
+        """Drop large lists nobody subscribed to within UNLOAD_GRACE"""
+        now = time.monotonic()
+        for server_id, since in list(self.idle.items()):
+            if now - since >= UNLOAD_GRACE:
+                self._unload(self.lists[server_id])
+
+    # ---------- Changes ----------
+
+    def _change(self, member_list: ServerMemberList, user_id: int, mutate: Callable[[], None]) -> list:
+        """
+        Apply a change to one member and return (session_id, diff message) pairs
+        A change moves one member from its old index to its new one (or inserts it), so only
+        the rows between the two indexes shift - subscribers whose range is outside them get
+        no diff and nothing is copied for them
+        """
+        entry = member_list.entries.get(user_id)
+        old_index = bisect_left(member_list.keys, entry.sort_key()) if entry is not None else None
+        mutate()
+        new_index = bisect_left(member_list.keys, member_list.entries[user_id].sort_key())
+
+        # Rows [low, high] changed; an insert shifts everything after it
+        low = new_index if old_index is None else min(old_index, new_index)
+        high = len(member_list.keys) - 1 if old_index is None else max(old_index, new_index)
+
+        diffs = []
+        for session_id, (start, end) in member_list.subscribers.items():
+            if start > high or end <= low:
+                continue
+            old = self._old_window(member_list, old_index, new_index, start, end)
+            ops = self._diff(member_list, user_id, old, member_list.window(start, end), start)
+            if ops:
+                diffs.append((session_id, {
+                    'type': 'member-list-update',
+                    'server_id': member_list.server_id,
+                    'total': len(member_list.keys),
+                    'online': member_list.online_count,
+                    'ops': ops
+                }))
+        return diffs
+
+    @staticmethod
+    def _old_window(member_list: ServerMemberList, old_index: Optional[int], new_index: int,
+                    start: int, end: int) -> List[int]:
+        """User ids that were in [start, end) before the member now at new_index moved from old_index (None: was added)"""
+        keys = member_list.keys
+        old_size = len(keys) - (old_index is None)
+        window = []
+        for index in range(start, min(end, old_size)):
+            if index == old_index:
+                current = new_index
+            elif old_index is None or index < old_index:
+                current = index + 1 if index >= new_index else index
+            else:
+                current = index - 1 if index - 1 < new_index else index
+            window.append(keys[current][2])
+        return window
+
+    @staticmethod
+    def _diff(member_list: ServerMemberList, user_id: int, old: list, new: list, start: int) -> list:
+        """
+        Operations turning the old window into the new one, indexes absolute
+        Apply DELETEs in order, then INSERTs in order, then UPDATEs
+        """
+        new_set = set(new)
+        moved = user_id in new_set and user_id in old and old.index(user_id) != new.index(user_id)
+        old_set = set(old) - ({user_id} if moved else set())
+        ops = []
+        for index in range(len(old) - 1, -1, -1):
+            if old[index] not in new_set or (moved and old[index] == user_id):
+                ops.append({'op': 'DELETE', 'index': start + index})
+        for index, uid in enumerate(new):
+            if uid not in old_set:
+                ops.append({'op': 'INSERT', 'index': start + index, 'member': member_list.entries[uid].to_dict()})
+        if user_id in old_set and user_id in new_set:
+            ops.append({'op': 'UPDATE', 'index': start + new.index(user_id), 'member': member_list.entries[user_id].to_dict()})
+        return ops
+
+    def _update_entry(self, user_id: int, **changes) -> list:
+        diffs = []
+        for server_id in list(self.user_lists.get(user_id, ())):
+            member_list = self.lists[server_id]
+            entry = member_list.entries[user_id]
+            if all(getattr(entry, name) == value for name, value in changes.items()):
+                continue
+
+            def mutate():
+                member_list.remove(entry)
+                for name, value in changes.items():
+                    setattr(entry, name, value)
+                member_list.add(entry)
+
+            diffs.extend(self._change(member_list, user_id, mutate))
+        return diffs
+
+    def set_connected(self, user_id: int, connected: bool) -> list:
+        """User's first session opened or last session closed"""
+        return self._update_entry(user_id, connected=connected)
+
+    def set_status(self, user_id: int, status: str) -> list:
+        """User changed their status"""
+        return self._update_entry(user_id, status=status)
+
+    def add_member(self, server_id: int, member: dict) -> list:
+        """User joined a server"""
+        member_list = self.lists.get(server_id)
+        if member_list is None or member['id'] in member_list.entries:
+            return []
+        return self._change(member_list, member['id'], lambda: self._add_entry(member_list, member))
+
+
+member_lists = MemberListRegistry()
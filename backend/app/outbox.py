@@ -0,0 +1,133 @@
+"""Background dispatcher for the notification outbox
+
+Routes no longer send friend request and server invite notifications before
+responding: the database operation stores them in notification_outbox in the
+same transaction as the change (see database/outbox_operations.py), the route
+calls wake() and returns. The dispatcher then drains the outbox in batches of
+DISPATCH_BATCH, oldest first:
+
+    read batch -> manager.send_events() -> event_log.flush() -> delete batch
+
+Rows are only deleted once the event log has written the events to
+user_events, so a restart at any point loses nothing - undelivered rows are
+picked up again on startup. If that write fails, the batch stays in the outbox
+and the event log keeps the events pending; the next pass retries the write and
+only then deletes the rows. A crash between the flush and the delete can send
+a notification twice (at-least-once); every notification carries the id of the
+request or invite it is about, so clients can tell.
+
+wake() makes delivery immediate; the POLL_INTERVAL timer only covers rows
+written while no dispatcher was listening (e.g. by another process).
+"""
+import asyncio
+import time
+from typing import Optional
+
+from .database import get_outbox_batch, delete_outbox_rows, get_outbox_backlog
+from .connection_manager import manager
+from .event_log import event_log
+
+# Notifications delivered per batch
+DISPATCH_BATCH = 500
+
+# Seconds between outbox checks when nothing wakes the dispatcher
+POLL_INTERVAL = 1.0
+
+
+class OutboxDispatcher:
+    def __init__(self, batch_size: int = DISPATCH_BATCH, poll_interval: float = POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.last_id = 0  # Highest outbox id handed to the event log
+        self.deleted_id = 0  # Highest outbox id deleted (stored in user_events)
+        self._wake = asyncio.Event()
+        self._event_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Metrics
+        self.delivered = 0
+        self.batches = 0
+        self.last_batch_seconds = 0.0
+
+    def wake(self):
+        """New notifications were committed - deliver them now (safe from any thread)"""
+        if self._event_loop is not None:
+            self._event_loop.call_soon_threadsafe(self._wake.set)
+
+    async def dispatch_once(self) -> int:
+        """
+        Deliver one batch - returns how many notifications it held
+        Raises RuntimeError if the event log could not store them; the rows are then kept
+        and deleted by a later pass, once the event log's retried write succeeds
+        """
+        rows = await asyncio.to_thread(get_outbox_batch, self.last_id, self.batch_size)
+        start = time.perf_counter()
+        if rows:
+            # Sent once: the event log holds them from here and retries its write until it succeeds
+            await manager.send_events([(row['user_id'], row['event']) for row in rows])
+            self.last_id = rows[-1]['id']
+
+        if self.deleted_id < self.last_id:
+            # Delivered for good once the event log has them (replayed on reconnect from there)
+            if not await event_log.flush():
+                raise RuntimeError("event log write failed, notifications kept in the outbox")
+            result = await asyncio.to_thread(delete_outbox_rows, self.last_id)
+            if not result['success']:
+                raise RuntimeError(result['message'])
+            self.deleted_id = self.last_id
+
+        if rows:
+            self.delivered += len(rows)
+            self.batches += 1
+            self.last_batch_seconds = time.perf_counter() - start
+        return len(rows)
+
+    async def drain(self):
+        """Deliver everything that is in the outbox"""
+        while await self.dispatch_once() == self.batch_size:
+            pass
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                # Rows stay in the outbox and are retried on the next pass
+                print(f"Outbox dispatch failed: {e}")
+            if self._stopping:
+                return
+
+    def start(self):
+        """Start the dispatcher (delivers anything left over from before a restart first)"""
+        if self._task is None:
+            self._stopping = False
+            self._event_loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._loop())
+            self.wake()
+
+    async def stop(self):
+        """Stop the dispatcher after delivering what is already committed"""
+        if self._task is not None:
+            # Let the loop finish its current batch and drain the rest, instead of cancelling mid-batch
+            self._stopping = True
+            self.wake()
+            await self._task
+            self._task = None
+            self._event_loop = None
+
+    def metrics(self) -> dict:
+        return {
+            "delivered": self.delivered,
+            "batches": self.batches,
+            "last_batch_seconds": round(self.last_batch_seconds, 6),
+            "backlog": get_outbox_backlog()
+        }
+
+
+outbox = OutboxDispatcher()
@@ -0,0 +1,153 @@
+"""Template rendering caches
+
+- Compiled templates go to a Jinja bytecode cache on disk and every template is
+  compiled once at startup, so no request (and no restart) pays for parsing.
+- Pages shown to anonymous visitors (/, /register) are the same for everyone:
+  the rendered body is kept per template and served with an ETag. It is
+  re-rendered when Jinja reloads the template after an edit.
+- The per-user sections of the home page are cached as HTML fragments keyed on
+  the versions of the data behind them. Versions are in-memory counters bumped
+  wherever that data is written, so a cache hit needs no query at all.
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, Response
+
+from .database import (
+    get_friends_with_status, get_pending_friend_requests,
+    get_user_servers, get_pending_server_invites
+)
+
+# Fragments kept at most (least recently used are dropped)
+MAX_FRAGMENTS = 10_000
+
+
+def create_environment(directory: str) -> Environment:
+    """Jinja environment with an on-disk bytecode cache (in the system temp folder)"""
+    return Environment(
+        loader=FileSystemLoader(directory),
+        autoescape=select_autoescape(),
+        bytecode_cache=FileSystemBytecodeCache(),
+        cache_size=-1
+    )
+
+
+def precompile_templates(env: Environment) -> int:
+    """Load every template so none is compiled on a request - returns the count"""
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+class DataVersions:
+    """
+    Counters bumped whenever cached data changes
+
+    - ('friends', user_id): the user's friendships and incoming friend requests
+    - ('profile', user_id): what others see of the user (status)
+    - ('servers', user_id): the user's servers and incoming server invites
+    """
+
+    def __init__(self):
+        self.versions: Dict[tuple, int] = {}
+
+    def get(self, kind: str, key: int) -> int:
+        return self.versions.get((kind, key), 0)
+
+    def bump(self, kind: str, *keys: int):
+        for key in keys:
+            self.versions[(kind, key)] = self.versions.get((kind, key), 0) + 1
+
+
+class PageCache:
+    """Rendered pages that do not depend on who is asking"""
+
+    def __init__(self, env: Environment):
+        self.env = env
+        self.pages: Dict[str, tuple] = {}  # name -> (template, body, etag)
+
+    def response(self, request: Request, name: str, **context) -> Response:
+        template = self.env.get_template(name)
+        cached = self.pages.get(name)
+        if cached is None or cached[0] is not template:
+            body = template.render(**context).encode("utf-8")
+            cached = self.pages[name] = (template, body, f'"{hashlib.sha1(body).hexdigest()[:16]}"')
+        _, body, etag = cached
+
+        # no-cache: browsers revalidate, so a visitor who logs in never sees the anonymous page
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(body, headers=headers)
+
+
+class Fragment:
+    __slots__ = ("version", "dependencies", "html")
+
+    def __init__(self, version: int, dependencies: tuple, html: Markup):
+        self.version = version
+        self.dependencies = dependencies  # ((user_id, profile version), ...) of the users shown
+        self.html = html
+
+
+class FragmentCache:
+    """Per-user sections of the home page"""
+
+    def __init__(self, env: Environment, versions: DataVersions):
+        self.env = env
+        self.versions = versions
+        self.fragments: "OrderedDict[tuple, Fragment]" = OrderedDict()
+
+    def _lookup(self, key: tuple, version: int) -> Optional[Markup]:
+        fragment = self.fragments.get(key)
+        if fragment is None or fragment.version != version:
+            return None
+        for user_id, profile_version in fragment.dependencies:
+            if self.versions.get('profile', user_id) != profile_version:
+                return None
+        self.fragments.move_to_end(key)
+        return fragment.html
+
+    def _store(self, key: tuple, version: int, dependencies: tuple, html: str) -> Markup:
+        self.fragments[key] = Fragment(version, dependencies, Markup(html))
+        self.fragments.move_to_end(key)
+        while len(self.fragments) > MAX_FRAGMENTS:
+            self.fragments.popitem(last=False)
+        return self.fragments[key].html
+
+    def friends_tab(self, user_id: int) -> Markup:
+        key = ('friends', user_id)
+        version = self.versions.get('friends', user_id)
+        html = self._lookup(key, version)
+        if html is not None:
+            return html
+
+        friends = get_friends_with_status(user_id)
+        dependencies = tuple((friend['id'], self.versions.get('profile', friend['id'])) for friend in friends)
+        html = self.env.get_template("partials/friends_tab.html").render(
+            friends=friends,
+            friend_requests=get_pending_friend_requests(user_id)
+        )
+        return self._store(key, version, dependencies, html)
+
+    def servers_tab(self, user_id: int) -> Markup:
+        key = ('servers', user_id)
+        version = self.versions.get('servers', user_id)
+        html = self._lookup(key, version)
+        if html is not None:
+            return html
+
+        html = self.env.get_template("partials/servers_tab.html").render(
+            servers=get_user_servers(user_id),
+            server_invites=get_pending_server_invites(user_id)
+        )
+        return self._store(key, version, (), html)
+
+
+data_versions = DataVersions()
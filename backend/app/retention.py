@@ -0,0 +1,194 @@
+"""Background retention job
+
+Every PURGE_INTERVAL the job applies the retention policies (see
+database/retention_operations.py): expired rows are deleted one small batch
+per write transaction, with a pause in between so chat writes never wait behind
+a long purge. Attachment files no message links to any more are deleted along
+with their rows. Then the freed pages are handed back to the filesystem a few
+at a time with incremental vacuum.
+
+Metrics (rows deleted per table, bytes reclaimed, how long each batch held the
+write lock) are served by /api/stats/retention.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+from .database import (
+    get_retention_policies, get_retention_channels, purge_expired_rows,
+    purge_orphan_attachments, get_attachment, reclaim_free_pages, get_storage_stats
+)
+from .attachments import attachment_store
+from .voice_state import voice_state
+
+# Seconds between retention passes
+PURGE_INTERVAL = 3600.0
+
+# Seconds after startup before the first pass
+FIRST_PASS_DELAY = 60.0
+
+# Rows deleted per write transaction
+PURGE_BATCH = 500
+
+# Free pages returned to the filesystem per write transaction
+VACUUM_PAGES = 256
+
+# Seconds to yield between batches
+BATCH_PAUSE = 0.05
+
+
+class RetentionJob:
+    def __init__(self, interval: float = PURGE_INTERVAL, batch_size: int = PURGE_BATCH,
+                 vacuum_pages: int = VACUUM_PAGES, pause: float = BATCH_PAUSE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.passes = 0
+        self.batches = 0
+        self.rows_deleted: Dict[str, int] = {}  # table -> rows deleted since startup
+        self.bytes_reclaimed = 0
+        self.hold_seconds_total = 0.0
+        self.hold_seconds_max = 0.0
+        self.last_pass: Optional[dict] = None
+
+    def _record_hold(self, result: dict):
+        hold = result.get('hold_seconds', 0.0)
+        self.batches += 1
+        self.hold_seconds_total += hold
+        self.hold_seconds_max = max(self.hold_seconds_max, hold)
+
+    async def _purge(self, table_name: str, max_age_days: int, channel_id: Optional[int] = None) -> int:
+        """Delete a table's (or one channel's) expired rows batch by batch"""
+        deleted = 0
+        after_id = 0
+        while True:
+            keep = voice_state.persisted_rows() if table_name == "channel_members" else frozenset()
+            result = await asyncio.to_thread(
+                purge_expired_rows, table_name, max_age_days, after_id, self.batch_size, channel_id, keep
+            )
+            if not result['success']:
+                print(f"Retention purge failed: {result['message']}")
+                break
+            self._record_hold(result)
+            deleted += result['deleted']
+            after_id = result['last_id']
+            if result['done']:
+                break
+            await asyncio.sleep(self.pause)
+        self.rows_deleted[table_name] = self.rows_deleted.get(table_name, 0) + deleted
+        return deleted
+
+    @staticmethod
+    def _remove_files(attachment_ids: list):
+        # A file uploaded again since its row was deleted has a new row - keep it
+        attachment_store.remove([
+            attachment_id for attachment_id in attachment_ids if get_attachment(attachment_id) is None
+        ])
+
+    async def _sweep_attachments(self) -> int:
+        """Delete unlinked attachment rows batch by batch, then their files"""
+        deleted = 0
+        while True:
+            result = await asyncio.to_thread(purge_orphan_attachments, self.batch_size)
+            if not result['success']:
+                print(f"Attachment sweep failed: {result['message']}")
+                break
+            self._record_hold(result)
+            deleted += len(result['ids'])
+            await asyncio.to_thread(self._remove_files, result['ids'])
+            if result['done']:
+                break
+            await asyncio.sleep(self.pause)
+        self.rows_deleted["attachments"] = self.rows_deleted.get("attachments", 0) + deleted
+        return deleted
+
+    async def _reclaim(self) -> int:
+        """Hand free pages back to the filesystem, a few per transaction"""
+        reclaimed = 0
+        while True:
+            result = await asyncio.to_thread(reclaim_free_pages, self.vacuum_pages)
+            if not result['success']:
+                print(f"Incremental vacuum failed: {result['message']}")
+                break
+            self._record_hold(result)
+            reclaimed += result['bytes']
+            if not result['pages'] or not result['free_pages']:
+                break
+            await asyncio.sleep(self.pause)
+        self.bytes_reclaimed += reclaimed
+        return reclaimed
+
+    async def run_once(self) -> dict:
+        """Apply every retention policy once and reclaim the freed space"""
+        started = time.monotonic()
+        policies = await asyncio.to_thread(get_retention_policies)
+        deleted = {}
+        for table_name, max_age_days in policies['tables'].items():
+            if table_name == "channel_messages":
+                continue
+            if max_age_days is not None:
+                deleted[table_name] = await self._purge(table_name, max_age_days)
+
+        # Channel history follows its server's policy, or the table default
+        server_days = policies['servers'].get("channel_messages", {})
+        default_days = policies['tables'].get("channel_messages")
+        channel_rows = 0
+        for channel_id, server_id in await asyncio.to_thread(get_retention_channels):
+            max_age_days = server_days.get(server_id, default_days)
+            if max_age_days is not None:
+                channel_rows += await self._purge("channel_messages", max_age_days, channel_id)
+        deleted["channel_messages"] = channel_rows
+        deleted["attachments"] = await self._sweep_attachments()
+
+        reclaimed = await self._reclaim()
+        self.passes += 1
+        self.last_pass = {
+            'at': time.time(),
+            'seconds': round(time.monotonic() - started, 3),
+            'rows_deleted': deleted,
+            'bytes_reclaimed': reclaimed
+        }
+        return self.last_pass
+
+    def metrics(self) -> dict:
+        return {
+            'interval': self.interval,
+            'batch_size': self.batch_size,
+            'passes': self.passes,
+            'batches': self.batches,
+            'rows_deleted': dict(self.rows_deleted),
+            'bytes_reclaimed': self.bytes_reclaimed,
+            'lock_hold_ms': {
+                'average': round(self.hold_seconds_total / self.batches * 1e3, 3) if self.batches else None,
+                'max': round(self.hold_seconds_max * 1e3, 3)
+            },
+            'last_pass': self.last_pass,
+            'policies': get_retention_policies(),
+            'storage': get_storage_stats()
+        }
+
+    async def _loop(self):
+        await asyncio.sleep(FIRST_PASS_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Retention pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start the background retention job"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+retention = RetentionJob()
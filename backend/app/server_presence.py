@@ -0,0 +1,52 @@
+"""Index of which server members are online
+
+Built from server_members and the connection registry: a user's servers are
+loaded once when their first session connects and dropped when their last
+session closes. Server-wide broadcasts only ever look at the online members
+of that server, never at the full member list in SQLite.
+"""
+from typing import Dict
+
+from .database import get_user_server_ids
+
+
+class ServerPresence:
+    def __init__(self):
+        self.online: Dict[int, set] = {}  # server_id -> online member user ids
+        self.user_servers: Dict[int, tuple] = {}  # user_id -> server ids (online users only)
+
+    def track(self, user_id: int):
+        """User came online - index them under each of their servers"""
+        if user_id in self.user_servers:
+            return
+        server_ids = tuple(get_user_server_ids(user_id))
+        self.user_servers[user_id] = server_ids
+        for server_id in server_ids:
+            self.online.setdefault(server_id, set()).add(user_id)
+
+    def untrack(self, user_id: int):
+        """User went offline - remove them from their servers"""
+        for server_id in self.user_servers.pop(user_id, ()):
+            members = self.online.get(server_id)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del self.online[server_id]
+
+    def add_member(self, server_id: int, user_id: int):
+        """User joined a server - index them now if they are online"""
+        servers = self.user_servers.get(user_id)
+        if servers is not None and server_id not in servers:
+            self.user_servers[user_id] = servers + (server_id,)
+            self.online.setdefault(server_id, set()).add(user_id)
+
+    def is_member(self, server_id: int, user_id: int) -> bool:
+        """Membership check for an online user (no query)"""
+        return server_id in self.user_servers.get(user_id, ())
+
+    def online_members(self, server_id: int) -> list:
+        """Online members of a server"""
+        return list(self.online.get(server_id, ()))
+
+
+server_presence = ServerPresence()
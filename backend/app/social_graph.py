@@ -0,0 +1,239 @@
+"""In-memory friendship / server membership graph for mutual friends and suggestions
+
+Mutual friend counts and friend suggestions would otherwise be self-joins over
+friendships and server_members on every profile view. Instead the whole graph is
+loaded once at startup (in chunks, on a worker thread) into compact adjacency
+lists: one sorted array('i') of ids per user and per server, about 4 bytes per
+id instead of a 28 byte int object in a set or list.
+
+    friends[user_id]       -> sorted friend ids
+    user_servers[user_id]  -> sorted server ids
+    server_members[server] -> sorted member ids
+
+Intersecting two sorted lists is a binary search of the shorter one in the
+longer one when their sizes differ a lot, otherwise a single C-level set
+intersection. Friendships and memberships are only ever added, so the graph is
+kept current by add_friendship() / add_server_member() from the accept and join
+routes; changes made while the load is still running are replayed after it.
+"""
+import asyncio
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from .database import iter_friendships, iter_server_memberships
+
+# Use binary search instead of a set intersection when one list is this many times longer
+GALLOP_RATIO = 16
+
+# Servers with more members than this do not suggest their members to each other
+SUGGESTION_SERVER_LIMIT = 1000
+
+# Most suggestions returned
+MAX_SUGGESTIONS = 50
+
+_EMPTY = array('i')
+
+
+def intersect_count(a: array, b: array) -> int:
+    """Number of ids in both sorted arrays"""
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return 0
+    if len(b) >= GALLOP_RATIO * len(a):
+        count = 0
+        lo = 0
+        size = len(b)
+        for value in a:
+            lo = bisect_left(b, value, lo)
+            if lo == size:
+                break
+            if b[lo] == value:
+                count += 1
+                lo += 1
+        return count
+    return len(set(a).intersection(b))
+
+
+def intersect(a: array, b: array) -> List[int]:
+    """Ids in both sorted arrays, in order"""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) >= GALLOP_RATIO * len(a):
+        found = []
+        lo = 0
+        size = len(b)
+        for value in a:
+            lo = bisect_left(b, value, lo)
+            if lo == size:
+                break
+            if b[lo] == value:
+                found.append(value)
+                lo += 1
+        return found
+    return sorted(set(a).intersection(b))
+
+
+def _insert(lists: Dict[int, array], key: int, value: int):
+    """Add value to the sorted array under key, if it is not there yet"""
+    ids = lists.get(key)
+    if ids is None:
+        lists[key] = array('i', (value,))
+        return
+    index = bisect_left(ids, value)
+    if index == len(ids) or ids[index] != value:
+        ids.insert(index, value)
+
+
+def _compact(lists: Dict[int, list]) -> Dict[int, array]:
+    return {key: array('i', sorted(ids)) for key, ids in lists.items()}
+
+
+class SocialGraph:
+    def __init__(self):
+        self.friends: Dict[int, array] = {}
+        self.user_servers: Dict[int, array] = {}
+        self.server_members: Dict[int, array] = {}
+        self.edges = 0
+        self.loaded = False
+        self._load_task: Optional[asyncio.Task] = None
+        self._pending: list = []  # changes made while loading: (method, args)
+
+    # ---------- Loading ----------
+
+    @staticmethod
+    def _read() -> tuple:
+        """Read the graph from SQLite (worker thread)"""
+        friends = defaultdict(list)
+        edges = 0
+        for chunk in iter_friendships():
+            for user1_id, user2_id in chunk:
+                friends[user1_id].append(user2_id)
+                friends[user2_id].append(user1_id)
+            edges += len(chunk)
+
+        user_servers = defaultdict(list)
+        server_members = defaultdict(list)
+        for chunk in iter_server_memberships():
+            for server_id, user_id in chunk:
+                user_servers[user_id].append(server_id)
+                server_members[server_id].append(user_id)
+
+        return _compact(friends), _compact(user_servers), _compact(server_members), edges
+
+    def load_now(self):
+        """Load the graph synchronously (benchmarks and scripts)"""
+        self.friends, self.user_servers, self.server_members, self.edges = self._read()
+        self.loaded = True
+
+    async def _load(self):
+        self.friends, self.user_servers, self.server_members, self.edges = await asyncio.to_thread(self._read)
+        self.loaded = True
+        # Replay changes the load may have missed; adding twice is a no-op
+        pending, self._pending = self._pending, []
+        for method, args in pending:
+            method(*args)
+
+    def start(self):
+        """Load the graph in the background"""
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self._load())
+
+    async def ready(self):
+        """Wait until the graph is loaded"""
+        if not self.loaded:
+            self.start()
+            await asyncio.shield(self._load_task)
+
+    # ---------- Incremental updates ----------
+
+    def add_friendship(self, user1_id: int, user2_id: int):
+        """Two users became friends"""
+        if not self.loaded:
+            self._pending.append((self.add_friendship, (user1_id, user2_id)))
+            return
+        friends = self.friends.get(user1_id, _EMPTY)
+        index = bisect_left(friends, user2_id)
+        if index < len(friends) and friends[index] == user2_id:
+            return
+        _insert(self.friends, user1_id, user2_id)
+        _insert(self.friends, user2_id, user1_id)
+        self.edges += 1
+
+    def add_server_member(self, server_id: int, user_id: int):
+        """User joined (or created) a server"""
+        if not self.loaded:
+            self._pending.append((self.add_server_member, (server_id, user_id)))
+            return
+        _insert(self.user_servers, user_id, server_id)
+        _insert(self.server_members, server_id, user_id)
+
+    # ---------- Queries ----------
+
+    def are_friends(self, user1_id: int, user2_id: int) -> bool:
+        friends = self.friends.get(user1_id, _EMPTY)
+        index = bisect_left(friends, user2_id)
+        return index < len(friends) and friends[index] == user2_id
+
+    def mutual_friends(self, user1_id: int, user2_id: int) -> List[int]:
+        """Ids of the users both are friends with"""
+        return intersect(self.friends.get(user1_id, _EMPTY), self.friends.get(user2_id, _EMPTY))
+
+    def mutual_friend_count(self, user1_id: int, user2_id: int) -> int:
+        return intersect_count(self.friends.get(user1_id, _EMPTY), self.friends.get(user2_id, _EMPTY))
+
+    def shared_server_count(self, user1_id: int, user2_id: int) -> int:
+        return intersect_count(self.user_servers.get(user1_id, _EMPTY), self.user_servers.get(user2_id, _EMPTY))
+
+    def suggestions(self, user_id: int, limit: int = 10) -> List[dict]:
+        """
+        Users who are not friends yet, ranked by mutual friends, then shared servers
+        Returns [{'user_id', 'mutual_friends', 'shared_servers'}]
+        """
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        friends = self.friends.get(user_id, _EMPTY)
+
+        # Friends of friends - each occurrence is one mutual friend
+        mutual = Counter()
+        for friend_id in friends:
+            mutual.update(self.friends.get(friend_id, _EMPTY))
+
+        # Members of the user's (not too large) servers - each occurrence is one shared server
+        shared = Counter()
+        for server_id in self.user_servers.get(user_id, _EMPTY):
+            members = self.server_members.get(server_id, _EMPTY)
+            if len(members) <= SUGGESTION_SERVER_LIMIT:
+                shared.update(members)
+
+        excluded = set(friends)
+        excluded.add(user_id)
+        candidates = (mutual.keys() | shared.keys()) - excluded
+        best = heapq.nlargest(
+            limit, candidates,
+            key=lambda candidate: (mutual.get(candidate, 0), shared.get(candidate, 0), -candidate)
+        )
+        return [
+            {
+                'user_id': candidate,
+                'mutual_friends': mutual.get(candidate, 0),
+                'shared_servers': shared.get(candidate, 0)
+            }
+            for candidate in best
+        ]
+
+    def stats(self) -> dict:
+        return {
+            'loaded': self.loaded,
+            'users': len(self.friends),
+            'friendships': self.edges,
+            'servers': len(self.server_members),
+            'adjacency_bytes': sum(ids.itemsize * len(ids) for lists in (
+                self.friends, self.user_servers, self.server_members
+            ) for ids in lists.values())
+        }
+
+
+social_graph = SocialGraph()
@@ -0,0 +1,234 @@
+"""Sampled span tracing to a local JSON-lines file
+
+A sampled HTTP request or WebSocket message starts a trace; everything it does
+underneath - auth, database reads and writes, each WebSocket send of a fan-out -
+records a span while it runs. The current span lives in a ContextVar, so spans
+nest across awaits and into asyncio.to_thread() workers without being passed
+around.
+
+Spans are written as Chrome trace events ("ph": "X" complete events, times in
+microseconds), one JSON object per line. Each trace gets its own tid, so a
+timeline viewer shows one row per request with its spans as a flame graph:
+
+    python -m app.tracing traces.jsonl > trace.json   # then open in ui.perfetto.dev or chrome://tracing
+
+Sampling is decided once per trace (TRACE_SAMPLE_RATE, 0 = off). When a
+request is not sampled, span() finds no current span in the ContextVar and
+returns a shared no-op object - that lookup is all tracing costs.
+
+    MINI_DISCORD_TRACE_SAMPLE_RATE=0.01 MINI_DISCORD_TRACE_FILE=/tmp/traces.jsonl uvicorn app.main:app
+"""
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from typing import List, Optional
+
+# Fraction of requests / WebSocket messages traced
+TRACE_SAMPLE_RATE = float(os.environ.get("MINI_DISCORD_TRACE_SAMPLE_RATE", "0"))
+
+# Where finished spans are appended
+TRACE_FILE = os.environ.get(
+    "MINI_DISCORD_TRACE_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "traces.jsonl")
+)
+
+# How often buffered spans are written to the file (seconds)
+FLUSH_INTERVAL = 1.0
+
+# Spans buffered at most between writes - more are dropped (and counted)
+MAX_BUFFERED = 100_000
+
+_current: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    __slots__ = ("tracer", "name", "cat", "args", "tid", "start", "token")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: dict, tid: int):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.tid = tid
+        self.start = time.perf_counter_ns()
+        self.token = _current.set(self)
+
+    def end(self):
+        if self.token is None:
+            return
+        _current.reset(self.token)
+        self.token = None
+        self.tracer._record(self, time.perf_counter_ns())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.end()
+
+
+class _NoSpan:
+    """Stands in for a span when the current request is not sampled"""
+    __slots__ = ()
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, path: str = TRACE_FILE):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.pid = os.getpid()
+        self._trace_ids = itertools.count(1)
+        self.buffer: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.traces = 0
+        self.spans = 0
+        self.dropped = 0
+
+    def sample(self) -> bool:
+        """Whether to trace a new request"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start_trace(self, name: str, cat: str = "request", **args):
+        """Start the root span of a trace if this request is sampled - call end() when done"""
+        if not self.sample():
+            return NO_SPAN
+        self.traces += 1
+        return Span(self, name, cat, args, next(self._trace_ids))
+
+    def span(self, name: str, cat: str = "", **args):
+        """Child span of the current one (a no-op outside a sampled trace)"""
+        parent = _current.get()
+        if parent is None:
+            return NO_SPAN
+        return Span(self, name, cat, args, parent.tid)
+
+    @staticmethod
+    def active() -> bool:
+        """Whether the current code runs inside a sampled trace"""
+        return _current.get() is not None
+
+    @staticmethod
+    def caller_name(depth: int = 2) -> str:
+        """Name of a calling function - for span names, only worth it inside a trace"""
+        return sys._getframe(depth).f_code.co_name
+
+    # ---------- Output ----------
+
+    def _record(self, span: Span, end_ns: int):
+        if len(self.buffer) >= MAX_BUFFERED:
+            self.dropped += 1
+            return
+        self.spans += 1
+        self.buffer.append(json.dumps({
+            "name": span.name,
+            "cat": span.cat,
+            "ph": "X",
+            "ts": span.start / 1000,
+            "dur": (end_ns - span.start) / 1000,
+            "pid": self.pid,
+            "tid": span.tid,
+            "args": span.args
+        }, default=str))
+
+    def _write(self, lines: List[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        """Append buffered spans to the trace file"""
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError as e:
+            print(f"Trace flush failed: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        """Start the background flush task"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the flush task and write whatever is still buffered"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "file": self.path,
+            "traces": self.traces,
+            "spans": self.spans,
+            "dropped": self.dropped
+        }
+
+
+class TracingMiddleware:
+    """ASGI middleware - one trace per sampled HTTP request, named after its route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.sample_rate:
+            return await self.app(scope, receive, send)
+
+        trace = tracer.start_trace(f"{scope['method']} {scope['path']}", "http")
+        if trace is NO_SPAN:
+            return await self.app(scope, receive, send)
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                trace.args["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                trace.args["path"] = scope["path"]
+                trace.name = f"{scope['method']} {route.path}"
+            trace.end()
+
+
+tracer = Tracer()
+
+
+def to_chrome_trace(path: str) -> dict:
+    """Read a JSON-lines trace file into Chrome's trace format"""
+    with open(path, encoding="utf-8") as f:
+        return {"traceEvents": [json.loads(line) for line in f if line.strip()], "displayTimeUnit": "ms"}
+
+
+if __name__ == "__main__":
+    json.dump(to_chrome_trace(sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE), sys.stdout)
@@ -0,0 +1,180 @@
+"""In-memory username index for search-as-you-type
+
+Adding a friend takes an exact username and inviting takes a user id, so the
+UI offers completions while the name is typed. Serving them with
+LIKE 'abc%' per keystroke would scan users (LIKE is case-insensitive, so it
+cannot use the username index) on every key press. Instead every username is
+kept here, casefolded, in one sorted list with the user ids in a parallel
+array('i'); the names starting with a prefix are a contiguous run found with
+one binary search.
+
+Completions are ranked: the searching user's friends first, then members of
+the servers they share, then everyone else alphabetically. The first two come
+from the social graph; the global run for a prefix is cached (LRU) since many
+users type the same few first letters. The client debounces keystrokes and
+caches results per prefix on its side too.
+
+Users are only ever added (usernames cannot change), so create_user() keeps
+the index current through add_user().
+"""
+import asyncio
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .database import iter_usernames
+from .social_graph import social_graph
+
+# Completions returned at most
+MAX_COMPLETIONS = 20
+
+# Prefixes whose global matches are cached
+PREFIX_CACHE_SIZE = 4096
+
+# Global matches kept per cached prefix (enough to fill a page after ranked users are taken out)
+PREFIX_MATCHES = 2 * MAX_COMPLETIONS
+
+# Servers with more members than this do not rank their members first
+RANKED_SERVER_LIMIT = 1000
+
+
+class UsernameIndex:
+    def __init__(self):
+        self.keys: List[str] = []  # casefolded usernames, sorted
+        self.ids = array('i')  # user id of each key
+        self.names: Dict[int, str] = {}  # user_id -> username
+        self.loaded = False
+        self._load_task: Optional[asyncio.Task] = None
+        self._pending: list = []  # users created while loading
+        self._cache: OrderedDict = OrderedDict()  # prefix -> ids of the first global matches
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # ---------- Loading ----------
+
+    @staticmethod
+    def _read() -> tuple:
+        """Read every username from SQLite and sort them (worker thread)"""
+        names = {}
+        for chunk in iter_usernames():
+            names.update(chunk)
+        entries = sorted((name.casefold(), user_id) for user_id, name in names.items())
+        return [key for key, _ in entries], array('i', (user_id for _, user_id in entries)), names
+
+    def load_now(self):
+        """Load the index synchronously (benchmarks and scripts)"""
+        self.keys, self.ids, self.names = self._read()
+        self.loaded = True
+
+    async def _load(self):
+        self.keys, self.ids, self.names = await asyncio.to_thread(self._read)
+        self.loaded = True
+        pending, self._pending = self._pending, []
+        for user_id, username in pending:
+            self.add_user(user_id, username)
+
+    def start(self):
+        """Load the index in the background"""
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self._load())
+
+    async def ready(self):
+        """Wait until the index is loaded"""
+        if not self.loaded:
+            self.start()
+            await asyncio.shield(self._load_task)
+
+    # ---------- Updates ----------
+
+    def add_user(self, user_id: int, username: str):
+        """A user registered"""
+        if not self.loaded:
+            self._pending.append((user_id, username))
+            return
+        if user_id in self.names:
+            return
+        key = username.casefold()
+        index = bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        self.ids.insert(index, user_id)
+        self.names[user_id] = username
+        # Drop cached prefixes the new name falls under
+        for prefix in [prefix for prefix in self._cache if key.startswith(prefix)]:
+            del self._cache[prefix]
+
+    # ---------- Queries ----------
+
+    def _global_matches(self, prefix: str) -> tuple:
+        """Ids of the first PREFIX_MATCHES usernames starting with prefix, alphabetically"""
+        cached = self._cache.get(prefix)
+        if cached is not None:
+            self._cache.move_to_end(prefix)
+            self.cache_hits += 1
+            return cached
+
+        self.cache_misses += 1
+        start = bisect_left(self.keys, prefix)
+        end = start
+        limit = min(len(self.keys), start + PREFIX_MATCHES)
+        while end < limit and self.keys[end].startswith(prefix):
+            end += 1
+        matches = tuple(self.ids[start:end])
+
+        self._cache[prefix] = matches
+        if len(self._cache) > PREFIX_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return matches
+
+    def _matching(self, user_ids, prefix: str) -> list:
+        names = self.names
+        return [user_id for user_id in user_ids if user_id in names and names[user_id].casefold().startswith(prefix)]
+
+    def complete(self, user_id: int, prefix: str, limit: int = 10) -> List[dict]:
+        """
+        Users whose name starts with prefix (case-insensitive), best first
+        Returns [{'user_id', 'username', 'relation'}] - relation is 'friend', 'server' or None
+        """
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_COMPLETIONS))
+
+        def by_name(candidate):
+            key = self.names[candidate].casefold()
+            return key != prefix, key  # exact match first
+
+        seen = {user_id}
+        results = []
+
+        def take(candidates, relation):
+            for candidate in candidates:
+                if len(results) == limit:
+                    return
+                if candidate not in seen:
+                    seen.add(candidate)
+                    results.append({'user_id': candidate, 'username': self.names[candidate], 'relation': relation})
+
+        if social_graph.loaded:
+            take(sorted(self._matching(social_graph.friends.get(user_id, ()), prefix), key=by_name), 'friend')
+            co_members = set()
+            for server_id in social_graph.user_servers.get(user_id, ()):
+                members = social_graph.server_members.get(server_id, ())
+                if len(members) <= RANKED_SERVER_LIMIT:
+                    co_members.update(members)
+            co_members.difference_update(seen)
+            take(sorted(self._matching(co_members, prefix), key=by_name), 'server')
+        take(self._global_matches(prefix), None)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            'loaded': self.loaded,
+            'users': len(self.keys),
+            'cached_prefixes': len(self._cache),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses
+        }
+
+
+username_index = UsernameIndex()
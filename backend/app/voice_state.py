@@ -0,0 +1,270 @@
+"""In-memory channel presence and voice state
+
+The registry is the source of truth for which channel each user is in (one
+channel per server, like join_channel() used to enforce) and who is connected
+to voice. Every lookup the WebSocket handlers need is a dict/set lookup.
+
+channel_members is only a write-behind copy: changes are coalesced and flushed
+in batches, so switching channels quickly costs one row delete + insert per
+flush instead of a DELETE-with-subquery and INSERT per click. On startup the
+copy is loaded back (crash recovery) and users get a grace period to reconnect
+before their stale presence is purged. The same grace period applies when a
+WebSocket disconnects, so page reloads and reconnects keep the user in place.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from .database import save_channel_presence, get_channel_presence
+
+# Seconds a disconnected user keeps their channel presence
+RECONNECT_GRACE_PERIOD = 60
+
+# How often changes are flushed to channel_members (seconds)
+FLUSH_INTERVAL = 1.0
+
+
+class VoiceState:
+    """Where one user is inside one server"""
+    __slots__ = ("user_id", "server_id", "channel_id", "in_voice")
+
+    def __init__(self, user_id: int, server_id: int, channel_id: int, in_voice: bool = False):
+        self.user_id = user_id
+        self.server_id = server_id
+        self.channel_id = channel_id
+        self.in_voice = in_voice
+
+
+class VoiceStateRegistry:
+    def __init__(self, grace_period: float = RECONNECT_GRACE_PERIOD):
+        self.grace_period = grace_period
+        self.states: Dict[int, Dict[int, VoiceState]] = {}  # user_id -> server_id -> state
+        self.channel_users: Dict[int, Dict[int, None]] = {}  # channel_id -> user ids present (join order)
+        self.voice_users: Dict[int, set] = {}  # channel_id -> user ids connected to voice
+        self.server_voice: Dict[int, Dict[int, int]] = {}  # server_id -> user_id -> voice channel_id
+        self.channel_servers: Dict[int, int] = {}  # channel_id -> server_id (channels never move)
+        self.detached: Dict[int, float] = {}  # user_id -> time their presence expires
+        self.persisted: Dict[tuple, int] = {}  # (user_id, server_id) -> channel_id in channel_members
+        self.dirty: set = set()  # (user_id, server_id) keys changed since the last flush
+        self.stale_rows: List[tuple] = []  # (user_id, channel_id) rows to delete on the next flush
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # ---------- Index maintenance ----------
+
+    def _remove(self, state: VoiceState):
+        """Drop a state from every index"""
+        users = self.channel_users.get(state.channel_id)
+        if users is not None:
+            users.pop(state.user_id, None)
+            if not users:
+                del self.channel_users[state.channel_id]
+        if state.in_voice:
+            self._set_voice(state, False)
+        user_states = self.states.get(state.user_id)
+        if user_states is not None:
+            user_states.pop(state.server_id, None)
+            if not user_states:
+                del self.states[state.user_id]
+        self.dirty.add((state.user_id, state.server_id))
+
+    def _set_voice(self, state: VoiceState, in_voice: bool):
+        state.in_voice = in_voice
+        if in_voice:
+            self.voice_users.setdefault(state.channel_id, set()).add(state.user_id)
+            self.server_voice.setdefault(state.server_id, {})[state.user_id] = state.channel_id
+            return
+        voice = self.voice_users.get(state.channel_id)
+        if voice is not None:
+            voice.discard(state.user_id)
+            if not voice:
+                del self.voice_users[state.channel_id]
+        server = self.server_voice.get(state.server_id)
+        if server is not None:
+            server.pop(state.user_id, None)
+            if not server:
+                del self.server_voice[state.server_id]
+
+    def _place(self, user_id: int, server_id: int, channel_id: int) -> Optional[int]:
+        """
+        Put a user in a channel, leaving their current channel in that server
+        Returns the voice channel they were disconnected from, if any
+        """
+        self.channel_servers[channel_id] = server_id
+        current = self.states.get(user_id, {}).get(server_id)
+        if current is not None and current.channel_id == channel_id:
+            return None
+
+        left_voice = None
+        if current is not None:
+            left_voice = current.channel_id if current.in_voice else None
+            self._remove(current)
+
+        state = VoiceState(user_id, server_id, channel_id)
+        self.states.setdefault(user_id, {})[server_id] = state
+        self.channel_users.setdefault(channel_id, {})[user_id] = None
+        self.dirty.add((user_id, server_id))
+        return left_voice
+
+    # ---------- Mutations ----------
+
+    def join(self, user_id: int, server_id: int, channel_id: int) -> Optional[int]:
+        """User opened a channel - returns the voice channel they left, if any"""
+        return self._place(user_id, server_id, channel_id)
+
+    def join_voice(self, user_id: int, server_id: int, channel_id: int) -> Optional[int]:
+        """User connected to voice in a channel - returns the voice channel they left, if any"""
+        left_voice = self._place(user_id, server_id, channel_id)
+        # Only one voice connection at a time, across all servers
+        for other in list(self.states.get(user_id, {}).values()):
+            if other.in_voice and other.channel_id != channel_id:
+                left_voice = other.channel_id
+                self._set_voice(other, False)
+        self._set_voice(self.states[user_id][server_id], True)
+        return left_voice
+
+    def leave_voice(self, user_id: int, channel_id: int) -> bool:
+        """User disconnected from voice but stays in the channel - returns True if they were in voice"""
+        state = self._find(user_id, channel_id)
+        if state is None or not state.in_voice:
+            return False
+        self._set_voice(state, False)
+        return True
+
+    def leave(self, user_id: int, channel_id: int) -> bool:
+        """User left a channel - returns True if they were in voice there"""
+        state = self._find(user_id, channel_id)
+        if state is None:
+            return False
+        was_in_voice = state.in_voice
+        self._remove(state)
+        return was_in_voice
+
+    def detach(self, user_id: int) -> List[int]:
+        """
+        User's WebSocket closed - voice ends now, channel presence is kept for the grace period
+        Returns the voice channels they were connected to
+        """
+        left_voice = []
+        for state in self.states.get(user_id, {}).values():
+            if state.in_voice:
+                left_voice.append(state.channel_id)
+                self._set_voice(state, False)
+        if user_id in self.states:
+            self.detached[user_id] = time.monotonic() + self.grace_period
+        return left_voice
+
+    def attach(self, user_id: int):
+        """User reconnected within the grace period - keep their presence"""
+        self.detached.pop(user_id, None)
+
+    def expire(self, now: Optional[float] = None):
+        """Purge presence of users who did not reconnect in time"""
+        now = time.monotonic() if now is None else now
+        for user_id, deadline in list(self.detached.items()):
+            if deadline <= now:
+                del self.detached[user_id]
+                for state in list(self.states.get(user_id, {}).values()):
+                    self._remove(state)
+
+    # ---------- Queries ----------
+
+    def _find(self, user_id: int, channel_id: int) -> Optional[VoiceState]:
+        server_id = self.channel_servers.get(channel_id)
+        state = self.states.get(user_id, {}).get(server_id)
+        return state if state is not None and state.channel_id == channel_id else None
+
+    def server_of(self, channel_id: int) -> Optional[int]:
+        """Server of a channel seen before (None when unknown)"""
+        return self.channel_servers.get(channel_id)
+
+    def is_present(self, user_id: int, channel_id: int) -> bool:
+        """Check if a user is currently in a channel"""
+        return user_id in self.channel_users.get(channel_id, {})
+
+    def get_channel_users(self, channel_id: int) -> list:
+        """Users in a channel, in join order"""
+        return list(self.channel_users.get(channel_id, {}))
+
+    def get_voice_users(self, channel_id: int) -> list:
+        """Users connected to voice in a channel"""
+        return list(self.voice_users.get(channel_id, set()))
+
+    def get_server_voice(self, server_id: int) -> Dict[int, int]:
+        """Users connected to voice anywhere in a server -> their channel"""
+        return dict(self.server_voice.get(server_id, {}))
+
+    # ---------- Persistence ----------
+
+    def recover(self):
+        """Load persisted presence after a restart - users must reconnect within the grace period"""
+        deadline = time.monotonic() + self.grace_period
+        for row in get_channel_presence():
+            user_id, server_id, channel_id = row['user_id'], row['server_id'], row['channel_id']
+            key = (user_id, server_id)
+            if key in self.persisted:
+                # Only one channel per server - delete any extra rows on the next flush
+                self.stale_rows.append((user_id, channel_id))
+                continue
+            self.persisted[key] = channel_id
+            self.channel_servers[channel_id] = server_id
+            self.states.setdefault(user_id, {})[server_id] = VoiceState(user_id, server_id, channel_id)
+            self.channel_users.setdefault(channel_id, {})[user_id] = None
+            self.detached[user_id] = deadline
+
+    def persisted_rows(self) -> frozenset:
+        """(user_id, channel_id) of the channel_members rows this registry owns"""
+        return frozenset((user_id, channel_id) for (user_id, _), channel_id in self.persisted.items())
+
+    def take_changes(self) -> list:
+        """Coalesce dirty keys into (user_id, old_channel_id, new_channel_id) rows"""
+        changes = []
+        for user_id, server_id in self.dirty:
+            state = self.states.get(user_id, {}).get(server_id)
+            new_channel = state.channel_id if state is not None else None
+            old_channel = self.persisted.get((user_id, server_id))
+            if old_channel != new_channel:
+                changes.append((user_id, server_id, old_channel, new_channel))
+        self.dirty.clear()
+        return changes
+
+    async def flush(self):
+        """Write coalesced presence changes to channel_members"""
+        self.expire()
+        changes = self.take_changes()
+        stale_rows, self.stale_rows = self.stale_rows, []
+        if not changes and not stale_rows:
+            return
+        rows = [(user_id, old, new) for user_id, _, old, new in changes]
+        rows.extend((user_id, channel_id, None) for user_id, channel_id in stale_rows)
+        result = await asyncio.to_thread(save_channel_presence, rows)
+        if not result['success']:
+            print(f"Voice state flush failed: {result['message']}")
+            self.dirty.update((user_id, server_id) for user_id, server_id, _, _ in changes)
+            self.stale_rows.extend(stale_rows)
+            return
+        for user_id, server_id, _, new_channel in changes:
+            if new_channel is None:
+                self.persisted.pop((user_id, server_id), None)
+            else:
+                self.persisted[(user_id, server_id)] = new_channel
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        """Recover persisted presence and start the write-behind task"""
+        if self._flush_task is None:
+            self.recover()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the write-behind task and flush what is left"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+
+voice_state = VoiceStateRegistry()
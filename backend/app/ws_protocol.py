@@ -0,0 +1,64 @@
+"""WebSocket wire protocols
+
+Clients speak JSON text frames by default. A client can instead request the
+binary MessagePack subprotocol when opening the socket:
+
+    new WebSocket(url, ['mini-discord.msgpack'])
+
+Both carry exactly the same event dicts; only the encoding differs.
+"""
+import json
+from typing import Optional, Union
+
+import msgpack
+from fastapi import WebSocket
+
+MSGPACK_SUBPROTOCOL = "mini-discord.msgpack"
+
+
+class JSONCodec:
+    name = "json"
+    subprotocol: Optional[str] = None
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        return json.loads(data)
+
+    async def send_frame(self, websocket: WebSocket, frame: str):
+        await websocket.send_text(frame)
+
+    async def receive_frame(self, websocket: WebSocket) -> str:
+        return await websocket.receive_text()
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    subprotocol: Optional[str] = MSGPACK_SUBPROTOCOL
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: bytes) -> dict:
+        return msgpack.unpackb(data, raw=False)
+
+    async def send_frame(self, websocket: WebSocket, frame: bytes):
+        await websocket.send_bytes(frame)
+
+    async def receive_frame(self, websocket: WebSocket) -> bytes:
+        return await websocket.receive_bytes()
+
+
+JSON_CODEC = JSONCodec()
+MSGPACK_CODEC = MsgpackCodec()
+
+
+def negotiate(websocket: WebSocket):
+    """Pick the codec for a connection from the subprotocols the client offered"""
+    offered = websocket.scope.get("subprotocols", [])
+    if MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK_CODEC
+    return JSON_CODEC
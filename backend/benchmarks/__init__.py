@@ -0,0 +1 @@
+"""Standalone performance benchmarks - run from the backend folder, e.g. `python -m benchmarks.bench_export`"""
@@ -0,0 +1,121 @@
+"""Benchmark concurrent attachment uploads on local disk
+
+Runs --uploads concurrent multipart uploads of --files files of --size MB each
+through the attachment store, fed in 64 KB network-sized chunks the way the
+ASGI server delivers them. Reports throughput and the peak Python memory
+(tracemalloc) while they run, next to the same uploads handled by buffering
+the whole body first. A second round re-uploads the same files to show that
+deduplicated content is not stored twice.
+
+    python -m benchmarks.bench_attachments --uploads 8 --files 4 --size 8
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from starlette.requests import Request
+
+from app.attachments import AttachmentStore
+from .common import temp_database
+
+BOUNDARY = "benchboundary"
+NETWORK_CHUNK = 64 * 1024
+
+
+def multipart_body(files: list) -> bytes:
+    parts = []
+    for index, data in enumerate(files):
+        parts.append(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="files"; filename="file{index}.bin"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b"\r\n"
+        )
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def upload_request(body: bytes) -> Request:
+    """A request whose body arrives in NETWORK_CHUNK pieces"""
+    offset = 0
+
+    async def receive():
+        nonlocal offset
+        chunk = body[offset:offset + NETWORK_CHUNK]
+        offset += NETWORK_CHUNK
+        return {"type": "http.request", "body": chunk, "more_body": offset < len(body)}
+
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/api/attachments",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    }, receive)
+
+
+async def buffered_upload(store: AttachmentStore, request: Request):
+    """Baseline: read the whole body, then hash and write each file"""
+    form = await request.form(max_part_size=1 << 30)
+    for _, upload in form.multi_items():
+        data = await upload.read()
+        attachment_id = hashlib.sha256(data).hexdigest()
+        path = os.path.join(store.root, "buffered", attachment_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    await form.close()
+
+
+async def run_round(upload, store: AttachmentStore, bodies: list) -> tuple:
+    """Upload every body concurrently - returns (seconds, peak traced bytes)"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(store, upload_request(body)) for body in bodies))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=8, help="Concurrent upload requests")
+    parser.add_argument("--files", type=int, default=4, help="Files per request")
+    parser.add_argument("--size", type=float, default=8, help="MB per file")
+    args = parser.parse_args()
+
+    size = int(args.size * 1024 * 1024)
+    bodies = [
+        multipart_body([os.urandom(size) for _ in range(args.files)])
+        for _ in range(args.uploads)
+    ]
+    total_mb = args.uploads * args.files * size / (1024 * 1024)
+    print(f"{args.uploads} concurrent uploads x {args.files} files x {args.size} MB = {total_mb:.0f} MB")
+
+    root = tempfile.mkdtemp(prefix="mini_discord_attachments_")
+    store = AttachmentStore(root, max_size=size)
+    try:
+        with temp_database():
+            rounds = [
+                ("buffered body", buffered_upload),
+                ("streamed", AttachmentStore.receive),
+                ("streamed, dedup", AttachmentStore.receive),
+            ]
+            for label, upload in rounds:
+                elapsed, peak = asyncio.run(run_round(upload, store, bodies))
+                print(f"{label:16} {total_mb / elapsed:8.0f} MB/s   peak memory {peak / (1024 * 1024):8.1f} MB")
+
+        stored = 0
+        for folder, subfolders, names in os.walk(root):
+            subfolders[:] = [name for name in subfolders if name not in ("buffered", "tmp")]
+            stored += sum(os.path.getsize(os.path.join(folder, name)) for name in names)
+        print(f"Stored {stored / (1024 * 1024):.0f} MB for {2 * total_mb:.0f} MB uploaded by the streamed rounds")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
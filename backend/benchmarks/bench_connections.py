@@ -0,0 +1,59 @@
+"""Benchmark WebSocket disconnect cost with many active channels
+
+Fills the connection registry with one voice session per channel, then
+disconnects sessions and reports the cost per disconnect. The old
+single-socket manager scanned every channel on disconnect; that scan is
+reproduced here for comparison.
+
+    python -m benchmarks.bench_connections --channels 100000
+"""
+import argparse
+import time
+
+from app.connection_manager import ConnectionManager, Session
+
+
+def legacy_disconnect(channel_connections: dict, user_id: int):
+    """What disconnect() did before sessions had reverse indexes"""
+    for channel_id in list(channel_connections.keys()):
+        if user_id in channel_connections[channel_id]:
+            channel_connections[channel_id].remove(user_id)
+            if not channel_connections[channel_id]:
+                del channel_connections[channel_id]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=100_000)
+    parser.add_argument("--disconnects", type=int, default=1000)
+    args = parser.parse_args()
+    disconnects = min(args.disconnects, args.channels)
+
+    # Old layout: channel_id -> user ids
+    channel_connections = {channel_id: {channel_id} for channel_id in range(args.channels)}
+    start = time.perf_counter()
+    for user_id in range(disconnects):
+        legacy_disconnect(channel_connections, user_id)
+    legacy = (time.perf_counter() - start) / disconnects
+
+    # New layout: one session per user, each in voice in its own channel
+    manager = ConnectionManager()
+    session_ids = []
+    for channel_id in range(args.channels):
+        session_id = f"s{channel_id}"
+        manager.sessions[session_id] = Session(session_id, channel_id, f"user{channel_id}", None, None)
+        manager.user_sessions[channel_id] = (session_id,)
+        manager.join_voice_channel(session_id, channel_id)
+        session_ids.append(session_id)
+    start = time.perf_counter()
+    for session_id in session_ids[:disconnects]:
+        manager.disconnect(session_id)
+    indexed = (time.perf_counter() - start) / disconnects
+
+    print(f"{args.channels:,} channels, {disconnects:,} disconnects")
+    print(f"Channel scan:    {legacy * 1e6:10.1f} us per disconnect")
+    print(f"Reverse indexes: {indexed * 1e6:10.1f} us per disconnect ({legacy / indexed:,.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
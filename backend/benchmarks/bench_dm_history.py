@@ -0,0 +1,120 @@
+"""Benchmark DM history queries before and after messages.conversation_key
+
+Loads --rows direct messages spread over --pairs user pairs into a temp
+database, then compares the old history query (two OR'ed sender/receiver
+conditions, ordered by created_at) with the conversation_key range scan that
+replaced it. The old query is also timed with a (sender_id, receiver_id, id)
+index, the best an OR of two pairs can get. Prints the query plans and the
+per-query time of each, plus how long the conversation_key backfill takes.
+
+    python -m benchmarks.bench_dm_history --rows 2000000 --pairs 20000
+"""
+import argparse
+import random
+import time
+
+from app.database.conversation_operations import dm_conversation_key
+from app.database.schemas import backfill_conversation_keys
+from .common import temp_database, raw_connection
+
+OLD_HISTORY = """
+    SELECT m.* FROM messages m
+    WHERE (m.sender_id = ? AND m.receiver_id = ?)
+       OR (m.sender_id = ? AND m.receiver_id = ?)
+    ORDER BY m.created_at DESC
+    LIMIT 50
+"""
+
+NEW_HISTORY = """
+    SELECT m.* FROM messages m
+    WHERE m.conversation_key = ?
+    ORDER BY m.created_at DESC, m.id DESC
+    LIMIT 50
+"""
+
+
+def load_rows(db_path: str, rows: int, pairs: list, seed: int):
+    rng = random.Random(seed)
+    conn = raw_connection(db_path)
+    users = max(max(pair) for pair in pairs)
+    conn.executemany(
+        "INSERT INTO users (email, username, password, avatar) VALUES (?, ?, 'x', 'avatar1')",
+        ((f"u{i}@x.com", f"user{i}") for i in range(users))
+    )
+    batch = 100_000
+    for start in range(0, rows, batch):
+        messages = []
+        for _ in range(min(batch, rows - start)):
+            sender_id, receiver_id = rng.choice(pairs)
+            if rng.random() < 0.5:
+                sender_id, receiver_id = receiver_id, sender_id
+            messages.append((sender_id, receiver_id, "benchmark message"))
+        # Written without conversation_key, like a database from before the migration
+        conn.executemany("INSERT INTO messages (sender_id, receiver_id, message) VALUES (?, ?, ?)", messages)
+        conn.commit()
+    conn.close()
+
+
+def query_plan(conn, sql: str, params: tuple) -> str:
+    return "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def per_query_ms(conn, sql: str, params_list: list) -> float:
+    start = time.perf_counter()
+    for params in params_list:
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) * 1000 / len(params_list)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--pairs", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    users = max(2, int((2 * args.pairs) ** 0.5) + 2)
+    pairs = set()
+    while len(pairs) < args.pairs:
+        a, b = rng.randrange(1, users + 1), rng.randrange(1, users + 1)
+        if a != b:
+            pairs.add((min(a, b), max(a, b)))
+    pairs = list(pairs)
+
+    with temp_database() as db_path:
+        load_rows(db_path, args.rows, pairs, args.seed)
+        print(f"Loaded {args.rows:,} messages over {len(pairs):,} conversations")
+
+        conn = raw_connection(db_path)
+        conn.execute("DROP INDEX idx_messages_conversation_time")
+        start = time.perf_counter()
+        backfill_conversation_keys(conn)
+        conn.execute("CREATE INDEX idx_messages_conversation_time ON messages(conversation_key, created_at, id)")
+        conn.commit()
+        print(f"Backfill + index: {time.perf_counter() - start:.1f}s")
+
+        sample = [rng.choice(pairs) for _ in range(args.queries)]
+        old_params = [(a, b, b, a) for a, b in sample]
+        new_params = [(dm_conversation_key(a, b),) for a, b in sample]
+
+        results = []
+        plan = query_plan(conn, OLD_HISTORY, old_params[0])
+        results.append(("OR, no index", plan, per_query_ms(conn, OLD_HISTORY, old_params[:max(1, args.queries // 20)])))
+
+        conn.execute("CREATE INDEX bench_messages_pair ON messages(sender_id, receiver_id, id)")
+        plan = query_plan(conn, OLD_HISTORY, old_params[0])
+        results.append(("OR, pair index", plan, per_query_ms(conn, OLD_HISTORY, old_params)))
+        conn.execute("DROP INDEX bench_messages_pair")
+
+        plan = query_plan(conn, NEW_HISTORY, new_params[0])
+        results.append(("conversation_key", plan, per_query_ms(conn, NEW_HISTORY, new_params)))
+        conn.close()
+
+        for label, plan, ms in results:
+            print(f"{label:18} {ms:9.3f} ms/query   plan: {plan}")
+
+
+if __name__ == "__main__":
+    main()
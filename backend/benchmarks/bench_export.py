@@ -0,0 +1,56 @@
+"""Benchmark streaming NDJSON export at large history sizes
+
+Loads N channel messages into a temp database, then streams the whole channel
+through the export path and reports throughput and peak memory. Memory should
+stay flat as --rows grows.
+
+    python -m benchmarks.bench_export --rows 10000000 [--gzip]
+"""
+import argparse
+import time
+
+from app.database import iter_channel_messages
+from app.main import ndjson_stream
+from .common import temp_database, raw_connection, max_rss_mb
+
+
+def load_rows(db_path: str, rows: int):
+    conn = raw_connection(db_path)
+    conn.execute("INSERT INTO users (email, username, password, avatar) VALUES ('b@x.com', 'bench', 'x', 'avatar1')")
+    conn.execute("INSERT INTO servers (name, owner_id) VALUES ('bench', 1)")
+    conn.execute("INSERT INTO channels (server_id, name, channel_type) VALUES (1, 'general', 'text')")
+    batch = 100_000
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO channel_messages (channel_id, sender_id, message) VALUES (1, 1, ?)",
+            ((f"benchmark message number {i}",) for i in range(start, min(start + batch, rows)))
+        )
+        conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    with temp_database() as db_path:
+        start = time.perf_counter()
+        load_rows(db_path, args.rows)
+        print(f"Loaded {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+        rss_before = max_rss_mb()
+
+        start = time.perf_counter()
+        total_bytes = 0
+        for data in ndjson_stream(iter_channel_messages(1), compress=args.gzip):
+            total_bytes += len(data)
+        elapsed = time.perf_counter() - start
+
+        print(f"Exported {args.rows:,} rows ({total_bytes / 1e6:.1f} MB) in {elapsed:.1f}s "
+              f"- {args.rows / elapsed:,.0f} rows/s")
+        print(f"Peak RSS: {rss_before:.1f} MB before export, {max_rss_mb():.1f} MB after")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark idle-connection reaping with many sockets
+
+Tracks --sessions sessions on a simulated clock. Live sessions ping every
+heartbeat interval (spread evenly), --dead percent of them go silent. Every
+simulated second the reaper ticks; the cost is compared with a scan over all
+sessions, which is what a reaper without the timer wheel would do.
+
+    python -m benchmarks.bench_heartbeat --sessions 100000 --dead 1
+"""
+import argparse
+import asyncio
+import time
+
+from app.connection_manager import Session
+from app.heartbeat import HeartbeatMonitor
+
+
+def scan(sessions: dict, now: float, timeout: float) -> list:
+    """Reaper without a timer wheel: look at every session every tick"""
+    return [
+        session for session in sessions.values()
+        if session.last_seen is not None and now - session.last_seen >= timeout
+    ]
+
+
+async def run(sessions: int, dead_percent: float, seconds: int):
+    registry = {f"s{i}": Session(f"s{i}", i, f"user{i}", None, None) for i in range(sessions)}
+    monitor = HeartbeatMonitor(registry)
+    interval = monitor.interval
+    dead_every = int(100 / dead_percent) if dead_percent else 0
+    session_list = list(registry.values())
+    # Connected over the last interval, each right after its latest ping
+    for index, session in enumerate(session_list):
+        monitor.track(session, now=float(index % int(interval) - int(interval)))
+
+    wheel_time = scan_time = 0.0
+    worst = 0.0
+    checks = 0
+    for second in range(seconds):
+        now = float(second)
+        # The sessions whose ping falls into this second
+        for index in range(second % int(interval), sessions, int(interval)):
+            if not (dead_every and index % dead_every == 0):
+                monitor.seen(session_list[index], now=now)
+
+        start = time.perf_counter()
+        scan(registry, now, monitor.timeout)
+        scan_time += time.perf_counter() - start
+
+        due = len(monitor.wheel.slots[(monitor.wheel.current + 1) % len(monitor.wheel.slots)])
+        start = time.perf_counter()
+        await monitor.tick(now=now)
+        elapsed = time.perf_counter() - start
+        wheel_time += elapsed
+        worst = max(worst, elapsed)
+        checks += due
+
+    return monitor, wheel_time / seconds, worst, scan_time / seconds, checks / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--dead", type=float, default=1.0, help="Percent of sessions that go silent")
+    parser.add_argument("--seconds", type=int, default=180, help="Simulated seconds")
+    args = parser.parse_args()
+
+    monitor, wheel, worst, full_scan, checks = asyncio.run(run(args.sessions, args.dead, args.seconds))
+    print(f"{args.sessions:,} sessions, {args.dead}% dead, {args.seconds} simulated seconds")
+    print(f"Full scan:   {full_scan * 1e3:8.2f} ms per tick ({args.sessions:,} sessions checked)")
+    print(f"Timer wheel: {wheel * 1e3:8.2f} ms per tick ({checks:,.0f} sessions checked on average), "
+          f"worst tick {worst * 1e3:.2f} ms")
+    print(f"Reaped {monitor.reaped_total:,}, probes sent {monitor.probes_sent:,}, "
+          f"still tracked {monitor.tracked:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark memory per idle WebSocket connection
+
+Registers N idle connections (one per user) the way /ws does - connection
+registry, server presence index and heartbeat - and reports the bytes they
+allocate per connection, measured with tracemalloc. The socket and ASGI
+objects themselves belong to the server and are not counted.
+
+The old layout (one dict per field keyed by session id, sets for one-element
+indexes, plus the full user row kept alive by the endpoint) is rebuilt for
+comparison. Exits non-zero when the new layout goes over --max-bytes, so it
+can guard against regressions.
+
+    python -m benchmarks.bench_session_memory --sizes 10000 100000 --max-bytes 600
+"""
+import argparse
+import asyncio
+import gc
+import tracemalloc
+
+from app.connection_manager import ConnectionManager
+from app.heartbeat import HeartbeatMonitor
+from app.server_presence import server_presence
+from .common import temp_database
+
+
+def legacy_layout(count: int) -> list:
+    """What each connection kept before Session records"""
+    sessions, session_users, codecs, user_sessions, user_servers, last_seen, users = {}, {}, {}, {}, {}, {}, []
+    for user_id in range(count):
+        session_id = f"{user_id:011d}"
+        sessions[session_id] = None
+        session_users[session_id] = user_id
+        codecs[session_id] = None
+        user_sessions[user_id] = {session_id}
+        user_servers[user_id] = set()
+        last_seen[session_id] = float(user_id)
+        # The endpoint held the whole row from get_user_by_id
+        users.append({
+            'id': user_id,
+            'email': f"user{user_id}@example.com",
+            'username': f"user{user_id}",
+            'avatar': "avatar" + str(user_id % 6 + 1),
+            'status': "on" + "line"
+        })
+    return [sessions, session_users, codecs, user_sessions, user_servers, last_seen, users]
+
+
+async def current_layout(count: int) -> list:
+    manager = ConnectionManager()
+    heartbeat = HeartbeatMonitor(manager.sessions)
+    for user_id in range(count):
+        session = await manager.connect(user_id, f"user{user_id}", None)
+        heartbeat.track(session, now=float(user_id))
+    return [manager, heartbeat]
+
+
+def measure(build) -> int:
+    """Bytes still allocated by what build() returns"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--max-bytes", type=int, default=600, help="Fail above this many bytes per connection")
+    args = parser.parse_args()
+
+    over_budget = False
+    with temp_database():
+        for count in args.sizes:
+            legacy = measure(lambda: legacy_layout(count)) / count
+            current = measure(lambda: asyncio.run(current_layout(count))) / count
+            server_presence.online.clear()
+            server_presence.user_servers.clear()
+            print(f"{count:>9,} idle connections: legacy {legacy:6.0f} B, sessions {current:6.0f} B per connection")
+            over_budget = over_budget or current > args.max_bytes
+
+    if over_budget:
+        raise SystemExit(f"Over budget: more than {args.max_bytes} bytes per connection")
+    print(f"Within budget ({args.max_bytes} bytes per connection)")
+
+
+if __name__ == "__main__":
+    main()
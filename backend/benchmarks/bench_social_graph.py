@@ -0,0 +1,133 @@
+"""Benchmark mutual friends and friend suggestions at 1M friendship edges
+
+Loads a random friendship graph (--users, --edges) and server memberships into a
+temp database, loads it into the in-memory social graph and reports load time
+and the memory its adjacency arrays take. Then times mutual friend counts and
+suggestions for random users against the same queries as SQL joins (with an
+index on friendships.user2_id added so the joins are not full scans).
+
+    python -m benchmarks.bench_social_graph --users 100000 --edges 1000000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.social_graph import SocialGraph
+from .common import temp_database, raw_connection
+
+SQL_FRIENDS = """
+    SELECT user2_id AS id FROM friendships WHERE user1_id = :user
+    UNION ALL
+    SELECT user1_id FROM friendships WHERE user2_id = :user
+"""
+
+SQL_MUTUAL_COUNT = f"""
+    SELECT COUNT(*) FROM (
+        SELECT id FROM ({SQL_FRIENDS.replace(':user', ':a')})
+        INTERSECT
+        SELECT id FROM ({SQL_FRIENDS.replace(':user', ':b')})
+    )
+"""
+
+SQL_SUGGESTIONS = f"""
+    WITH mine AS ({SQL_FRIENDS})
+    SELECT candidate, COUNT(*) AS mutual FROM (
+        SELECT f.user2_id AS candidate FROM friendships f JOIN mine ON f.user1_id = mine.id
+        UNION ALL
+        SELECT f.user1_id FROM friendships f JOIN mine ON f.user2_id = mine.id
+    )
+    WHERE candidate != :user AND candidate NOT IN (SELECT id FROM mine)
+    GROUP BY candidate
+    ORDER BY mutual DESC, candidate
+    LIMIT 10
+"""
+
+
+def load_graph(db_path: str, users: int, edges: int, servers: int, server_size: int, seed: int):
+    rng = random.Random(seed)
+    conn = raw_connection(db_path)
+    conn.executemany(
+        "INSERT INTO users (email, username, password, avatar) VALUES (?, ?, 'x', 'avatar1')",
+        ((f"u{i}@x.com", f"user{i}") for i in range(users))
+    )
+
+    pairs = set()
+    while len(pairs) < edges:
+        a, b = rng.randrange(1, users + 1), rng.randrange(1, users + 1)
+        if a != b:
+            pairs.add((min(a, b), max(a, b)))
+    conn.executemany("INSERT INTO friendships (user1_id, user2_id) VALUES (?, ?)", pairs)
+
+    conn.executemany("INSERT INTO servers (name, owner_id) VALUES (?, 1)", ((f"s{i}",) for i in range(servers)))
+    memberships = set()
+    for server_id in range(1, servers + 1):
+        for user_id in rng.sample(range(1, users + 1), server_size):
+            memberships.add((server_id, user_id))
+    conn.executemany("INSERT INTO server_members (server_id, user_id) VALUES (?, ?)", memberships)
+    conn.execute("CREATE INDEX bench_friendships_user2 ON friendships (user2_id)")
+    conn.commit()
+    conn.close()
+
+
+def per_call_ms(function, calls: list) -> float:
+    start = time.perf_counter()
+    for args in calls:
+        function(*args)
+    return (time.perf_counter() - start) * 1000 / len(calls)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--edges", type=int, default=1_000_000)
+    parser.add_argument("--servers", type=int, default=2_000)
+    parser.add_argument("--server-size", type=int, default=50, help="Members per server")
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with temp_database() as db_path:
+        start = time.perf_counter()
+        load_graph(db_path, args.users, args.edges, args.servers, args.server_size, args.seed)
+        print(f"Wrote {args.edges:,} friendships between {args.users:,} users "
+              f"and {args.servers * args.server_size:,} memberships in {time.perf_counter() - start:.1f}s")
+
+        graph = SocialGraph()
+        start = time.perf_counter()
+        graph.load_now()
+        elapsed = time.perf_counter() - start
+
+        # Load again with allocation tracing (which slows it down) for the memory numbers
+        graph = SocialGraph()
+        tracemalloc.start()
+        graph.load_now()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = graph.stats()
+        print(f"Graph load: {elapsed:.2f}s, {current / 2**20:.1f} MB resident "
+              f"({stats['adjacency_bytes'] / 2**20:.1f} MB of ids), {peak / 2**20:.1f} MB peak while loading")
+
+        rng = random.Random(args.seed + 1)
+        pairs = [(rng.randrange(1, args.users + 1), rng.randrange(1, args.users + 1)) for _ in range(args.queries)]
+        singles = [(user_id,) for user_id, _ in pairs[:max(1, args.queries // 10)]]
+
+        conn = raw_connection(db_path)
+        results = [
+            ("mutual count", per_call_ms(graph.mutual_friend_count, pairs),
+             per_call_ms(lambda a, b: conn.execute(SQL_MUTUAL_COUNT, {"a": a, "b": b}).fetchone(), pairs)),
+            ("suggestions", per_call_ms(graph.suggestions, singles),
+             per_call_ms(lambda user: conn.execute(SQL_SUGGESTIONS, {"user": user}).fetchall(), singles)),
+        ]
+        # Both sides agree
+        for a, b in pairs[:100]:
+            assert graph.mutual_friend_count(a, b) == conn.execute(SQL_MUTUAL_COUNT, {"a": a, "b": b}).fetchone()[0]
+        conn.close()
+
+        print(f"{'query':14} {'graph ms':>10} {'SQL ms':>10} {'speedup':>9}")
+        for label, graph_ms, sql_ms in results:
+            print(f"{label:14} {graph_ms:10.4f} {sql_ms:10.4f} {sql_ms / graph_ms:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark template rendering with and without the render caches
+
+Reports, per request:
+- first load of home.html in a fresh process: compiling the Jinja source vs
+  loading it from the bytecode cache
+- the anonymous login page: rendering it vs serving the cached body
+- the home page of a user with --friends friends and --servers servers:
+  querying and rendering every section vs reusing the cached fragments
+
+    python -m benchmarks.bench_templates --friends 500 --servers 100
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from starlette.requests import Request
+
+from app.database import (
+    get_friends_with_status, get_pending_friend_requests, get_user_servers, get_pending_server_invites
+)
+from app.main import templates, TEMPLATES_DIR
+from app.render_cache import PageCache, FragmentCache, DataVersions
+from .common import temp_database, raw_connection
+
+
+def load_rows(db_path: str, friends: int, servers: int):
+    conn = raw_connection(db_path)
+    conn.executemany(
+        "INSERT INTO users (email, username, password, avatar, status) VALUES (?, ?, 'x', 'avatar1', 'online')",
+        ((f"u{i}@x.com", f"user{i}") for i in range(friends + 1))
+    )
+    conn.executemany(
+        "INSERT INTO friendships (user1_id, user2_id) VALUES (1, ?)",
+        ((user_id,) for user_id in range(2, friends + 2))
+    )
+    conn.executemany("INSERT INTO servers (name, owner_id) VALUES (?, 1)", ((f"server{i}",) for i in range(servers)))
+    conn.execute("INSERT INTO server_members (server_id, user_id) SELECT id, 1 FROM servers")
+    conn.commit()
+    conn.close()
+
+
+def per_call(fn, iterations: int) -> float:
+    """Average seconds per call"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def first_load(bytecode_dir: str = None) -> float:
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        bytecode_cache=FileSystemBytecodeCache(bytecode_dir) if bytecode_dir else None
+    )
+    start = time.perf_counter()
+    env.get_template("home.html")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--friends", type=int, default=500)
+    parser.add_argument("--servers", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    env = templates.env
+    user = {"id": 1, "username": "user0", "avatar": "avatar1", "status": "online"}
+
+    # Compile vs bytecode cache
+    bytecode_dir = tempfile.mkdtemp(prefix="mini_discord_jinja_")
+    try:
+        compiled = min(first_load() for _ in range(20))
+        first_load(bytecode_dir)
+        cached = min(first_load(bytecode_dir) for _ in range(20))
+    finally:
+        shutil.rmtree(bytecode_dir, ignore_errors=True)
+    print(f"home.html first load: compile {compiled * 1e3:.2f} ms, bytecode cache {cached * 1e3:.2f} ms "
+          f"({compiled / cached:.1f}x faster)")
+
+    # Anonymous login page
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    login = env.get_template("login.html")
+    pages = PageCache(env)
+    rendered = per_call(lambda: login.render(already_logged_in=False, username=None), args.iterations)
+    served = per_call(lambda: pages.response(request, "login.html", already_logged_in=False, username=None),
+                      args.iterations)
+    print(f"login.html: render {rendered * 1e6:.0f} us, page cache {served * 1e6:.0f} us "
+          f"({rendered / served:.0f}x faster)")
+
+    # Home page
+    with temp_database() as db_path:
+        load_rows(db_path, args.friends, args.servers)
+        home = env.get_template("home.html")
+        friends_tab = env.get_template("partials/friends_tab.html")
+        servers_tab = env.get_template("partials/servers_tab.html")
+        fragments = FragmentCache(env, DataVersions())
+
+        def uncached():
+            home.render(
+                user=user, session_token="x",
+                friends_tab=friends_tab.render(
+                    friends=get_friends_with_status(1), friend_requests=get_pending_friend_requests(1)
+                ),
+                servers_tab=servers_tab.render(
+                    servers=get_user_servers(1), server_invites=get_pending_server_invites(1)
+                )
+            )
+
+        def cached():
+            home.render(
+                user=user, session_token="x",
+                friends_tab=fragments.friends_tab(1), servers_tab=fragments.servers_tab(1)
+            )
+
+        full = per_call(uncached, args.iterations)
+        hit = per_call(cached, args.iterations)
+        print(f"home.html ({args.friends:,} friends, {args.servers:,} servers): "
+              f"query + render {full * 1e3:.2f} ms, cached fragments {hit * 1e3:.2f} ms ({full / hit:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
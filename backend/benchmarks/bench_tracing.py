@@ -0,0 +1,63 @@
+"""Benchmark what span tracing costs with sampling off and on
+
+Times a small traced operation - a get_friends() read plus three span() calls,
+about what one channel message fan-out records - untraced, inside an unsampled
+trace (sample rate 0, the production default) and inside a sampled one. Spans
+of the sampled runs go to a temp file.
+
+    python -m benchmarks.bench_tracing --calls 20000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app.database import get_friends
+from app.tracing import Tracer
+from app import tracing
+from .common import temp_database
+
+
+def per_call_us(tracer: Tracer, calls: int, sample_rate: float) -> float:
+    tracer.sample_rate = sample_rate
+    start = time.perf_counter()
+    for _ in range(calls):
+        trace = tracer.start_trace("bench", "bench")
+        get_friends(1)
+        for user_id in range(3):
+            with tracer.span("ws.send", "ws", user_id=user_id):
+                pass
+        trace.end()
+    return (time.perf_counter() - start) * 1e6 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with temp_database() as db_path:
+        # Spans recorded by the database layer go to the module tracer - benchmark that one
+        tracer = tracing.tracer
+        tracer.path = os.path.join(os.path.dirname(db_path), "traces.jsonl")
+
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            get_friends(1)
+        baseline = (time.perf_counter() - start) * 1e6 / args.calls
+
+        off = per_call_us(tracer, args.calls, 0)
+        on = per_call_us(tracer, args.calls, 1.0)
+        spans = len(tracer.buffer)
+        asyncio.run(tracer.flush())
+        size = os.path.getsize(tracer.path)
+        tracer.sample_rate = 0
+
+        print(f"no tracing     {baseline:8.2f} us/call")
+        print(f"sampling off   {off:8.2f} us/call  (+{off - baseline:.2f})")
+        print(f"sampling on    {on:8.2f} us/call  (+{on - baseline:.2f}), "
+              f"{spans / args.calls:.0f} spans/call, {size / spans:.0f} bytes/span")
+
+
+if __name__ == "__main__":
+    main()
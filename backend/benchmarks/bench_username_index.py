@@ -0,0 +1,72 @@
+"""Benchmark username completions against LIKE 'prefix%' queries
+
+Loads --users random usernames into a temp database, loads the username index
+and times completions for prefixes of 1-4 characters, cold (cache cleared) and
+cached, next to the LIKE query the search box would otherwise run per keystroke.
+
+    python -m benchmarks.bench_username_index --users 1000000
+"""
+import argparse
+import random
+import string
+import time
+
+from app.username_index import UsernameIndex
+from .common import temp_database, raw_connection
+
+SQL_LIKE = "SELECT id, username FROM users WHERE username LIKE ? ORDER BY username LIMIT 10"
+
+
+def load_users(db_path: str, users: int, seed: int) -> list:
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < users:
+        names.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))))
+    names = list(names)
+    conn = raw_connection(db_path)
+    conn.executemany(
+        "INSERT INTO users (email, username, password, avatar) VALUES (?, ?, 'x', 'avatar1')",
+        ((f"{name}@x.com", name) for name in names)
+    )
+    conn.commit()
+    conn.close()
+    return names
+
+
+def per_call_us(function, calls: list) -> float:
+    start = time.perf_counter()
+    for call in calls:
+        function(call)
+    return (time.perf_counter() - start) * 1e6 / len(calls)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with temp_database() as db_path:
+        names = load_users(db_path, args.users, args.seed)
+        index = UsernameIndex()
+        start = time.perf_counter()
+        index.load_now()
+        print(f"Loaded {args.users:,} usernames into the index in {time.perf_counter() - start:.2f}s")
+
+        rng = random.Random(args.seed + 1)
+        conn = raw_connection(db_path)
+        print(f"{'prefix':8} {'cold us':>10} {'cached us':>10} {'LIKE us':>10}")
+        for length in (1, 2, 3, 4):
+            prefixes = [rng.choice(names)[:length] for _ in range(args.queries)]
+            index._cache.clear()
+            cold = per_call_us(lambda prefix: index.complete(0, prefix, 10), prefixes)
+            cached = per_call_us(lambda prefix: index.complete(0, prefix, 10), prefixes)
+            like = per_call_us(lambda prefix: conn.execute(SQL_LIKE, (prefix + "%",)).fetchall(),
+                               prefixes[:max(1, args.queries // 20)])
+            print(f"{length:<8} {cold:10.1f} {cached:10.1f} {like:10.1f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark JSON vs MessagePack WebSocket frames
+
+Encodes and decodes representative /ws events with both codecs and reports
+bytes on the wire and CPU time per frame.
+
+    python -m benchmarks.bench_ws_protocol [--frames 100000]
+"""
+import argparse
+import time
+
+from app.ws_protocol import JSON_CODEC, MSGPACK_CODEC
+
+# Roughly what a browser produces for a one-track audio call
+SDP = "\r\n".join(
+    ["v=0", "o=- 4611731400430051336 2 IN IP4 127.0.0.1", "s=-", "t=0 0",
+     "a=group:BUNDLE 0", "a=extmap-allow-mixed", "a=msid-semantic: WMS stream",
+     "m=audio 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126", "c=IN IP4 0.0.0.0",
+     "a=rtcp:9 IN IP4 0.0.0.0", "a=ice-ufrag:Vq3b", "a=ice-pwd:uZ1b6Cfa9mS3nPXK8rSBuq3j",
+     "a=ice-options:trickle", "a=fingerprint:sha-256 " + ":".join(["7B"] * 32),
+     "a=setup:actpass", "a=mid:0", "a=sendrecv", "a=rtcp-mux",
+     "a=rtpmap:111 opus/48000/2", "a=rtcp-fb:111 transport-cc", "a=fmtp:111 minptime=10;useinbandfec=1"]
+    + [f"a=extmap:{i} urn:ietf:params:rtp-hdrext:ext{i}" for i in range(1, 15)]
+    + [f"a=ssrc:1001 cname:stream{i}" for i in range(8)]
+) + "\r\n"
+
+EVENTS = {
+    "channel-voice-offer": {
+        "type": "channel-voice-offer", "from_user_id": 1042, "channel_id": 77,
+        "offer": {"type": "offer", "sdp": SDP},
+    },
+    "channel-ice-candidate": {
+        "type": "channel-ice-candidate", "from_user_id": 1042, "channel_id": 77,
+        "candidate": {
+            "candidate": "candidate:842163049 1 udp 1677729535 203.0.113.7 53811 typ srflx "
+                         "raddr 0.0.0.0 rport 0 generation 0 ufrag Vq3b network-cost 999",
+            "sdpMid": "0", "sdpMLineIndex": 0, "usernameFragment": "Vq3b",
+        },
+    },
+    "new-channel-message": {
+        "type": "new-channel-message", "channel_id": 77, "from_user_id": 1042,
+        "from_username": "someone", "message": "see you in voice in 5",
+        "timestamp": "2026-01-01 12:00:00", "seq": 123456,
+    },
+}
+
+
+def measure(codec, event: dict, frames: int):
+    start = time.perf_counter()
+    for _ in range(frames):
+        frame = codec.encode(event)
+    encode = (time.perf_counter() - start) / frames
+    start = time.perf_counter()
+    for _ in range(frames):
+        codec.decode(frame)
+    decode = (time.perf_counter() - start) / frames
+    return len(frame if isinstance(frame, bytes) else frame.encode("utf-8")), encode, decode
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'event':24} {'codec':8} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+    for name, event in EVENTS.items():
+        for codec in (JSON_CODEC, MSGPACK_CODEC):
+            size, encode, decode = measure(codec, event, args.frames)
+            print(f"{name:24} {codec.name:8} {size:7} {encode * 1e6:10.2f} {decode * 1e6:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
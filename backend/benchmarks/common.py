@@ -0,0 +1,54 @@
+"""Shared helpers for the benchmarks"""
+import contextlib
+import io
+import os
+import resource
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+from app.database import connection, schemas
+
+
+@contextmanager
+def temp_database():
+    """Point the app at a fresh, initialized database in a temp folder"""
+    folder = tempfile.mkdtemp(prefix="mini_discord_bench_")
+    original = connection.DB_PATH
+    connection.DB_PATH = schemas.DB_PATH = os.path.join(folder, "bench.db")
+    try:
+        init_quietly()
+        yield connection.DB_PATH
+    finally:
+        connection.writer.stop()
+        connection.DB_PATH = schemas.DB_PATH = original
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def init_quietly():
+    """Run init_database without its progress prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        schemas.init_database()
+
+
+def raw_connection(db_path: str) -> sqlite3.Connection:
+    """Connection for fast benchmark data loading (no durability)"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous = OFF")
+    return conn
+
+
+def max_rss_mb() -> float:
+    """Peak resident memory of this process in MB"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / 1024  # ru_maxrss is in KB on Linux
+
+
+@contextmanager
+def timed(label: str):
+    """Print how long the block took"""
+    start = time.perf_counter()
+    yield
+    print(f"{label}: {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,127 @@
+"""Build fingerprinted, precompressed frontend assets
+
+Usage:
+    python build_assets.py [--clean]
+
+Reads frontend/pages and writes frontend/dist (served under /assets):
+one minified CSS bundle per page, content-hashed JS files, .gz/.br variants
+and manifest.json. Restart the server after building; delete frontend/dist
+to go back to serving the source files.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from app.assets import PAGE_CSS, PAGES_DIR, DIST_DIR, MANIFEST_PATH
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 256
+
+
+def minify_css(text: str) -> str:
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text: str) -> str:
+    """Conservative: drop comment-only lines, indentation and blank lines"""
+    text = re.sub(r"^\s*/\*.*?\*/\s*$", "", text, flags=re.S | re.M)
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def write_asset(relative_path: str, data: bytes) -> str:
+    """Write a built file plus compressed variants - returns its /assets URL"""
+    stem, ext = os.path.splitext(relative_path)
+    hashed = f"{stem}.{content_hash(data)}{ext}"
+    target = os.path.join(DIST_DIR, hashed)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(data)
+
+    if len(data) >= MIN_COMPRESS_SIZE:
+        with open(target + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(target + ".br", "wb") as f:
+                f.write(brotli.compress(data, quality=11))
+    return "/assets/" + hashed.replace(os.sep, "/")
+
+
+def build_page(page: str, manifest: dict):
+    # One CSS bundle per page, in cascade order
+    css = "\n".join(
+        minify_css(open(os.path.join(PAGES_DIR, page, "css", name), encoding="utf-8").read())
+        for name in PAGE_CSS[page]
+    )
+    manifest["css"][page] = write_asset(os.path.join(page, f"{page}.css"), css.encode("utf-8"))
+
+    # JS files individually - ES modules import each other by relative path, which the
+    # import map redirects from the unhashed /assets URL to the hashed one
+    js_dir = os.path.join(PAGES_DIR, page, "js")
+    imports = {}
+    for name in sorted(os.listdir(js_dir)):
+        if not name.endswith(".js"):
+            continue
+        with open(os.path.join(js_dir, name), encoding="utf-8") as f:
+            data = minify_js(f.read()).encode("utf-8")
+        url = write_asset(os.path.join(page, "js", name), data)
+        manifest["files"][f"/pages/{page}/js/{name}"] = url
+        imports[f"/assets/{page}/js/{name}"] = url
+    manifest["importmaps"][page] = imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed frontend assets")
+    parser.add_argument("--clean", action="store_true", help="Remove previous builds first")
+    args = parser.parse_args()
+
+    if args.clean and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = {"css": {}, "files": {}, "importmaps": {}}
+    for page in PAGE_CSS:
+        build_page(page, manifest)
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    source = built = compressed = 0
+    for page in PAGE_CSS:
+        for folder in ("css", "js"):
+            for name in os.listdir(os.path.join(PAGES_DIR, page, folder)):
+                source += os.path.getsize(os.path.join(PAGES_DIR, page, folder, name))
+    for url in [*manifest["css"].values(), *manifest["files"].values()]:
+        path = os.path.join(DIST_DIR, url[len("/assets/"):])
+        built += os.path.getsize(path)
+        best = [path + suffix for suffix in (".br", ".gz") if os.path.exists(path + suffix)]
+        compressed += os.path.getsize(best[0]) if best else os.path.getsize(path)
+
+    print(f"Built {len(manifest['css'])} CSS bundles and {len(manifest['files'])} JS files into {DIST_DIR}")
+    print(f"Source {source:,} bytes -> minified {built:,} bytes -> compressed {compressed:,} bytes"
+          f"{'' if brotli else ' (gzip only - pip install brotli for .br)'}")
+
+
+if __name__ == "__main__":
+    main()
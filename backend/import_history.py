@@ -0,0 +1,43 @@
+"""Bulk import message history from another chat system
+
+Usage:
+    python import_history.py DUMP_FOLDER --source NAME [--batch-size 50000]
+
+DUMP_FOLDER holds one NDJSON or CSV file per entity (users, servers,
+server_members, channels, friendships, messages, channel_messages).
+See app/database/bulk_import.py for the expected fields.
+
+Re-running with the same --source resumes an interrupted import.
+Stop the server before importing.
+"""
+import argparse
+import time
+
+from app.database.bulk_import import BulkImporter, DEFAULT_BATCH_SIZE
+from app.database.schemas import init_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import chat history dumps")
+    parser.add_argument("folder", help="Folder containing the dump files")
+    parser.add_argument("--source", required=True, help="Name of the source system (used for id mapping and resume)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per transaction")
+    args = parser.parse_args()
+
+    init_database()
+    start = time.perf_counter()
+    stats = BulkImporter(args.source, args.batch_size).run(args.folder)
+    elapsed = time.perf_counter() - start
+
+    print("\nImport summary:")
+    total = 0
+    for entity, entity_stats in stats.items():
+        total += entity_stats["read"]
+        rate = entity_stats["read"] / entity_stats["seconds"] if entity_stats["seconds"] else 0
+        print(f"  {entity:<17} {entity_stats['inserted']:>12,} inserted "
+              f"{entity_stats['skipped']:>10,} skipped {rate:>12,.0f} rows/s")
+    print(f"  {'total':<17} {total:>12,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
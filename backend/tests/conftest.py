@@ -0,0 +1,30 @@
+"""Shared fixtures - every test that touches the database gets a fresh one"""
+import pytest
+
+from app.database import connection, schemas, create_user
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch, capsys):
+    """Point the app at a fresh, initialized database"""
+    path = str(tmp_path / "test.db")
+    monkeypatch.setattr(connection, "DB_PATH", path)
+    monkeypatch.setattr(schemas, "DB_PATH", path)
+    schemas.init_database()
+    capsys.readouterr()  # Drop the migration progress prints
+    yield path
+    connection.writer.stop()
+    reader = getattr(connection._readers, "conn", None)
+    if reader is not None:
+        reader.close()
+        connection._readers.conn = None
+
+
+@pytest.fixture
+def users(db):
+    """Users 1-4 (alice, bob, carol, dave)"""
+    names = ["alice", "bob", "carol", "dave"]
+    return [
+        create_user(f"{name}@example.com", name, "password", "avatar1")["user_id"]
+        for name in names
+    ]
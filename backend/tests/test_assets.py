@@ -0,0 +1,31 @@
+import gzip
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.assets import PrecompressedStaticFiles, IMMUTABLE_CACHE, REVALIDATE_CACHE
+
+
+def client(tmp_path) -> TestClient:
+    for name, data in (("app.0123456789ab.js", b"hashed();"), ("manifest.json", b"{}")):
+        (tmp_path / name).write_bytes(data)
+        (tmp_path / (name + ".gz")).write_bytes(gzip.compress(data))
+    app = Starlette(routes=[Mount("/assets", PrecompressedStaticFiles(directory=str(tmp_path)))])
+    return TestClient(app)
+
+
+def test_refused_encodings_are_not_served(tmp_path):
+    assets = client(tmp_path)
+    accepted = assets.get("/assets/app.0123456789ab.js", headers={"Accept-Encoding": "gzip"})
+    refused = assets.get("/assets/app.0123456789ab.js", headers={"Accept-Encoding": "gzip;q=0, identity"})
+
+    assert accepted.headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in refused.headers
+    assert refused.content == b"hashed();"
+
+
+def test_only_hashed_files_are_immutable(tmp_path):
+    assets = client(tmp_path)
+    assert assets.get("/assets/app.0123456789ab.js").headers["Cache-Control"] == IMMUTABLE_CACHE
+    assert assets.get("/assets/manifest.json").headers["Cache-Control"] == REVALIDATE_CACHE
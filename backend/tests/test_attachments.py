@@ -0,0 +1,53 @@
+import asyncio
+import sqlite3
+
+from app.attachments import attachment_store
+from app.retention import RetentionJob
+from app.database import (
+    register_attachments, get_attachment, can_access_attachment, save_message,
+    create_server, create_channel, save_channel_message
+)
+
+FILE_A = "a" * 64
+FILE_B = "b" * 64
+
+
+def test_only_readers_of_a_message_can_download_its_files(users):
+    alice, bob, carol, dave = users
+    register_attachments([(FILE_A, 3, "text/plain"), (FILE_B, 3, "text/plain")])
+    assert save_message(alice, bob, "", [{"id": FILE_A, "filename": "a.txt"}])["success"]
+    server_id = create_server("srv", carol)["server_id"]
+    channel_id = create_channel(server_id, "text", carol, "text")["channel_id"]
+    assert save_channel_message(channel_id, carol, "", [{"id": FILE_B, "filename": "b.txt"}])["success"]
+
+    assert can_access_attachment(FILE_A, alice)
+    assert can_access_attachment(FILE_A, bob)
+    assert not can_access_attachment(FILE_A, carol)
+    assert can_access_attachment(FILE_B, carol)
+    assert not can_access_attachment(FILE_B, alice)
+
+
+def test_sweep_deletes_unlinked_files_after_the_grace_period(db, users, tmp_path, monkeypatch):
+    alice, bob, carol, dave = users
+    monkeypatch.setattr(attachment_store, "root", str(tmp_path / "attachments"))
+    for attachment_id in (FILE_A, FILE_B):
+        path = attachment_store.path(attachment_id)
+        (tmp_path / "attachments" / attachment_id[:2] / attachment_id[2:4]).mkdir(parents=True)
+        with open(path, "w") as f:
+            f.write("abc")
+    register_attachments([(FILE_A, 3, "text/plain"), (FILE_B, 3, "text/plain")])
+    assert save_message(alice, bob, "", [{"id": FILE_A, "filename": "a.txt"}])["success"]
+
+    job = RetentionJob(pause=0)
+    assert asyncio.run(job._sweep_attachments()) == 0  # Both still young
+
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE attachments SET created_at = datetime('now', '-2 days')")
+    conn.commit()
+    conn.close()
+    assert asyncio.run(job._sweep_attachments()) == 1
+
+    assert get_attachment(FILE_A) is not None
+    assert get_attachment(FILE_B) is None
+    assert (tmp_path / "attachments" / "aa" / "aa" / FILE_A).exists()
+    assert not (tmp_path / "attachments" / "bb" / "bb" / FILE_B).exists()
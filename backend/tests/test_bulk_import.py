@@ -0,0 +1,73 @@
+import json
+
+from app.database import save_message, get_chat_history, get_conversations
+from app.database.bulk_import import BulkImporter
+from app.database.export_operations import iter_direct_messages
+
+
+def write_dump(folder, **entities):
+    for entity, records in entities.items():
+        with open(folder / f"{entity}.ndjson", "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+
+def conversations_by_peer(user_id: int) -> dict:
+    return {c["other_user_id"]: c for c in get_conversations(user_id) if c["conversation_type"] == "dm"}
+
+
+def test_import_keeps_existing_unread_counts(users, tmp_path):
+    alice, bob, carol, dave = users
+    save_message(alice, bob, "unread by bob")
+    save_message(carol, dave, "unread by dave")
+
+    dump = tmp_path / "dump"
+    dump.mkdir()
+    write_dump(
+        dump,
+        users=[
+            {"id": "u1", "email": "alice@example.com", "username": "alice"},
+            {"id": "u2", "email": "erin@example.com", "username": "erin"},
+        ],
+        messages=[
+            {"sender_id": "u2", "receiver_id": "u1", "message": "old hello", "created_at": "2020-01-01 10:00:00"},
+            {"sender_id": "u1", "receiver_id": "u2", "message": "old reply", "created_at": "2020-01-01 10:01:00"},
+        ],
+    )
+    BulkImporter("legacy", batch_size=1).run(str(dump))
+
+    assert conversations_by_peer(bob)[alice]["unread_count"] == 1
+    assert conversations_by_peer(dave)[carol]["unread_count"] == 1
+
+    # Alice was merged by email - the imported DM shows up next to her existing one, read
+    alice_dms = conversations_by_peer(alice)
+    assert alice_dms[bob]["last_message_preview"] == "unread by bob"
+    erin = next(peer for peer in alice_dms if peer not in users)
+    assert alice_dms[erin]["last_message_preview"] == "old reply"
+    assert alice_dms[erin]["unread_count"] == 0
+
+
+def test_imported_history_sorts_before_newer_local_messages(users, tmp_path):
+    alice, bob, carol, dave = users
+    save_message(alice, bob, "new local message")
+
+    dump = tmp_path / "dump"
+    dump.mkdir()
+    write_dump(
+        dump,
+        users=[
+            {"id": "u1", "email": "alice@example.com", "username": "alice"},
+            {"id": "u2", "email": "bob@example.com", "username": "bob"},
+        ],
+        messages=[
+            {"sender_id": "u1", "receiver_id": "u2", "message": "old first", "created_at": "2020-01-01T10:00:00"},
+            {"sender_id": "u2", "receiver_id": "u1", "message": "old second", "created_at": "2020-01-01T10:01:00"},
+        ],
+    )
+    BulkImporter("legacy").run(str(dump))
+
+    history = get_chat_history(alice, bob)
+    assert [m["message"] for m in history] == ["old first", "old second", "new local message"]
+    assert [m["message"] for chunk in iter_direct_messages(alice, bob, chunk_size=1) for m in chunk] == \
+        ["old first", "old second", "new local message"]
+    assert conversations_by_peer(alice)[bob]["last_message_preview"] == "new local message"
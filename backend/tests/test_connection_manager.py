@@ -0,0 +1,29 @@
+import asyncio
+
+from app.connection_manager import ConnectionManager, MAX_SESSIONS_PER_USER
+
+
+def test_reserved_slots_count_against_the_limit(db):
+    manager = ConnectionManager()
+    # Connections that passed the check but have not registered yet (accept, replay)
+    assert all(manager.reserve(1) for _ in range(MAX_SESSIONS_PER_USER))
+    assert not manager.reserve(1)
+    assert manager.reserve(2)
+
+    # Registering turns a reservation into a session - still full
+    session = asyncio.run(manager.connect(1, "alice", None))
+    manager.release(1)
+    assert not manager.reserve(1)
+
+    # A connection that fails before registering gives its slot back
+    manager.release(1)
+    assert manager.reserve(1)
+    assert manager.reserved[1] == MAX_SESSIONS_PER_USER - 1
+    manager.disconnect(session.session_id)
+
+
+def test_release_forgets_users_without_reservations(db):
+    manager = ConnectionManager()
+    manager.reserve(1)
+    manager.release(1)
+    assert manager.reserved == {}
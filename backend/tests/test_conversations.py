@@ -0,0 +1,68 @@
+import sqlite3
+
+from app.database import conversation_operations
+from app.database import (
+    create_server, create_channel, send_server_invite, accept_server_invite,
+    save_channel_message, get_conversations, mark_conversation_read
+)
+
+
+def join(server_id: int, owner_id: int, user_id: int):
+    invite_id = send_server_invite(server_id, owner_id, user_id)["invite_id"]
+    assert accept_server_invite(invite_id, user_id)["success"]
+
+
+def channel_unread(user_id: int, channel_id: int):
+    for conversation in get_conversations(user_id):
+        if conversation["channel_id"] == channel_id:
+            return conversation["unread_count"]
+    return None
+
+
+def test_silent_members_get_channel_unread(users):
+    alice, bob, carol, dave = users
+    server_id = create_server("srv", alice)["server_id"]
+    join(server_id, alice, bob)
+    channel_id = create_channel(server_id, "text", alice, "text")["channel_id"]
+
+    save_channel_message(channel_id, alice, "one")
+    save_channel_message(channel_id, alice, "two")
+
+    assert channel_unread(alice, channel_id) == 0
+    assert channel_unread(bob, channel_id) == 2
+    assert channel_unread(dave, channel_id) is None  # Not a member
+
+
+def test_new_member_joins_caught_up(users):
+    alice, bob, carol, dave = users
+    server_id = create_server("srv", alice)["server_id"]
+    channel_id = create_channel(server_id, "text", alice, "text")["channel_id"]
+    save_channel_message(channel_id, alice, "before carol")
+
+    join(server_id, alice, carol)
+    assert channel_unread(carol, channel_id) == 0
+
+    save_channel_message(channel_id, alice, "after carol")
+    assert channel_unread(carol, channel_id) == 1
+
+    conversation_id = next(c["id"] for c in get_conversations(carol) if c["channel_id"] == channel_id)
+    assert mark_conversation_read(conversation_id, carol)["success"]
+    assert channel_unread(carol, channel_id) == 0
+
+
+def test_channel_message_touches_only_the_sender_row(users, db, monkeypatch):
+    monkeypatch.setattr(conversation_operations, "UNREAD_COUNT_LIMIT", 5)
+    alice, bob, carol, dave = users
+    server_id = create_server("srv", alice)["server_id"]
+    join(server_id, alice, bob)
+    join(server_id, alice, carol)
+    channel_id = create_channel(server_id, "text", alice, "text")["channel_id"]
+
+    for index in range(8):
+        save_channel_message(channel_id, alice, f"message {index}")
+
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT user_id FROM conversation_members").fetchall()
+    conn.close()
+    assert rows == [(alice,)]
+    assert channel_unread(bob, channel_id) == 5  # Capped
@@ -0,0 +1,96 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app import event_log as event_log_module
+from app.event_log import EventLog
+
+
+def append(log: EventLog, user_id: int, count: int):
+    for _ in range(count):
+        log.append(user_id, {"type": "note"})
+
+
+def seqs(events) -> list:
+    return [event["seq"] for event in events]
+
+
+def test_replay_from_ring(users):
+    alice = users[0]
+    log = EventLog()
+    append(log, alice, 5)
+
+    assert seqs(log.events_after(alice, 2)) == [3, 4, 5]
+    assert log.events_after(alice, 5) == []
+    assert log.events_after(alice, 6) is None  # Client ahead of the server
+
+
+def test_replay_falls_back_to_database_and_pending(users):
+    alice = users[0]
+    log = EventLog(ring_size=2)
+    append(log, alice, 5)
+    assert asyncio.run(log.flush())
+    append(log, alice, 2)  # Still pending
+
+    assert seqs(log.events_after(alice, 1)) == [2, 3, 4, 5, 6, 7]
+
+
+def test_replay_with_gap_needs_resync(users, db):
+    alice = users[0]
+    log = EventLog(ring_size=2)
+    append(log, alice, 5)
+    asyncio.run(log.flush())
+    conn = sqlite3.connect(db)
+    conn.execute("DELETE FROM user_events WHERE user_id = ? AND seq = 3", (alice,))
+    conn.commit()
+    conn.close()
+
+    assert log.events_after(alice, 1) is None
+    assert seqs(log.events_after(alice, 3)) == [4, 5]
+
+
+def test_offline_user_evicted_after_flush(users):
+    alice, bob = users[:2]
+    log = EventLog()
+    log.connected(alice)
+    append(log, alice, 3)
+    append(log, bob, 3)  # Offline recipient
+
+    log.disconnected(alice)
+    assert alice in log.last_seq  # Events not stored yet
+    asyncio.run(log.flush())
+
+    assert log.rings == {} and log.last_seq == {}
+    assert log.current_seq(alice) == 3
+    assert log.append(bob, {"type": "note"})["seq"] == 4
+
+
+def test_online_user_kept_after_flush(users):
+    alice = users[0]
+    log = EventLog()
+    log.connected(alice)
+    append(log, alice, 3)
+    asyncio.run(log.flush())
+
+    assert seqs(log.events_after(alice, 0)) == [1, 2, 3]
+    assert log.last_seq == {alice: 3}
+
+
+def test_sequence_read_error_is_not_cached(users, monkeypatch):
+    alice = users[0]
+    log = EventLog()
+    append(log, alice, 3)
+    asyncio.run(log.flush())
+    log.last_seq.clear()
+
+    def broken(user_id):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(event_log_module, "get_last_event_seq", broken)
+    with pytest.raises(sqlite3.OperationalError):
+        log.append(alice, {"type": "note"})
+    assert alice not in log.last_seq
+
+    monkeypatch.undo()
+    assert log.append(alice, {"type": "note"})["seq"] == 4
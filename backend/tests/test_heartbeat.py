@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app import heartbeat as heartbeat_module
+from app.connection_manager import Session
+from app.heartbeat import HeartbeatMonitor, TimerWheel
+
+
+class RecordingManager:
+    """Stands in for the connection manager - records pings and closes"""
+
+    def __init__(self):
+        self.pings = []
+        self.closed = []
+
+    async def send_to_session(self, session_id, message, frames=None):
+        self.pings.append(session_id)
+
+    async def close_session(self, session_id, code, reason, timeout):
+        self.closed.append((session_id, code))
+
+
+@pytest.fixture
+def manager(monkeypatch, capsys):
+    recording = RecordingManager()
+    monkeypatch.setattr(heartbeat_module, "manager", recording)
+    return recording
+
+
+def test_wheel_fires_keys_at_their_slot():
+    wheel = TimerWheel(span=10, resolution=1)
+    wheel.schedule("a", 3.5, now=0)
+    wheel.schedule("b", 7, now=0)
+    wheel.schedule("far", 100, now=0)  # Beyond the span - fires early, the owner reschedules
+
+    fired = {second: wheel.advance(second) for second in range(1, 12)}
+
+    assert fired[4] == ["a"]
+    assert fired[7] == ["b"]
+    assert fired[10] == ["far"]
+    assert sum(len(keys) for keys in fired.values()) == 3
+
+
+def test_wheel_advance_after_long_stall_fires_everything_once():
+    wheel = TimerWheel(span=10, resolution=1)
+    for second in range(1, 10):
+        wheel.schedule(second, second, now=0)
+
+    assert sorted(wheel.advance(1000)) == list(range(1, 10))
+    assert wheel.advance(1001) == []
+
+
+def run_clock(monitor: HeartbeatMonitor, manager: RecordingManager, seconds: range, activity: dict, answering=()):
+    """
+    Tick at each of the seconds; activity maps a second to the sessions that send a frame then,
+    sessions in answering reply with pong one second after each server ping
+    """
+    async def run():
+        replies = {}
+        for second in seconds:
+            for session in activity.get(second, []) + replies.pop(second, []):
+                monitor.seen(session, now=second)
+            pings = len(manager.pings)
+            await monitor.tick(now=second)
+            for session in answering:
+                if session.session_id in manager.pings[pings:]:
+                    replies.setdefault(second + 1, []).append(session)
+    asyncio.run(run())
+
+
+def test_silent_session_is_probed_then_reaped(manager):
+    silent = Session("silent", 1, "alice", None, None)
+    monitor = HeartbeatMonitor({"silent": silent}, interval=25, timeout=60, resolution=1)
+    monitor.track(silent, now=0)
+
+    run_clock(monitor, manager, range(1, 60), {})
+    assert manager.pings == ["silent"]  # Once, at interval + grace
+    assert manager.closed == []
+
+    run_clock(monitor, manager, range(60, 62), {})
+    assert manager.closed == [("silent", heartbeat_module.REAPED_CLOSE_CODE)]
+    assert monitor.tracked == 0 and monitor.reaped_total == 1
+
+
+def test_active_session_is_never_reaped(manager):
+    chatty = Session("chatty", 1, "alice", None, None)
+    answers = Session("answers", 2, "bob", None, None)
+    monitor = HeartbeatMonitor({"chatty": chatty, "answers": answers}, interval=25, timeout=60, resolution=1)
+    monitor.track(chatty, now=0)
+    monitor.track(answers, now=0)
+
+    # chatty pings every 25s itself; answers only replies to the server's probes
+    activity = {second: [chatty] for second in range(25, 300, 25)}
+    run_clock(monitor, manager, range(1, 301), activity, answering=[answers])
+
+    assert manager.closed == []
+    assert "chatty" not in manager.pings
+    assert manager.pings.count("answers") >= 5
+    assert monitor.tracked == 2
@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from app import member_list as member_list_module
+from app.member_list import MemberListRegistry
+
+SERVER_ID = 1
+
+
+def member(user_id: int, status: str = "online") -> dict:
+    return {"id": user_id, "username": f"user{user_id:03d}", "avatar": "avatar1", "status": status}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A registry over server 1, whose members are loaded from a list instead of SQLite"""
+    members = [member(user_id, random.Random(user_id).choice(["online", "idle", "invisible"])) for user_id in range(1, 61)]
+    monkeypatch.setattr(member_list_module, "get_server_members", lambda server_id: members)
+    return MemberListRegistry()
+
+
+def apply_ops(window: list, start: int, ops: list) -> list:
+    """What the client does with a member-list-update (memberList.js)"""
+    window = list(window)
+    for op in ops:
+        index = op["index"] - start
+        if op["op"] == "DELETE":
+            del window[index]
+        elif op["op"] == "INSERT":
+            window.insert(index, op["member"])
+        else:
+            window[index] = op["member"]
+    return window
+
+
+def test_diffs_match_recomputed_windows(registry):
+    rng = random.Random(7)
+    ranges = {"s1": (0, 10), "s2": (5, 25), "s3": (20, 40), "s4": (50, 70), "s5": (55, 56)}
+    windows = {}
+    for session_id, (start, end) in ranges.items():
+        windows[session_id] = registry.subscribe(session_id, SERVER_ID, start, end)["members"]
+    next_user_id = 61
+
+    for _ in range(500):
+        action = rng.random()
+        if action < 0.4:
+            diffs = registry.set_status(rng.randrange(1, next_user_id), rng.choice(["online", "idle", "dnd", "invisible"]))
+        elif action < 0.9:
+            diffs = registry.set_connected(rng.randrange(1, next_user_id), rng.random() < 0.5)
+        else:
+            diffs = registry.add_member(SERVER_ID, member(next_user_id))
+            next_user_id += 1
+
+        for session_id, message in diffs:
+            windows[session_id] = apply_ops(windows[session_id], ranges[session_id][0], message["ops"])
+        member_list = registry.lists[SERVER_ID]
+        for session_id, (start, end) in ranges.items():
+            expected = [member_list.entries[user_id].to_dict() for user_id in member_list.window(start, end)]
+            assert windows[session_id] == expected
+
+
+def test_unaffected_ranges_get_no_diff(registry):
+    registry.subscribe("top", SERVER_ID, 0, 5)
+    registry.subscribe("middle", SERVER_ID, 28, 33)
+    registry.subscribe("bottom", SERVER_ID, 55, 60)
+    member_list = registry.lists[SERVER_ID]
+    # Nobody is connected, so a status change keeps a member's place
+    [user_id] = member_list.window(30, 31)
+
+    diffs = registry.set_status(user_id, "dnd")
+
+    assert member_list.window(30, 31) == [user_id]
+    assert [session_id for session_id, _ in diffs] == ["middle"]
+    assert diffs[0][1]["ops"] == [{"op": "UPDATE", "index": 30, "member": member_list.entries[user_id].to_dict()}]
+
+
+def test_large_lists_stay_loaded_for_a_grace_period(registry, monkeypatch):
+    monkeypatch.setattr(member_list_module, "KEEP_LOADED_MEMBERS", 50)
+    registry.subscribe("s1", SERVER_ID, 0, 10)
+    registry.unsubscribe("s1")
+    assert SERVER_ID in registry.lists  # 60 members - kept
+
+    # Still kept up to date while idle, and reused by the next subscriber
+    registry.add_member(SERVER_ID, member(61))
+    assert registry.subscribe("s2", SERVER_ID, 0, 10)["total"] == 61
+    registry.unsubscribe("s2")
+
+    monkeypatch.setattr(member_list_module, "UNLOAD_GRACE", 0)
+    registry.unsubscribe("other")
+    assert registry.lists == {} and registry.user_lists == {}
+
+
+def test_small_lists_unload_with_their_last_subscriber(registry):
+    registry.subscribe("s1", SERVER_ID, 0, 10)
+    registry.unsubscribe("s1")
+    assert registry.lists == {} and registry.user_lists == {}
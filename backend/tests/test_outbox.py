@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from app import connection_manager, event_log as event_log_module, outbox as outbox_module
+from app.database import send_friend_request, get_outbox_backlog, get_user_events_after
+from app.event_log import EventLog
+from app.outbox import OutboxDispatcher
+
+
+@pytest.fixture
+def event_log(db, monkeypatch):
+    """A fresh event log behind the connection manager and the dispatcher"""
+    log = EventLog()
+    monkeypatch.setattr(connection_manager, "event_log", log)
+    monkeypatch.setattr(outbox_module, "event_log", log)
+    return log
+
+
+@pytest.fixture
+def failing_saves(monkeypatch):
+    """Make the next N event log writes fail"""
+    real_save = event_log_module.save_user_events
+    remaining = [0]
+
+    def save_user_events(events):
+        if remaining[0]:
+            remaining[0] -= 1
+            return {"success": False, "message": "disk I/O error"}
+        return real_save(events)
+
+    monkeypatch.setattr(event_log_module, "save_user_events", save_user_events)
+
+    def fail(times: int):
+        remaining[0] = times
+    return fail
+
+
+def test_notification_delivered_and_deleted(users, event_log):
+    alice, bob = users[:2]
+    request_id = send_friend_request(alice, "bob")["request_id"]
+
+    assert asyncio.run(OutboxDispatcher().dispatch_once()) == 1
+
+    assert get_outbox_backlog()["pending"] == 0
+    [stored] = get_user_events_after(bob, 0)
+    assert stored["type"] == "new-friend-request" and stored["request_id"] == request_id
+
+
+def test_failed_flush_keeps_rows_until_retry(users, event_log, failing_saves, capsys):
+    alice, bob = users[:2]
+    send_friend_request(alice, "bob")
+    dispatcher = OutboxDispatcher()
+    failing_saves(1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(dispatcher.dispatch_once())
+    assert get_outbox_backlog()["pending"] == 1
+    assert get_user_events_after(bob, 0) == []
+    assert [seq for _, seq, _ in event_log.pending] == [1]
+
+    # The next pass stores the events it already sent, then deletes the rows - no second send
+    assert asyncio.run(dispatcher.dispatch_once()) == 0
+    assert get_outbox_backlog()["pending"] == 0
+    assert [event["seq"] for event in get_user_events_after(bob, 0)] == [1]
+    assert "Event log flush failed" in capsys.readouterr().out
+
+
+def test_rows_redelivered_after_restart(users, event_log, failing_saves, monkeypatch, capsys):
+    alice, bob = users[:2]
+    send_friend_request(alice, "bob")
+    failing_saves(1)
+    with pytest.raises(RuntimeError):
+        asyncio.run(OutboxDispatcher().dispatch_once())
+
+    # Restart: the unflushed events are gone with the process, the outbox rows are not
+    restarted_log = EventLog()
+    monkeypatch.setattr(connection_manager, "event_log", restarted_log)
+    monkeypatch.setattr(outbox_module, "event_log", restarted_log)
+    assert asyncio.run(OutboxDispatcher().dispatch_once()) == 1
+
+    assert get_outbox_backlog()["pending"] == 0
+    assert [event["type"] for event in get_user_events_after(bob, 0)] == ["new-friend-request"]
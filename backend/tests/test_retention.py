@@ -0,0 +1,65 @@
+import sqlite3
+
+from app.database import save_message, get_chat_history, get_conversations, purge_expired_rows
+
+
+def send(db: str, sender_id: int, receiver_id: int, count: int) -> list:
+    for n in range(count):
+        assert save_message(sender_id, receiver_id, f"m{n}")["success"]
+    conn = sqlite3.connect(db)
+    ids = [row[0] for row in conn.execute("SELECT id FROM messages ORDER BY id")]
+    conn.close()
+    return ids
+
+
+def age(db: str, days: int, *message_ids: int):
+    conn = sqlite3.connect(db)
+    conn.executemany(
+        "UPDATE messages SET created_at = datetime('now', ?) WHERE id = ?",
+        [(f"-{days} days", message_id) for message_id in message_ids]
+    )
+    conn.commit()
+    conn.close()
+
+
+def purge_all(table_name: str, max_age_days: int) -> int:
+    deleted, after_id = 0, 0
+    while True:
+        result = purge_expired_rows(table_name, max_age_days, after_id, batch_size=2)
+        assert result["success"]
+        deleted += result["deleted"]
+        after_id = result["last_id"]
+        if result["done"]:
+            return deleted
+
+
+def test_purge_filters_on_age_not_id_order(db, users):
+    alice, bob, carol, dave = users
+    ids = send(db, alice, bob, 5)
+    # A young message ahead of old ones in id order, as imports leave them
+    age(db, 60, ids[1], ids[2], ids[3])
+
+    assert purge_all("messages", 30) == 3
+    assert [m["message"] for m in get_chat_history(alice, bob)] == ["m0", "m4"]
+
+
+def test_purge_keeps_the_conversation_preview(db, users):
+    alice, bob, carol, dave = users
+    ids = send(db, alice, bob, 3)
+    age(db, 60, *ids)
+
+    assert purge_all("messages", 30) == 2
+    conversation = get_conversations(bob)[0]
+    assert conversation["last_message_preview"] == "m2"
+    assert [m["message"] for m in get_chat_history(alice, bob)] == ["m2"]
+
+
+def test_purge_takes_unread_messages_off_the_counter(db, users):
+    alice, bob, carol, dave = users
+    ids = send(db, alice, bob, 4)
+    age(db, 60, ids[0], ids[1])
+
+    assert get_conversations(bob)[0]["unread_count"] == 4
+    assert purge_all("messages", 30) == 2
+    assert get_conversations(bob)[0]["unread_count"] == 2
+    assert get_conversations(alice)[0]["unread_count"] == 0
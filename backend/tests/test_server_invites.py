@@ -0,0 +1,51 @@
+from app.database import (
+    create_server, send_server_invite, send_server_invites,
+    accept_server_invite, decline_server_invite, get_pending_server_invites
+)
+
+
+def make_server(owner_id: int) -> int:
+    return create_server("srv", owner_id)["server_id"]
+
+
+def test_bulk_invite_reopens_declined_invite(users):
+    alice, bob, carol, dave = users
+    server_id = make_server(alice)
+    invite_id = send_server_invite(server_id, alice, bob)["invite_id"]
+    assert decline_server_invite(invite_id, bob)["success"]
+
+    result = send_server_invites(server_id, alice, [bob, carol, dave])
+
+    assert result["success"], result["message"]
+    assert sorted(invite["user_id"] for invite in result["invited"]) == [bob, carol, dave]
+    assert result["skipped"] == []
+    assert [invite["id"] for invite in get_pending_server_invites(bob)] == [invite_id]
+
+
+def test_bulk_invite_skips_members_and_pending(users):
+    alice, bob, carol, dave = users
+    server_id = make_server(alice)
+    assert accept_server_invite(send_server_invite(server_id, alice, bob)["invite_id"], bob)["success"]
+    send_server_invite(server_id, alice, carol)
+
+    result = send_server_invites(server_id, alice, [bob, carol, dave, 999])
+
+    assert [invite["user_id"] for invite in result["invited"]] == [dave]
+    assert {row["user_id"]: row["reason"] for row in result["skipped"]} == {
+        bob: "Already a member",
+        carol: "Invite already sent",
+        999: "User not found"
+    }
+
+
+def test_single_invite_reopens_declined_invite(users):
+    alice, bob = users[:2]
+    server_id = make_server(alice)
+    invite_id = send_server_invite(server_id, alice, bob)["invite_id"]
+    decline_server_invite(invite_id, bob)
+
+    result = send_server_invite(server_id, alice, bob)
+
+    assert result["success"], result["message"]
+    assert result["invite_id"] == invite_id
+    assert accept_server_invite(invite_id, bob)["success"]
@@ -0,0 +1,23 @@
+from app.database import send_friend_request, get_pending_friend_requests, accept_friend_request
+from app.social_graph import SocialGraph
+
+
+def befriend(user_id: int, other_id: int, other_username: str):
+    assert send_friend_request(user_id, other_username)["success"]
+    request = get_pending_friend_requests(other_id)[0]
+    assert accept_friend_request(request["id"], other_id)["success"]
+
+
+def test_are_friends_after_load_and_after_accept(users):
+    alice, bob, carol, dave = users
+    befriend(alice, bob, "bob")
+    graph = SocialGraph()
+    graph.load_now()
+
+    assert graph.are_friends(alice, bob)
+    assert graph.are_friends(bob, alice)
+    assert not graph.are_friends(alice, carol)
+
+    graph.add_friendship(carol, alice)
+    assert graph.are_friends(alice, carol)
+    assert not graph.are_friends(dave, alice)
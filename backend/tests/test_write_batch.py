@@ -0,0 +1,50 @@
+import pytest
+
+from app.database import send_friend_request, accept_friend_request, get_friends, get_user_by_id
+from app.database.connection import run_write, run_write_batch
+
+
+def set_status(user_id: int, status: str):
+    run_write(lambda conn: conn.execute("UPDATE users SET status = ? WHERE id = ?", (status, user_id)))
+
+
+def test_failed_operations_are_rolled_back_alone(users):
+    alice, bob, carol = users[:3]
+    request_id = send_friend_request(alice, "bob")["request_id"]
+    carol_status = get_user_by_id(carol)["status"]
+
+    def wrote_then_failed():
+        set_status(carol, "dnd")
+        return {"success": False, "message": "Changed my mind"}
+
+    def wrote_then_raised():
+        set_status(carol, "idle")
+        raise ValueError("boom")
+
+    results = run_write_batch([
+        lambda: accept_friend_request(request_id, bob),
+        wrote_then_failed,
+        wrote_then_raised,
+        lambda: accept_friend_request(999, bob),
+        lambda: set_status(alice, "dnd") or {"success": True}
+    ])
+
+    assert [result["success"] for result in results] == [True, False, False, False, True]
+    assert results[2]["message"] == "boom"
+    assert [friend["id"] for friend in get_friends(bob)] == [alice]
+    assert get_user_by_id(carol)["status"] == carol_status
+    assert get_user_by_id(alice)["status"] == "dnd"
+
+
+def test_batch_is_one_transaction(users):
+    alice = users[0]
+    alice_status = get_user_by_id(alice)["status"]
+
+    def batch_then_crash(conn):
+        run_write_batch([lambda: set_status(alice, "dnd") or {"success": True}])
+        raise RuntimeError("writer failure")
+
+    # An exception outside the savepoints undoes the operations that succeeded too
+    with pytest.raises(RuntimeError):
+        run_write(batch_then_crash)
+    assert get_user_by_id(alice)["status"] == alice_status
@@ -18,7 +18,8 @@ import {
     switchTab, openCreateServerModal, closeCreateServerModal, handleCreateServer,
     openServer, closeServerView, joinChannel, sendChannelMessage,
     openCreateChannelModal, closeCreateChannelModal, handleCreateChannel,
-    initChannelListeners, handleNewChannelMessage
+    initChannelListeners, handleNewChannelMessage,
+    handleChannelCreated, handleVoiceStateChanged, handleServerMemberJoined
 } from './servers.js';
 import {
     openInviteToServerModal, closeInviteToServerModal, inviteToServer,
@@ -31,6 +32,8 @@ import {
     handleChannelUsers, handleUserJoinedVoice, handleUserLeftVoice,
     handleChannelVoiceOffer, handleChannelVoiceAnswer, handleChannelIceCandidate
 } from './channelVoice.js';
+import { handleTyping } from './typing.js';
+import { handleMemberListSync, handleMemberListUpdate, resubscribeMemberList } from './memberList.js';
 
 // Initialize the application
 export function initApp(userId) {
@@ -62,6 +65,47 @@ export function initApp(userId) {
     }
 }
 
+// Reliable event tracking - last event sequence number processed from the server.
+// Sent back as the resume token on reconnect so only missed events are replayed.
+let lastEventSeq = null;
+let ackTimer = null;
+
+// Acknowledge processed events (batched to at most one ack per second)
+function scheduleAck() {
+    if (ackTimer) return;
+    ackTimer = setTimeout(() => {
+        ackTimer = null;
+        if (window.ws && window.ws.readyState === WebSocket.OPEN && lastEventSeq !== null) {
+            window.ws.send(JSON.stringify({ type: 'ack', seq: lastEventSeq }));
+        }
+    }, 1000);
+}
+
+// Heartbeat - ping the server on the interval it asks for (session-sync) and
+// reconnect when nothing arrives for its idle timeout (e.g. after the laptop slept)
+let heartbeatTimer = null;
+let lastReceived = 0;
+
+function startHeartbeat(ws, config) {
+    stopHeartbeat();
+    heartbeatTimer = setInterval(() => {
+        if (ws.readyState !== WebSocket.OPEN) return;
+        if (Date.now() - lastReceived > config.timeout * 1000) {
+            console.warn('Server silent for too long - reconnecting');
+            ws.close();
+            return;
+        }
+        ws.send(JSON.stringify({ type: 'ping' }));
+    }, config.interval * 1000);
+}
+
+function stopHeartbeat() {
+    if (heartbeatTimer) {
+        clearInterval(heartbeatTimer);
+        heartbeatTimer = null;
+    }
+}
+
 // Initialize WebSocket connection
 function initWebSocket() {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
@@ -75,7 +119,10 @@ function initWebSocket() {
         return;
     }
     
-    const wsUrl = `${protocol}//${window.location.host}/ws?session=${sessionToken}`;
+    let wsUrl = `${protocol}//${window.location.host}/ws?session=${sessionToken}`;
+    if (lastEventSeq !== null) {
+        wsUrl += `&resume=${lastEventSeq}`;
+    }
     
     console.log('Connecting to WebSocket with authentication...');
     
@@ -86,8 +133,17 @@ function initWebSocket() {
     };
     
     ws.onmessage = (event) => {
+        lastReceived = Date.now();
         try {
             const message = JSON.parse(event.data);
+            
+            if (message.seq !== undefined && message.type !== 'session-sync') {
+                // Skip events we already processed (e.g. replayed twice)
+                if (lastEventSeq !== null && message.seq <= lastEventSeq) return;
+                lastEventSeq = message.seq;
+                scheduleAck();
+            }
+            
             handleWebSocketMessage(message);
         } catch (error) {
             console.error('Error parsing WebSocket message:', error);
@@ -96,6 +152,7 @@ function initWebSocket() {
     
     ws.onclose = () => {
         console.log('WebSocket disconnected');
+        stopHeartbeat();
         // Attempt to reconnect after 3 seconds
         setTimeout(initWebSocket, 3000);
     };
@@ -113,13 +170,34 @@ function handleWebSocketMessage(message) {
     const { type } = message;
     
     switch (type) {
+        // Session resume
+        case 'session-sync':
+            if (lastEventSeq !== null && !message.resumed) {
+                // Missed events could not be replayed - reload to get a fresh state
+                location.reload();
+                return;
+            }
+            console.log(`Session synced at seq ${message.seq} (${message.replayed} events replayed)`);
+            lastEventSeq = message.seq;
+            if (message.heartbeat) startHeartbeat(window.ws, message.heartbeat);
+            resubscribeMemberList();
+            break;
+        
+        // Heartbeat
+        case 'ping':
+            window.ws.send(JSON.stringify({ type: 'pong' }));
+            break;
+        
+        case 'pong':
+            break;
+        
         // Voice call messages
         case 'voice-call-offer':
-            if (handleCallOffer) handleCallOffer(message.from_user_id, message.from_username, message.offer);
+            if (handleCallOffer) handleCallOffer(message.from_user_id, message.from_username, message.offer, message.from_session_id);
             break;
         
         case 'voice-call-answer':
-            if (handleCallAnswer) handleCallAnswer(message.from_user_id, message.answer);
+            if (handleCallAnswer) handleCallAnswer(message.from_user_id, message.answer, message.from_session_id);
             break;
         
         case 'ice-candidate':
@@ -164,6 +242,32 @@ function handleWebSocketMessage(message) {
             if (handleNewChannelMessage) handleNewChannelMessage(message.channel_id, message.from_user_id, message.from_username, message.message, message.timestamp);
             break;
         
+        // Server-wide events
+        case 'channel-created':
+            handleChannelCreated(message.server_id, message.channel);
+            break;
+        
+        case 'voice-state-changed':
+            handleVoiceStateChanged(message.server_id, message.channel_id, message.user_id, message.in_voice);
+            break;
+        
+        case 'member-list-sync':
+            handleMemberListSync(message);
+            break;
+        
+        case 'member-list-update':
+            handleMemberListUpdate(message);
+            break;
+        
+        case 'server-member-joined':
+            handleServerMemberJoined(message.server_id, message.username);
+            break;
+        
+        // Ephemeral signals
+        case 'typing':
+            handleTyping(message);
+            break;
+        
         // Friend requests
         case 'new-friend-request':
             console.log('New friend request from', message.from_username);
@@ -0,0 +1,52 @@
+// File attachments - uploaded before the message is sent, rendered under the message text
+import { escapeHtml } from './state.js';
+
+// Shown as inline previews
+const IMAGE_TYPES = new Set(['image/png', 'image/jpeg', 'image/gif', 'image/webp']);
+
+// Whether files are picked in a file input
+export function hasSelectedFiles(inputId) {
+    const input = document.getElementById(inputId);
+    return Boolean(input && input.files.length);
+}
+
+// Upload the files picked in a file input - returns [{id, filename}] to send with the message
+export async function uploadSelectedFiles(inputId) {
+    const input = document.getElementById(inputId);
+    if (!input || !input.files.length) return [];
+
+    const form = new FormData();
+    for (const file of input.files) {
+        form.append('files', file);
+    }
+    const response = await fetch('/api/attachments', { method: 'POST', body: form });
+    const data = await response.json();
+    if (!data.success) {
+        throw new Error(data.message);
+    }
+
+    input.value = '';
+    return data.attachments.map(({ id, filename }) => ({ id, filename }));
+}
+
+function formatSize(bytes) {
+    if (bytes < 1024) return `${bytes} B`;
+    if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} KB`;
+    return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+}
+
+// HTML for a message's attachments
+export function renderAttachments(attachments) {
+    if (!attachments || attachments.length === 0) return '';
+
+    const items = attachments.map(attachment => {
+        const url = `/api/attachments/${attachment.id}?filename=${encodeURIComponent(attachment.filename)}`;
+        // Also used inside attributes
+        const name = escapeHtml(attachment.filename).replace(/"/g, '&quot;');
+        if (IMAGE_TYPES.has(attachment.content_type)) {
+            return `<a href="${url}" target="_blank"><img class="attachment-image" src="${url}" alt="${name}" loading="lazy"></a>`;
+        }
+        return `<a class="attachment-file" href="${url}" download="${name}">📎 ${name} <span class="attachment-size">${formatSize(attachment.size)}</span></a>`;
+    });
+    return `<div class="message-attachments">${items.join('')}</div>`;
+}
@@ -1,5 +1,7 @@
 // Chat functionality
 import { getCurrentChatFriendId, setCurrentChatFriendId, getAvatarEmoji, escapeHtml } from './state.js';
+import { notifyTyping, stopTyping, clearTyper, renderTyping } from './typing.js';
+import { hasSelectedFiles, uploadSelectedFiles, renderAttachments } from './attachments.js';
 
 let currentChatFriendName = '';
 
@@ -39,6 +41,8 @@ export async function openChat(friendId, friendName, friendAvatar, friendStatus)
         activeFriend.classList.add('active');
     }
     
+    renderTyping();
+    
     // Load chat history
     await loadChatHistory(friendId);
 }
@@ -101,6 +105,7 @@ function addMessageToChat(msg) {
                 <span class="message-time">${time}</span>
             </div>
             <div class="message-text">${escapeHtml(msg.message)}</div>
+            ${renderAttachments(msg.attachments)}
         </div>
     `;
     
@@ -115,15 +120,25 @@ export async function sendMessage() {
     const input = document.getElementById('message-input');
     const message = input.value.trim();
     
-    if (!message) return;
+    if (!message && !hasSelectedFiles('message-files')) return;
     
     // Send via WebSocket for real-time delivery
     if (window.ws && window.ws.readyState === WebSocket.OPEN) {
+        let attachments;
+        try {
+            attachments = await uploadSelectedFiles('message-files');
+        } catch (error) {
+            alert(`Upload failed: ${error.message}`);
+            return;
+        }
+        
         window.ws.send(JSON.stringify({
             type: 'private-message',
             receiver_id: friendId,
-            message: message
+            message: message,
+            attachments: attachments
         }));
+        stopTyping({ receiver_id: friendId });
         
         // Clear input immediately
         input.value = '';
@@ -139,6 +154,7 @@ export async function sendMessage() {
 // Handle incoming private message via WebSocket
 export function handleNewPrivateMessage(fromUserId, fromUsername, message, timestamp) {
     const currentFriendId = getCurrentChatFriendId();
+    clearTyper(`dm:${fromUserId}`, fromUserId);
     
     // If this is from the current chat friend, add to chat
     if (currentFriendId === fromUserId) {
@@ -160,5 +176,16 @@ export function initChatListeners() {
                 sendMessage();
             }
         });
+        
+        // Typing indicator
+        messageInput.addEventListener('input', () => {
+            const friendId = getCurrentChatFriendId();
+            if (!friendId) return;
+            if (messageInput.value.trim()) {
+                notifyTyping({ receiver_id: friendId });
+            } else {
+                stopTyping({ receiver_id: friendId });
+            }
+        });
     }
 }
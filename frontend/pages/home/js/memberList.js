@@ -0,0 +1,122 @@
+// Server member list - subscribes to the visible range only and applies server-pushed diffs
+import { getAvatarEmoji, escapeHtml } from './state.js';
+
+const ROW_HEIGHT = 46;      // Must match .member-item height + margin in servers.css
+const RANGE_SIZE = 150;     // Rows requested per subscription (server caps at 200)
+const RANGE_MARGIN = 25;    // Resubscribe when the viewport gets this close to the range edge
+
+let serverId = null;
+let start = 0;
+let end = 0;
+let members = [];           // Rows start..end-1
+let total = 0;
+let online = 0;
+let scrollScheduled = false;
+
+function send(message) {
+    if (window.ws && window.ws.readyState === WebSocket.OPEN) {
+        window.ws.send(JSON.stringify(message));
+    }
+}
+
+function subscribe(rangeStart) {
+    send({ type: 'member-list-subscribe', server_id: serverId, start: rangeStart, end: rangeStart + RANGE_SIZE });
+}
+
+// Start showing the member list of a server
+export function openMemberList(id) {
+    serverId = id;
+    members = [];
+    start = end = total = online = 0;
+
+    const list = document.getElementById('channel-members-list');
+    list.scrollTop = 0;
+    list.onscroll = onScroll;
+    render();
+    subscribe(0);
+}
+
+export function closeMemberList() {
+    if (serverId !== null) {
+        send({ type: 'member-list-unsubscribe', server_id: serverId });
+    }
+    serverId = null;
+}
+
+// After a reconnect the server has forgotten our subscription
+export function resubscribeMemberList() {
+    if (serverId !== null) subscribe(start);
+}
+
+function onScroll() {
+    if (scrollScheduled) return;
+    scrollScheduled = true;
+    requestAnimationFrame(() => {
+        scrollScheduled = false;
+        const list = document.getElementById('channel-members-list');
+        const first = Math.floor(list.scrollTop / ROW_HEIGHT);
+        const last = first + Math.ceil(list.clientHeight / ROW_HEIGHT);
+        const needMore = (first - RANGE_MARGIN < start && start > 0) || (last + RANGE_MARGIN > end && end < total);
+        if (needMore) {
+            subscribe(Math.max(0, first - Math.floor((RANGE_SIZE - (last - first)) / 2)));
+        }
+    });
+}
+
+export function handleMemberListSync(message) {
+    if (message.server_id !== serverId) return;
+    start = message.start;
+    end = message.end;
+    total = message.total;
+    online = message.online;
+    members = message.members;
+    render();
+}
+
+export function handleMemberListUpdate(message) {
+    if (message.server_id !== serverId) return;
+    total = message.total;
+    online = message.online;
+    message.ops.forEach(op => {
+        const index = op.index - start;
+        if (op.op === 'DELETE') {
+            members.splice(index, 1);
+        } else if (op.op === 'INSERT') {
+            members.splice(index, 0, op.member);
+        } else if (op.op === 'UPDATE') {
+            members[index] = op.member;
+        }
+    });
+    render();
+}
+
+function render() {
+    const header = document.querySelector('.members-header span');
+    if (header) {
+        header.textContent = serverId === null ? 'MEMBERS' : `MEMBERS — ${online} ONLINE / ${total}`;
+    }
+
+    const list = document.getElementById('channel-members-list');
+    if (!list) return;
+
+    // Full-height spacer keeps the scrollbar honest; only the subscribed rows are in the DOM
+    const spacer = document.createElement('div');
+    spacer.className = 'members-spacer';
+    spacer.style.height = `${total * ROW_HEIGHT}px`;
+
+    members.forEach((member, i) => {
+        const memberDiv = document.createElement('div');
+        memberDiv.className = 'member-item';
+        memberDiv.style.top = `${(start + i) * ROW_HEIGHT}px`;
+        memberDiv.innerHTML = `
+            <div class="member-avatar-container">
+                <div class="member-avatar">${getAvatarEmoji(member.avatar)}</div>
+                <div class="status-indicator status-${member.status}"></div>
+            </div>
+            <span class="member-name">${escapeHtml(member.username)}</span>
+        `;
+        spacer.appendChild(memberDiv);
+    });
+
+    list.replaceChildren(spacer);
+}
@@ -1,4 +1,6 @@
 // Friend modal management
+import { attachUsernameAutocomplete } from './usernameSearch.js';
+
 const modal = document.getElementById('addFriendModal');
 const addFriendForm = document.getElementById('add-friend-form');
 const errorDiv = document.getElementById('add-friend-error');
@@ -15,6 +17,8 @@ export function closeAddFriendModal() {
     modal.classList.remove('show');
 }
 
+attachUsernameAutocomplete('friend-username', 'friend-username-suggestions');
+
 // Close modal when clicking outside
 modal.addEventListener('click', (e) => {
     if (e.target === modal) {
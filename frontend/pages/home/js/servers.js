@@ -1,5 +1,8 @@
 // Server management module
 import { getState } from './state.js';
+import { notifyTyping, stopTyping, clearTyper, renderTyping } from './typing.js';
+import { openMemberList, closeMemberList } from './memberList.js';
+import { hasSelectedFiles, uploadSelectedFiles, renderAttachments } from './attachments.js';
 
 let currentServerId = null;
 let currentChannelId = null;
@@ -89,16 +92,65 @@ export async function openServer(serverId, serverName, isServerOwner) {
         createChannelBtn.style.display = 'none';
     }
     
+    // Member list is per server - stream the visible range only
+    openMemberList(serverId);
+    
     // Load channels
     await loadChannels(serverId);
 }
 
 export function closeServerView() {
     document.getElementById('serverViewModal').style.display = 'none';
+    closeMemberList();
     currentServerId = null;
     currentChannelId = null;
 }
 
+// Create the sidebar entry for a channel
+function renderChannelItem(channel) {
+    const channelDiv = document.createElement('div');
+    channelDiv.className = 'channel-item';
+    channelDiv.dataset.channelId = channel.id;
+    channelDiv.dataset.channelType = channel.channel_type || 'voice';
+    
+    // Different icon for voice vs text channels
+    const icon = (channel.channel_type === 'text') ? '#' : '🔊';
+    
+    channelDiv.innerHTML = `
+        <span class="channel-icon">${icon}</span>
+        <span class="channel-name">${channel.name}</span>
+        <span class="channel-voice-count"></span>
+    `;
+    channelDiv.onclick = () => joinChannel(channel.id, channel.name, channel.channel_type || 'voice');
+    return channelDiv;
+}
+
+// Users in voice per channel of the open server: channelId -> Set(userId)
+let voiceOccupancy = new Map();
+
+function renderVoiceCount(channelId) {
+    const countSpan = document.querySelector(`.channel-item[data-channel-id="${channelId}"] .channel-voice-count`);
+    if (!countSpan) return;
+    const count = voiceOccupancy.get(channelId)?.size || 0;
+    countSpan.textContent = count > 0 ? `👤 ${count}` : '';
+}
+
+// Load who is in voice in each channel of the server
+async function loadVoiceStates(serverId) {
+    try {
+        const response = await fetch(`/server/${serverId}/voice-states`);
+        const data = await response.json();
+        
+        voiceOccupancy = new Map();
+        (data.voice_states || []).forEach(state => {
+            voiceOccupancy.set(state.channel_id, new Set(state.user_ids));
+            renderVoiceCount(state.channel_id);
+        });
+    } catch (error) {
+        console.error('Error loading voice states:', error);
+    }
+}
+
 // Load channels for a server
 async function loadChannels(serverId) {
     try {
@@ -110,21 +162,9 @@ async function loadChannels(serverId) {
         
         if (data.channels && data.channels.length > 0) {
             data.channels.forEach(channel => {
-                const channelDiv = document.createElement('div');
-                channelDiv.className = 'channel-item';
-                channelDiv.dataset.channelId = channel.id;
-                channelDiv.dataset.channelType = channel.channel_type || 'voice';
-                
-                // Different icon for voice vs text channels
-                const icon = (channel.channel_type === 'text') ? '#' : '🔊';
-                
-                channelDiv.innerHTML = `
-                    <span class="channel-icon">${icon}</span>
-                    <span class="channel-name">${channel.name}</span>
-                `;
-                channelDiv.onclick = () => joinChannel(channel.id, channel.name, channel.channel_type || 'voice');
-                channelsList.appendChild(channelDiv);
+                channelsList.appendChild(renderChannelItem(channel));
             });
+            await loadVoiceStates(serverId);
             
             // Auto-join the first channel
             if (data.channels[0]) {
@@ -169,9 +209,6 @@ export async function joinChannel(channelId, channelName, channelType = 'voice')
             // For text channels, show chat UI
             handleTextChannelJoin(channelId, channelName);
         }
-        
-        // Load members
-        await loadChannelMembers(channelId);
     } catch (error) {
         console.error('Error joining channel:', error);
     }
@@ -220,6 +257,7 @@ async function handleTextChannelJoin(channelId, channelName) {
         messageInput.placeholder = `Message #${channelName}`;
     }
     if (sendBtn) sendBtn.style.display = 'block';
+    renderTyping();
     
     // Load messages
     await loadChannelMessages(channelId);
@@ -250,6 +288,7 @@ async function loadChannelMessages(channelId) {
                             <span class="message-timestamp">${timestamp}</span>
                         </div>
                         <div class="message-text">${msg.message}</div>
+                        ${renderAttachments(msg.attachments)}
                     </div>
                 `;
                 messagesDiv.appendChild(messageDiv);
@@ -262,52 +301,30 @@ async function loadChannelMessages(channelId) {
     }
 }
 
-// Load channel members
-async function loadChannelMembers(channelId) {
-    try {
-        const response = await fetch(`/channel/${channelId}/members`);
-        const data = await response.json();
-        
-        const membersList = document.getElementById('channel-members-list');
-        membersList.innerHTML = '';
-        
-        if (data.members && data.members.length > 0) {
-            data.members.forEach(member => {
-                const memberDiv = document.createElement('div');
-                memberDiv.className = 'member-item';
-                
-                const avatar = getAvatarEmoji(member.avatar);
-                const statusClass = `status-${member.status}`;
-                
-                memberDiv.innerHTML = `
-                    <div class="member-avatar-container">
-                        <div class="member-avatar">${avatar}</div>
-                        <div class="status-indicator ${statusClass}"></div>
-                    </div>
-                    <span class="member-name">${member.username}</span>
-                `;
-                membersList.appendChild(memberDiv);
-            });
-        }
-    } catch (error) {
-        console.error('Error loading members:', error);
-    }
-}
-
 // Send channel message
 export async function sendChannelMessage() {
     const input = document.getElementById('channel-message-input');
     const message = input.value.trim();
     
-    if (!message || !currentChannelId) return;
+    if ((!message && !hasSelectedFiles('channel-message-files')) || !currentChannelId) return;
     
     // Send via WebSocket for real-time delivery
     if (window.ws && window.ws.readyState === WebSocket.OPEN) {
+        let attachments;
+        try {
+            attachments = await uploadSelectedFiles('channel-message-files');
+        } catch (error) {
+            alert(`Upload failed: ${error.message}`);
+            return;
+        }
+        
         window.ws.send(JSON.stringify({
             type: 'channel-message',
             channel_id: currentChannelId,
-            message: message
+            message: message,
+            attachments: attachments
         }));
+        stopTyping({ channel_id: currentChannelId });
         
         // Clear input immediately
         input.value = '';
@@ -319,12 +336,42 @@ export async function sendChannelMessage() {
 
 // Handle incoming channel message via WebSocket
 export function handleNewChannelMessage(channelId, fromUserId, fromUsername, message, timestamp) {
+    clearTyper(`channel:${channelId}`, fromUserId);
+    
     // If this is for the current channel, reload messages
     if (currentChannelId === channelId) {
         loadChannelMessages(channelId);
     }
 }
 
+// Server-wide events pushed over the WebSocket
+export function handleChannelCreated(serverId, channel) {
+    if (currentServerId !== serverId) return;
+    const channelsList = document.getElementById('channels-list');
+    if (channelsList.querySelector(`[data-channel-id="${channel.id}"]`)) return;
+    channelsList.appendChild(renderChannelItem(channel));
+}
+
+export function handleVoiceStateChanged(serverId, channelId, userId, inVoice) {
+    if (currentServerId !== serverId) return;
+    if (inVoice) {
+        // A user is in voice in one channel at a time
+        voiceOccupancy.forEach((users, otherChannelId) => {
+            if (users.delete(userId)) renderVoiceCount(otherChannelId);
+        });
+        if (!voiceOccupancy.has(channelId)) voiceOccupancy.set(channelId, new Set());
+        voiceOccupancy.get(channelId).add(userId);
+    } else {
+        voiceOccupancy.get(channelId)?.delete(userId);
+    }
+    renderVoiceCount(channelId);
+}
+
+export function handleServerMemberJoined(serverId, username) {
+    if (currentServerId !== serverId) return;
+    console.log(`${username} joined the server`);
+}
+
 // Create Channel Modal
 export function openCreateChannelModal() {
     if (!isOwner) {
@@ -406,6 +453,16 @@ export function initChannelListeners() {
                 sendChannelMessage();
             }
         });
+        
+        // Typing indicator
+        input.addEventListener('input', () => {
+            if (!currentChannelId) return;
+            if (input.value.trim()) {
+                notifyTyping({ channel_id: currentChannelId });
+            } else {
+                stopTyping({ channel_id: currentChannelId });
+            }
+        });
     }
 }
 
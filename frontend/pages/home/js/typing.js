@@ -0,0 +1,90 @@
+// Typing indicators (ephemeral - the server throttles and never stores them)
+import { getCurrentChatFriendId } from './state.js';
+import { getCurrentChannelId } from './servers.js';
+
+// Re-announce typing at most this often while the user keeps typing
+const TYPING_RESEND_MS = 2000;
+
+let lastTypingSent = 0;
+let lastTypingKey = null;
+
+// Who is typing where: key ('dm:<userId>' or 'channel:<channelId>') -> Map(userId -> {username, timer})
+const typers = new Map();
+
+function send(target, typing) {
+    if (!window.ws || window.ws.readyState !== WebSocket.OPEN) return;
+    window.ws.send(JSON.stringify({ type: 'typing', typing, ...target }));
+}
+
+function targetKey(target) {
+    return target.channel_id ? `channel:${target.channel_id}` : `dm:${target.receiver_id}`;
+}
+
+// Called on every keystroke - only sends when the last announcement is getting old
+export function notifyTyping(target) {
+    const now = Date.now();
+    const key = targetKey(target);
+    if (key === lastTypingKey && now - lastTypingSent < TYPING_RESEND_MS) return;
+    lastTypingSent = now;
+    lastTypingKey = key;
+    send(target, true);
+}
+
+// Called when the message is sent (or the input is cleared)
+export function stopTyping(target) {
+    if (lastTypingKey !== targetKey(target)) return;
+    lastTypingKey = null;
+    lastTypingSent = 0;
+    send(target, false);
+}
+
+// Incoming typing event
+export function handleTyping(message) {
+    const key = message.channel_id ? `channel:${message.channel_id}` : `dm:${message.user_id}`;
+    if (!typers.has(key)) typers.set(key, new Map());
+    const users = typers.get(key);
+
+    const existing = users.get(message.user_id);
+    if (existing) clearTimeout(existing.timer);
+
+    if (message.typing) {
+        // The server sends the TTL; hide the indicator ourselves when it runs out
+        const timer = setTimeout(() => clearTyper(key, message.user_id), message.ttl * 1000);
+        users.set(message.user_id, { username: message.username, timer });
+    } else {
+        users.delete(message.user_id);
+    }
+    renderTyping();
+}
+
+// A message from a user ends their typing indicator
+export function clearTyper(key, userId) {
+    const users = typers.get(key);
+    if (!users || !users.has(userId)) return;
+    clearTimeout(users.get(userId).timer);
+    users.delete(userId);
+    renderTyping();
+}
+
+function describe(users) {
+    const names = users ? [...users.values()].map(u => u.username) : [];
+    if (names.length === 0) return '';
+    if (names.length === 1) return `${names[0]} is typing...`;
+    if (names.length <= 3) return `${names.join(', ')} are typing...`;
+    return 'Several people are typing...';
+}
+
+// Update both indicators for whatever chat / channel is open
+export function renderTyping() {
+    const dmIndicator = document.getElementById('typing-indicator');
+    if (dmIndicator) {
+        const friendId = getCurrentChatFriendId();
+        dmIndicator.textContent = friendId ? describe(typers.get(`dm:${friendId}`)) : '';
+    }
+
+    const channelIndicator = document.getElementById('channel-typing-indicator');
+    if (channelIndicator) {
+        const channelId = getCurrentChannelId();
+        channelIndicator.textContent = channelId ? describe(typers.get(`channel:${channelId}`)) : '';
+    }
+}
@@ -0,0 +1,50 @@
+// Username autocomplete - suggests users while a name is typed into an input with a <datalist>
+
+// Wait for a pause in typing before asking the server
+const DEBOUNCE_MS = 150;
+
+// Completions already fetched, per prefix (lowercased)
+const cache = new Map();
+
+async function fetchCompletions(prefix) {
+    if (!cache.has(prefix)) {
+        const response = await fetch(`/api/users/search?q=${encodeURIComponent(prefix)}&limit=8`);
+        const data = await response.json();
+        cache.set(prefix, data.success ? data.users : []);
+    }
+    return cache.get(prefix);
+}
+
+// Fill the input's datalist with completions as the user types
+export function attachUsernameAutocomplete(inputId, listId) {
+    const input = document.getElementById(inputId);
+    const list = document.getElementById(listId);
+    if (!input || !list) return;
+
+    let timer = null;
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const prefix = input.value.trim().toLowerCase();
+        if (!prefix) {
+            list.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(async () => {
+            try {
+                const users = await fetchCompletions(prefix);
+                // Ignore answers for a prefix the user has typed past
+                if (input.value.trim().toLowerCase() !== prefix) return;
+                list.innerHTML = '';
+                for (const user of users) {
+                    const option = document.createElement('option');
+                    option.value = user.username;
+                    if (user.relation === 'friend') option.label = 'Friend';
+                    else if (user.relation === 'server') option.label = 'In your servers';
+                    list.appendChild(option);
+                }
+            } catch (error) {
+                console.error('Error searching users:', error);
+            }
+        }, DEBOUNCE_MS);
+    });
+}
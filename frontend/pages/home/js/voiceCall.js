@@ -5,6 +5,7 @@
 let peerConnection = null;
 let localStream = null;
 let currentCallUserId = null;
+let currentCallSessionId = null;  // Device of the other user the call is connected to
 let isMuted = false;
 
 // WebRTC configuration (using public STUN servers)
@@ -42,6 +43,7 @@ export async function startVoiceCall(targetUserId, targetUsername) {
                 window.ws.send(JSON.stringify({
                     type: 'ice-candidate',
                     target_user_id: targetUserId,
+                    target_session_id: currentCallSessionId,
                     candidate: event.candidate
                 }));
             }
@@ -84,12 +86,13 @@ export async function startVoiceCall(targetUserId, targetUsername) {
 /**
  * Handle incoming call offer
  */
-export async function handleCallOffer(fromUserId, fromUsername, offer) {
+export async function handleCallOffer(fromUserId, fromUsername, offer, fromSessionId) {
     if (currentCallUserId) {
         // Already in a call, reject
         window.ws.send(JSON.stringify({
             type: 'call-end',
-            target_user_id: fromUserId
+            target_user_id: fromUserId,
+            target_session_id: fromSessionId
         }));
         return;
     }
@@ -100,7 +103,8 @@ export async function handleCallOffer(fromUserId, fromUsername, offer) {
     if (!accept) {
         window.ws.send(JSON.stringify({
             type: 'call-end',
-            target_user_id: fromUserId
+            target_user_id: fromUserId,
+            target_session_id: fromSessionId
         }));
         return;
     }
@@ -123,6 +127,7 @@ export async function handleCallOffer(fromUserId, fromUsername, offer) {
                 window.ws.send(JSON.stringify({
                     type: 'ice-candidate',
                     target_user_id: fromUserId,
+                    target_session_id: fromSessionId,
                     candidate: event.candidate
                 }));
             }
@@ -151,10 +156,12 @@ export async function handleCallOffer(fromUserId, fromUsername, offer) {
         window.ws.send(JSON.stringify({
             type: 'voice-call-answer',
             target_user_id: fromUserId,
+            target_session_id: fromSessionId,
             answer: answer
         }));
         
         currentCallUserId = fromUserId;
+        currentCallSessionId = fromSessionId;
         showCallUI(fromUsername, false);
         
     } catch (error) {
@@ -167,12 +174,15 @@ export async function handleCallOffer(fromUserId, fromUsername, offer) {
 /**
  * Handle call answer
  */
-export async function handleCallAnswer(fromUserId, answer) {
+export async function handleCallAnswer(fromUserId, answer, fromSessionId) {
     if (!peerConnection) {
         console.error('No peer connection for answer');
         return;
     }
     
+    // The device that picked up - send the rest of the call only there
+    currentCallSessionId = fromSessionId;
+    
     try {
         await peerConnection.setRemoteDescription(new RTCSessionDescription(answer));
     } catch (error) {
@@ -204,7 +214,8 @@ export function endVoiceCall() {
     if (currentCallUserId) {
         window.ws.send(JSON.stringify({
             type: 'call-end',
-            target_user_id: currentCallUserId
+            target_user_id: currentCallUserId,
+            target_session_id: currentCallSessionId
         }));
     }
     
@@ -221,6 +232,7 @@ export function endVoiceCall() {
     }
     
     currentCallUserId = null;
+    currentCallSessionId = null;
     isMuted = false;
     hideCallUI();
 }